@@ -1,30 +1,39 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 import os
+import json
 from werkzeug.utils import secure_filename
 from services.aws_service import AWSService
 from services.document_processor import DocumentProcessor
 from services.database_service import DatabaseService
 from services.ai_agent_service import AIAgentService
+from services.cache_service import CacheService
+from services.job_service import JobService
+from services.upload_buffer import UploadBuffer
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
+app.config['UPLOAD_MEMORY_THRESHOLD'] = int(float(os.getenv('UPLOAD_MEMORY_THRESHOLD_MB', 8)) * 1024 * 1024)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf', 'doc', 'docx'}
 
 # Inicializar serviços
 try:
     aws_service = AWSService()
-    document_processor = DocumentProcessor(aws_service)
+    cache_service = CacheService() if os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true' else None
+    document_processor = DocumentProcessor(aws_service, cache_service)
     database_service = DatabaseService()
     ai_agent = AIAgentService(aws_service.bedrock_client, database_service)
+    job_service = JobService(document_processor, database_service, spool_dir=app.config['UPLOAD_FOLDER'])
     print("✓ Aplicação inicializada com sucesso!")
 except Exception as e:
     print(f"✗ Erro ao inicializar aplicação: {str(e)}")
     aws_service = None
+    cache_service = None
     document_processor = None
     database_service = None
     ai_agent = None
+    job_service = None
 
 def allowed_file(filename):
     """Verifica se o arquivo tem extensão permitida"""
@@ -42,8 +51,8 @@ def history():
 
 @app.route('/process', methods=['POST'])
 def process_files():
-    """Processa múltiplos arquivos enviados"""
-    if not document_processor:
+    """Enfileira o processamento dos arquivos enviados e retorna o ID do job"""
+    if not document_processor or not job_service:
         return jsonify({
             "success": False,
             "error": "Serviços AWS não inicializados. Verifique as credenciais."
@@ -62,59 +71,74 @@ def process_files():
             "success": False,
             "error": "Nenhum arquivo selecionado"
         }), 400
-    
-    # Salvar arquivos temporariamente
-    file_paths = []
+    # Ler uploads uma única vez; arquivos grandes vão direto para disco (os demais também, com JOB_SPOOL_UPLOADS)
+    # Ler uploads uma única vez; arquivos grandes vão direto para disco, os demais ao enfileirar o job
+    uploads = []
     for file in files:
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            file_paths.append((filepath, filename))
+            uploads.append(UploadBuffer.from_stream(
+                file.stream, filename,
+                app.config['UPLOAD_FOLDER'],
+                app.config['UPLOAD_MEMORY_THRESHOLD']
+            ))
     
-    if not file_paths:
+    if not uploads:
         return jsonify({
             "success": False,
             "error": "Nenhum arquivo válido foi enviado"
         }), 400
     
-    # Processar arquivos
-    print(f"\n{'='*60}")
-    print(f"Processando {len(file_paths)} arquivo(s)...")
-    print(f"{'='*60}\n")
+    # Enfileirar processamento em background
+    job_id = job_service.new_job_id()
+    job_service.submit(job_id, uploads)
     
-    results = document_processor.process_multiple_files(file_paths)
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "total_arquivos": len(uploads),
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }), 202
+
+def format_sse(event):
+    """Serializa um evento no formato Server-Sent Events"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Retorna o estado de um job de processamento"""
+    if not job_service:
+        return jsonify({"success": False, "error": "Serviço de jobs não inicializado"}), 500
     
-    # Salvar resultados no banco de dados
-    if database_service:
-        for result in results:
-            if result.get('success'):
-                database_service.save_analysis(result)
-                print(f"✓ Análise salva no banco: {result['filename']}")
+    job = job_service.get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "error": "Job não encontrado"}), 404
     
-    # Remover arquivos temporários
-    for filepath, _ in file_paths:
-        try:
-            os.remove(filepath)
-        except Exception as e:
-            print(f"Erro ao remover arquivo {filepath}: {str(e)}")
+    return jsonify({"success": True, "job": job})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Stream Server-Sent Events com o progresso por arquivo de um job"""
+    if not job_service:
+        return jsonify({"success": False, "error": "Serviço de jobs não inicializado"}), 500
     
-    # Calcular estatísticas
-    statistics = document_processor.calculate_statistics(results)
+    if not job_service.get_job(job_id):
+        return jsonify({"success": False, "error": "Job não encontrado"}), 404
     
-    print(f"\n{'='*60}")
-    print(f"Processamento concluído!")
-    print(f"Total gasto: R$ {statistics['total_gasto']:.2f}")
-    print(f"Arquivos processados: {statistics['arquivos_processados']}/{statistics['total_arquivos']}")
-    print(f"{'='*60}\n")
+    def generate():
+        for event in job_service.iter_events(job_id):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_sse(event)
     
-    return jsonify({
-        "success": True,
-        "total_arquivos": statistics['total_arquivos'],
-        "total_gasto": statistics['total_gasto'],
-        "categorias": statistics['categorias'],
-        "detalhes": results
-    })
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -123,24 +147,51 @@ def health_check():
         "status": "ok",
         "aws_initialized": aws_service is not None,
         "processor_initialized": document_processor is not None,
-        "database_initialized": database_service is not None
+        "database_initialized": database_service is not None,
+        "jobs_initialized": job_service is not None,
+        "aws": aws_service.get_stats() if aws_service else None,
+        "database_writer": database_service.writer.get_stats() if database_service else None,
+        "cache": cache_service.get_stats() if cache_service else {"enabled": False},
+        "bedrock": document_processor.bedrock.get_stats() if document_processor else None,
+        "rekognition": document_processor.rekognition.get_stats() if document_processor else None,
+        "ai_agent": ai_agent.get_stats() if ai_agent else None,
+        "local_extractor": document_processor.local_extractor.get_stats()
+            if document_processor and document_processor.local_extractor else {"enabled": False}
     })
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Retorna histórico de análises"""
+    """Retorna uma página do histórico de análises (paginação por cursor)"""
     if not database_service:
         return jsonify({"success": False, "error": "Banco de dados não inicializado"}), 500
     
+    cursor = request.args.get('cursor')
+    fields = request.args.get('fields')
+    
     try:
-        analyses = database_service.get_all_analyses()
-        statistics = database_service.get_statistics()
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        page = database_service.get_analyses_page(
+            limit=limit,
+            cursor=cursor,
+            fields=fields.split(',') if fields else None,
+            categoria=request.args.get('categoria') or None,
+            date_from=request.args.get('date_from') or None,
+            date_to=request.args.get('date_to') or None
+        )
         
-        return jsonify({
+        response = {
             "success": True,
-            "analyses": analyses,
-            "statistics": statistics
-        })
+            "analyses": page['analyses'],
+            "next_cursor": page['next_cursor'],
+            "total": page['total']
+        }
+        # Estatísticas gerais só acompanham a primeira página
+        if not cursor:
+            response["statistics"] = database_service.get_statistics()
+        
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -157,11 +208,19 @@ def search_analyses():
         return jsonify({"success": False, "error": "Query vazia"}), 400
     
     try:
-        results = database_service.search_analyses(query)
+        limit = min(max(int(data.get('limit', 20)), 1), 100)
+        offset = max(int(data.get('offset', 0)), 0)
+        # Um resultado a mais indica se existe próxima página
+        results = database_service.search_analyses(query, limit=limit + 1, offset=offset)
+        has_more = len(results) > limit
+        results = results[:limit]
         return jsonify({
             "success": True,
             "results": results,
-            "count": len(results)
+            "count": len(results),
+            "limit": limit,
+            "offset": offset,
+            "has_more": has_more
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -189,6 +248,31 @@ def ai_query():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/ai-query/stream', methods=['POST'])
+def ai_query_stream():
+    """Processa consulta com agente de IA, enviando a resposta via Server-Sent Events"""
+    if not ai_agent:
+        return jsonify({"success": False, "error": "Agente de IA não inicializado"}), 500
+    
+    data = request.get_json()
+    query = data.get('query', '')
+    
+    if not query:
+        return jsonify({"success": False, "error": "Query vazia"}), 400
+    
+    def generate():
+        try:
+            for event in ai_agent.stream_query(query):
+                yield format_sse(event)
+        except Exception as e:
+            yield format_sse({'type': 'error', 'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 if __name__ == '__main__':
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem de formulários e tabelas a partir de respostas do Textract
+
+Gera uma resposta sintética de analyze_document (pares chave-valor e uma
+tabela, com os blocos embaralhados) e compara o TextractBlockGraph, indexado
+por Id, com a busca linear por filho usada antes.
+
+Uso:
+    python benchmark_textract_blocks.py [--blocks 10000] [--skip-linear]
+"""
+
+import argparse
+import random
+import sys
+import time
+from services.textract_blocks import TextractBlockGraph
+
+def synthetic_response(total_blocks, seed=42):
+    """Blocos de um formulário com pares chave-valor e uma tabela de 4 colunas"""
+    rng = random.Random(seed)
+    blocks = []
+    next_id = iter(range(1, total_blocks * 2))
+
+    def word(text):
+        block = {'Id': str(next(next_id)), 'BlockType': 'WORD', 'Text': text}
+        blocks.append(block)
+        return block['Id']
+
+    # Metade dos blocos em formulários (6 por par), metade em uma tabela (2 por célula)
+    pairs = total_blocks // 2 // 6
+    for number in range(pairs):
+        value_id = str(next(next_id))
+        blocks.append({
+            'Id': value_id, 'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['VALUE'],
+            'Relationships': [{'Type': 'CHILD', 'Ids': [word(f"{number},00"), word('BRL')]}]
+        })
+        blocks.append({
+            'Id': str(next(next_id)), 'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['KEY'],
+            'Relationships': [
+                {'Type': 'CHILD', 'Ids': [word('Campo'), word(str(number))]},
+                {'Type': 'VALUE', 'Ids': [value_id]}
+            ]
+        })
+
+    cell_ids = []
+    for index in range((total_blocks - len(blocks)) // 2):
+        cell_id = str(next(next_id))
+        blocks.append({
+            'Id': cell_id, 'BlockType': 'CELL', 'RowIndex': index // 4 + 1, 'ColumnIndex': index % 4 + 1,
+            'Relationships': [{'Type': 'CHILD', 'Ids': [word(f"c{index}")]}]
+        })
+        cell_ids.append(cell_id)
+    blocks.append({'Id': str(next(next_id)), 'BlockType': 'TABLE', 'Relationships': [{'Type': 'CHILD', 'Ids': cell_ids}]})
+
+    rng.shuffle(blocks)
+    return blocks
+
+def linear_key_values(blocks):
+    """Implementação anterior: cada filho é procurado percorrendo todos os blocos"""
+    def text(block):
+        words = []
+        for relationship in block.get('Relationships', []):
+            if relationship['Type'] == 'CHILD':
+                for child_id in relationship['Ids']:
+                    child = next((b for b in blocks if b['Id'] == child_id), None)
+                    if child and child['BlockType'] == 'WORD':
+                        words.append(child['Text'])
+        return ' '.join(words)
+
+    key_values = {}
+    for block in blocks:
+        if block['BlockType'] == 'KEY_VALUE_SET' and 'KEY' in block.get('EntityTypes', []):
+            for relationship in block.get('Relationships', []):
+                if relationship['Type'] == 'VALUE':
+                    value = next((b for b in blocks if b['Id'] == relationship['Ids'][0]), None)
+                    if value:
+                        key_values[text(block)] = text(value)
+    return key_values
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do TextractBlockGraph')
+    parser.add_argument('--blocks', type=int, default=10000, help='Número de blocos da resposta sintética')
+    parser.add_argument('--skip-linear', action='store_true', help='Não medir a busca linear (lenta em respostas grandes)')
+    args = parser.parse_args()
+
+    blocks = synthetic_response(args.blocks)
+    print(f"Resposta sintética: {len(blocks)} blocos")
+
+    start = time.perf_counter()
+    graph = TextractBlockGraph(blocks)
+    key_values = graph.key_values()
+    tables = graph.tables()
+    indexed = time.perf_counter() - start
+    print(f"  Grafo indexado: {indexed * 1000:.1f} ms ({len(key_values)} campos, {len(tables[0])} linhas de tabela)")
+
+    if not args.skip_linear:
+        start = time.perf_counter()
+        expected = linear_key_values(blocks)
+        linear = time.perf_counter() - start
+        print(f"  Busca linear (só campos): {linear * 1000:.1f} ms — {linear / indexed:.0f}x mais lento")
+        if expected != key_values:
+            print("  ⚠ Resultados diferentes entre as implementações")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
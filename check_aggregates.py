@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Verifica as tabelas de totais (category_totals e monthly_totals)
+Compara com os dados de analyses e, com --repair, reconstrói as tabelas
+
+Uso:
+    python check_aggregates.py [--db data/expenses.db] [--repair]
+"""
+
+import argparse
+import sys
+from services.database_service import DatabaseService
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica e repara as tabelas de totais do FinanceAI')
+    parser.add_argument('--db', default='data/expenses.db', help='Caminho do banco SQLite')
+    parser.add_argument('--repair', action='store_true', help='Reconstrói as tabelas se houver divergência')
+    args = parser.parse_args()
+
+    db = DatabaseService(args.db)
+    try:
+        result = db.check_aggregates(repair=args.repair)
+    finally:
+        db.close()
+
+    if result['consistent']:
+        print("✓ Tabelas de totais consistentes com analyses")
+        return 0
+
+    print(f"⚠ {len(result['differences'])} divergência(s) encontrada(s):")
+    for difference in result['differences']:
+        stored = difference['stored']
+        expected = difference['expected']
+        print(
+            f"  - {difference['table']} [{difference['key']}]: "
+            f"R$ {stored['total']:.2f} ({stored['count']}) ≠ R$ {expected['total']:.2f} ({expected['count']})"
+        )
+
+    if result['repaired']:
+        print("✓ Tabelas de totais reconstruídas")
+        return 0
+
+    print("💡 Execute novamente com --repair para reconstruir as tabelas")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,122 +1,323 @@
 import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
 from services.bedrock_service import BedrockService
+from services.prompt_budget import PromptBuilder, estimate_tokens, format_table, truncate_to_tokens
+from services.retrieval_index import RetrievalIndex
+
+# Colunas dos registros enviados ao modelo (tabela compacta separada por |)
+RECORD_COLUMNS = ['data', 'empresa', 'categoria', 'valor', 'descricao']
 
 class AIAgentService:
     """Agente de IA para buscar e analisar dados armazenados"""
     
+    MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+    RECENT_RECORDS = 20  # Registros recentes incluídos no prompt
+    
     def __init__(self, bedrock_client, database_service):
         self.bedrock = BedrockService(bedrock_client)
         self.database = database_service
+        self.retrieval = RetrievalIndex(database_service)
+        self.retrieval.warm_up()
+        self.retrieval_top_k = int(os.getenv('AI_RETRIEVAL_TOP_K', 30))
+        self.retrieval_token_budget = int(os.getenv('AI_RETRIEVAL_TOKEN_BUDGET', 1200))
+        self.context_token_budget = int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', 2500))
+        self.question_token_budget = int(os.getenv('AI_QUESTION_TOKEN_BUDGET', 300))
+        self.answer_ttl = float(os.getenv('AI_ANSWER_CACHE_TTL', 300))
+        self.answer_cache_size = int(os.getenv('AI_ANSWER_CACHE_SIZE', 256))
+        self._lock = threading.Lock()
+        # (versão dos dados, estatísticas, início do prompt) da última montagem de contexto
+        self._context_cache = None
+        # (pergunta normalizada, versão dos dados) -> (instante, resposta), em ordem de uso
+        self._answers = OrderedDict()
+        self._stats = {
+            'context_hits': 0,
+            'context_misses': 0,
+            'answer_hits': 0,
+            'answer_misses': 0,
+            'streams': 0,
+            'first_token_seconds': 0.0,
+            'prompts': 0,
+            'estimated_input_tokens': 0
+        }
     
     def query(self, user_query):
         """
         Processa uma consulta do usuário e retorna resultados relevantes
         
+        Respostas ficam em cache por pergunta normalizada e versão dos dados;
+        uma pergunta repetida sem novas gravações não acessa o banco nem o Bedrock.
+        
         Args:
             user_query: Pergunta ou busca do usuário
         
         Returns:
             dict: Resposta do agente com dados encontrados
         """
-        # Buscar dados relevantes no banco
-        all_analyses = self.database.get_all_analyses()
-        statistics = self.database.get_statistics()
-        
-        # Preparar contexto para o agente
-        context = self._prepare_context(all_analyses, statistics)
+        version = self.database.data_version
+        cache_key = (self._normalize_question(user_query), version)
+        cached = self._get_cached_answer(cache_key)
+        if cached:
+            return cached
         
         # Criar prompt para o Claude
-        prompt = self._create_agent_prompt(user_query, context)
+        statistics, prompt, search_results = self._build_prompt(user_query, version)
         
         # Obter resposta do Claude
-        response = self._get_claude_response(prompt)
-        
-        # Buscar dados específicos se necessário
-        search_results = self.database.search_analyses(user_query)
+        try:
+            response = self._get_claude_response(prompt)
+            cacheable = True
+        except Exception as e:
+            response = f"Desculpe, não consegui processar sua pergunta. Erro: {str(e)}"
+            cacheable = False
         
-        return {
+        result = {
             'answer': response,
             'search_results': search_results[:10],  # Limitar a 10 resultados
             'statistics': statistics,
             'query': user_query
         }
+        if cacheable:
+            self._store_answer(cache_key, result)
+        return result
+    
+    def stream_query(self, user_query):
+        """
+        Versão em streaming de query, para respostas exibidas enquanto são geradas
+        
+        Estatísticas e resultados da busca vão no primeiro evento, antes de a
+        geração começar; depois vêm os trechos do texto conforme o Bedrock os produz.
+        
+        Args:
+            user_query: Pergunta ou busca do usuário
+        
+        Yields:
+            dict: Eventos 'context', 'token' (campo text), 'done' (resposta completa) ou 'error'
+        """
+        version = self.database.data_version
+        cache_key = (self._normalize_question(user_query), version)
+        cached = self._get_cached_answer(cache_key)
+        if cached:
+            yield {
+                'type': 'context',
+                'statistics': cached['statistics'],
+                'search_results': cached['search_results'],
+                'cached': True
+            }
+            yield {'type': 'token', 'text': cached['answer']}
+            yield {'type': 'done', 'answer': cached['answer']}
+            return
+        
+        statistics, prompt, search_results = self._build_prompt(user_query, version)
+        yield {'type': 'context', 'statistics': statistics, 'search_results': search_results, 'cached': False}
+        
+        start = time.perf_counter()
+        parts = []
+        try:
+            for text in self._stream_claude_response(prompt):
+                if not parts:
+                    self._record_first_token(time.perf_counter() - start)
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+        except Exception as e:
+            yield {'type': 'error', 'error': f"Desculpe, não consegui processar sua pergunta. Erro: {str(e)}"}
+            return
+        
+        answer = ''.join(parts)
+        self._store_answer(cache_key, {
+            'answer': answer,
+            'search_results': search_results,
+            'statistics': statistics,
+            'query': user_query
+        })
+        yield {'type': 'done', 'answer': answer}
+    
+    def _record_first_token(self, seconds):
+        with self._lock:
+            self._stats['streams'] += 1
+            self._stats['first_token_seconds'] += seconds
+    
+    def get_stats(self):
+        """Acertos e faltas dos caches e tempo médio até o primeiro token nos streams"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_answers'] = len(self._answers)
+        first_token_seconds = stats.pop('first_token_seconds')
+        stats['average_first_token_seconds'] = (
+            round(first_token_seconds / stats['streams'], 3) if stats['streams'] else None
+        )
+        stats['average_input_tokens'] = (
+            round(stats['estimated_input_tokens'] / stats['prompts']) if stats['prompts'] else None
+        )
+        stats['data_version'] = self.database.data_version
+        stats['retrieval'] = self.retrieval.get_stats()
+        return stats
+    
+    @staticmethod
+    def _normalize_question(question):
+        """Minúsculas, sem acentos, espaços e pontuação final, para comparar perguntas"""
+        text = unicodedata.normalize('NFD', question.lower())
+        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+        return re.sub(r'\s+', ' ', text).strip(' ?!.')
+    
+    def _get_cached_answer(self, key):
+        with self._lock:
+            entry = self._answers.get(key)
+            if entry and time.monotonic() - entry[0] <= self.answer_ttl:
+                self._answers.move_to_end(key)
+                self._stats['answer_hits'] += 1
+                return entry[1]
+            if entry:
+                del self._answers[key]
+            self._stats['answer_misses'] += 1
+            return None
+    
+    def _store_answer(self, key, result):
+        with self._lock:
+            self._answers[key] = (time.monotonic(), result)
+            self._answers.move_to_end(key)
+            while len(self._answers) > self.answer_cache_size:
+                self._answers.popitem(last=False)
+    
+    def _build_prompt(self, user_query, version):
+        """
+        Monta o prompt completo para a pergunta
+        
+        Returns:
+            tuple: (estatísticas, prompt, registros relevantes para exibir ao usuário)
+        """
+        # Contexto e início do prompt só são remontados quando os dados mudam
+        statistics, prompt_prefix = self._get_prompt_prefix(version)
+        relevant = self._select_relevant_records(user_query)
+        search_results = self.database.get_analyses_by_ids([record['id'] for record in relevant[:10]])
+        
+        prompt = prompt_prefix + self._render_relevant_records(relevant) + self._render_question(user_query)
+        with self._lock:
+            self._stats['prompts'] += 1
+            self._stats['estimated_input_tokens'] += estimate_tokens(prompt)
+        return statistics, prompt, search_results
+    
+    def _select_relevant_records(self, user_query):
+        """
+        Registros mais relevantes para a pergunta (BM25), dentro do orçamento de tokens
+        
+        Returns:
+            list: Resumos dos registros, do mais para o menos relevante
+        """
+        selected = []
+        used_tokens = 0
+        for record, _ in self.retrieval.search(user_query, limit=self.retrieval_top_k):
+            tokens = estimate_tokens(format_table(RECORD_COLUMNS, [record]).split('\n', 1)[1])
+            if used_tokens + tokens > self.retrieval_token_budget:
+                break
+            selected.append(record)
+            used_tokens += tokens
+        return selected
+    
+    def _render_relevant_records(self, records):
+        """Seção do prompt com os registros selecionados para a pergunta"""
+        if not records:
+            return ''
+        return f"\nREGISTROS RELEVANTES PARA A PERGUNTA:\n{format_table(RECORD_COLUMNS, records)}\n"
     
-    def _prepare_context(self, analyses, statistics):
+    def _get_prompt_prefix(self, version):
+        """
+        Retorna (estatísticas, início do prompt) para a versão de dados informada
+        
+        Returns:
+            tuple: Estatísticas do banco e prompt renderizado até a pergunta
+        """
+        with self._lock:
+            cached = self._context_cache
+            if cached and cached[0] == version:
+                self._stats['context_hits'] += 1
+                return cached[1], cached[2]
+            self._stats['context_misses'] += 1
+        
+        statistics = self.database.get_statistics()
+        
+        # Preparar contexto para o agente
+        context = self._prepare_context(statistics)
+        prefix = self._render_prompt_prefix(context)
+        
+        with self._lock:
+            self._context_cache = (version, statistics, prefix)
+        return statistics, prefix
+    
+    def _prepare_context(self, statistics):
         """Prepara contexto resumido dos dados"""
-        from datetime import datetime
-        from collections import defaultdict
-        
-        # Agrupar gastos por ano
-        gastos_por_ano = defaultdict(lambda: {'total': 0, 'count': 0, 'categorias': defaultdict(float)})
-        
-        for analysis in analyses:
-            try:
-                # Extrair ano da data do documento
-                data_parts = analysis['data_documento'].split('/')
-                if len(data_parts) == 3:
-                    ano = data_parts[2]
-                    valor = analysis['valor']
-                    categoria = analysis['categoria']
-                    
-                    gastos_por_ano[ano]['total'] += valor
-                    gastos_por_ano[ano]['count'] += 1
-                    gastos_por_ano[ano]['categorias'][categoria] += valor
-            except:
-                pass
-        
-        context = {
+        # Totais por ano e categoria vêm agregados do banco
+        gastos_por_ano = self.database.get_period_totals('year')
+        
+        # Apenas os registros mais recentes, sem o texto extraído
+        recentes = self.database.get_analyses_page(
+            limit=self.RECENT_RECORDS,
+            fields=['empresa', 'valor', 'categoria', 'data_documento', 'descricao']
+        )['analyses']
+        
+        return {
             'total_gasto': statistics['total_gasto'],
             'total_arquivos': statistics['total_arquivos'],
             'categorias': statistics['categorias'],
-            'gastos_por_ano': dict(gastos_por_ano),
-            'ultimos_registros': []
+            'gastos_por_ano': gastos_por_ano,
+            'ultimos_registros': [
+                {
+                    'empresa': analysis['empresa'],
+                    'valor': analysis['valor'],
+                    'categoria': analysis['categoria'],
+                    'data': analysis['data_documento'],
+                    'descricao': analysis['descricao']
+                }
+                for analysis in recentes
+            ]
         }
-        
-        # Adicionar últimos 50 registros (aumentado de 20)
-        for analysis in analyses[:50]:
-            context['ultimos_registros'].append({
-                'empresa': analysis['empresa'],
-                'valor': analysis['valor'],
-                'categoria': analysis['categoria'],
-                'data': analysis['data_documento']
-            })
-        
-        return context
     
-    def _create_agent_prompt(self, user_query, context):
-        """Cria prompt para o agente de IA"""
-        prompt = f"""Você é um assistente financeiro inteligente que ajuda usuários a analisar seus gastos.
+    def _render_prompt_prefix(self, context):
+        """
+        Parte do prompt que depende apenas dos dados (reaproveitada entre perguntas)
+        
+        Limitada a context_token_budget: se não couber, saem primeiro os registros
+        recentes e depois os anos mais antigos.
+        """
+        builder = PromptBuilder(self.context_token_budget)
+        builder.add(f"""Você é um assistente financeiro inteligente que ajuda usuários a analisar seus gastos.
 
 DADOS DISPONÍVEIS:
 - Total gasto (todos os períodos): R$ {context['total_gasto']:.2f}
 - Total de arquivos: {context['total_arquivos']}
 - Categorias: {', '.join(context['categorias'].keys())}
 
-GASTOS POR ANO:
-"""
-        # Adicionar informações por ano
+""", required=True)
+        
+        # Uma linha por ano, do mais recente ao mais antigo
+        anos = []
         for ano, dados in sorted(context['gastos_por_ano'].items(), reverse=True):
-            prompt += f"\n📅 Ano {ano}:\n"
-            prompt += f"   Total: R$ {dados['total']:.2f}\n"
-            prompt += f"   Documentos: {dados['count']}\n"
-            if dados['categorias']:
-                prompt += f"   Categorias:\n"
-                for cat, valor in sorted(dados['categorias'].items(), key=lambda x: x[1], reverse=True):
-                    prompt += f"      - {cat}: R$ {valor:.2f}\n"
-        
-        prompt += f"""
-GASTOS POR CATEGORIA (GERAL):
-"""
-        for cat, data in context['categorias'].items():
-            prompt += f"- {cat}: R$ {data['valor']:.2f} ({data['percentual']:.1f}%) - {data['count']} registros\n"
-        
-        prompt += f"""
-ÚLTIMOS REGISTROS (com datas):
-"""
-        for i, reg in enumerate(context['ultimos_registros'][:20], 1):
-            prompt += f"{i}. {reg['data']} - {reg['empresa']} - {reg['categoria']} - R$ {reg['valor']:.2f}\n"
-        
-        prompt += f"""
+            categorias = '; '.join(
+                f"{cat} R$ {valor:.2f}"
+                for cat, valor in sorted(dados['categorias'].items(), key=lambda x: x[1], reverse=True)
+            )
+            anos.append(f"{ano}: R$ {dados['total']:.2f} ({dados['count']} documentos) | {categorias}")
+        builder.add_lines("GASTOS POR ANO (ano: total | por categoria):\n", anos, priority=2)
+        
+        builder.add_lines("GASTOS POR CATEGORIA (GERAL):\n", [
+            f"- {cat}: R$ {data['valor']:.2f} ({data['percentual']:.1f}%) - {data['count']} registros"
+            for cat, data in context['categorias'].items()
+        ], priority=3)
+        
+        registros = format_table(RECORD_COLUMNS, context['ultimos_registros']).split('\n')
+        builder.add_lines(f"ÚLTIMOS REGISTROS:\n{registros[0]}\n", registros[1:], priority=1, footer='')
+        
+        prompt, _ = builder.build()
+        return prompt
+    
+    def _render_question(self, user_query):
+        """Parte do prompt com a pergunta e as instruções"""
+        user_query = truncate_to_tokens(user_query, self.question_token_budget, tail_ratio=0)
+        return f"""
 
 PERGUNTA DO USUÁRIO: {user_query}
 
@@ -132,31 +333,55 @@ INSTRUÇÕES:
 9. IMPORTANTE: Os dados incluem informações de diferentes anos - verifique o ano mencionado na pergunta
 
 RESPOSTA:"""
-        
-        return prompt
     
     def _get_claude_response(self, prompt):
-        """Obtém resposta do Claude via Bedrock"""
-        try:
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "temperature": 0.7,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
-            
-            response = self.bedrock.client.invoke_model(
-                modelId="anthropic.claude-3-haiku-20240307-v1:0",
-                body=body
-            )
-            
-            response_body = json.loads(response['body'].read())
-            return response_body['content'][0]['text']
+        """
+        Obtém resposta do Claude via Bedrock
+        
+        Raises:
+            Exception: Erros do Bedrock são repassados para que a resposta não vá para o cache
+        """
+        response = self.bedrock.client.invoke_model(
+            modelId=self.MODEL_ID,
+            body=self._request_body(prompt)
+        )
+        
+        response_body = json.loads(response['body'].read())
+        return response_body['content'][0]['text']
+    
+    def _stream_claude_response(self, prompt):
+        """
+        Obtém a resposta do Claude em trechos via invoke_model_with_response_stream
+        
+        Yields:
+            str: Trechos de texto na ordem em que são gerados
+        """
+        response = self.bedrock.client.invoke_model_with_response_stream(
+            modelId=self.MODEL_ID,
+            body=self._request_body(prompt)
+        )
+        
+        for event in response['body']:
+            if 'chunk' not in event:
+                # Exceções do stream chegam como eventos (ex.: throttlingException)
+                name, detail = next(iter(event.items()))
+                raise RuntimeError(f"{name}: {detail.get('message', detail)}")
             
-        except Exception as e:
-            return f"Desculpe, não consegui processar sua pergunta. Erro: {str(e)}"
+            chunk = json.loads(event['chunk']['bytes'])
+            if chunk.get('type') == 'content_block_delta':
+                text = chunk['delta'].get('text', '')
+                if text:
+                    yield text
+    
+    def _request_body(self, prompt):
+        return json.dumps({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1000,
+            "temperature": 0.7,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        })
@@ -1,24 +1,149 @@
 import boto3
 import os
+import threading
+from botocore.config import Config
 from dotenv import load_dotenv
+from services.rate_limiter import THROTTLING_ERRORS, RateLimiter
 
 load_dotenv()
 
+# Serviço -> (variável de concorrência do processamento, timeout de leitura padrão em segundos)
+SERVICES = {
+    'textract': ('TEXTRACT_MAX_CONCURRENCY', 60),
+    'rekognition': ('REKOGNITION_MAX_CONCURRENCY', 30),
+    'bedrock-runtime': ('BEDROCK_MAX_CONCURRENCY', 120)
+}
+
+def build_client_config(service_name):
+    """
+    Monta a configuração do botocore para um serviço
+
+    O pool de conexões acompanha o limite de chamadas simultâneas do serviço
+    (mais uma folga para o assistente IA e o /health), para que as threads não
+    esperem por conexão nem descartem conexões excedentes. Cada serviço pode
+    sobrescrever os valores com <SERVIÇO>_POOL_CONNECTIONS, <SERVIÇO>_READ_TIMEOUT
+    e <SERVIÇO>_MAX_ATTEMPTS (ex.: BEDROCK_RUNTIME_READ_TIMEOUT).
+    """
+    concurrency_env, default_read_timeout = SERVICES[service_name]
+    prefix = service_name.upper().replace('-', '_')
+
+    pool_connections = int(os.getenv(
+        f'{prefix}_POOL_CONNECTIONS',
+        int(os.getenv(concurrency_env, 4)) + int(os.getenv('AWS_POOL_HEADROOM', 4))
+    ))
+    return Config(
+        max_pool_connections=pool_connections,
+        connect_timeout=float(os.getenv('AWS_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.getenv(f'{prefix}_READ_TIMEOUT', default_read_timeout)),
+        retries={
+            # standard: backoff exponencial com jitter; a taxa de chamadas é controlada pelo RateLimiter
+            'mode': os.getenv('AWS_RETRY_MODE', 'standard'),
+            'max_attempts': int(os.getenv(f'{prefix}_MAX_ATTEMPTS', os.getenv('AWS_MAX_ATTEMPTS', 5)))
+        },
+        tcp_keepalive=os.getenv('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+    )
+
+class ClientMetrics:
+    """
+    Contadores de um cliente boto3, alimentados pelos eventos do botocore
+
+    in_flight conta chamadas em andamento; saturated_calls conta chamadas que
+    começaram com todas as conexões do pool ocupadas. Respostas em streaming
+    deixam de contar ao receber os cabeçalhos.
+    """
+
+    def __init__(self, client):
+        self.pool_connections = client.meta.config.max_pool_connections
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'throttled': 0,
+            'connection_errors': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+            'saturated_calls': 0
+        }
+
+        events = client.meta.events
+        events.register('before-call', self._before_call)
+        events.register('after-call', self._after_call)
+        events.register('after-call-error', self._after_call_error)
+        events.register('needs-retry', self._needs_retry)
+
+    def _before_call(self, **kwargs):
+        with self._lock:
+            self._stats['calls'] += 1
+            if self._stats['in_flight'] >= self.pool_connections:
+                self._stats['saturated_calls'] += 1
+            self._stats['in_flight'] += 1
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._stats['in_flight'])
+
+    def _after_call(self, parsed=None, **kwargs):
+        parsed = parsed or {}
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            self._stats['retries'] += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if 'Error' in parsed:
+                self._stats['errors'] += 1
+
+    def _after_call_error(self, exception=None, **kwargs):
+        # Falhas sem resposta HTTP (conexão, timeout) depois de esgotadas as tentativas
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            self._stats['errors'] += 1
+            self._stats['retries'] += getattr(exception, 'response', {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+
+    def _needs_retry(self, response=None, caught_exception=None, **kwargs):
+        # Chamado a cada tentativa; não decide nada, só observa o motivo da falha
+        code = None
+        if response is not None:
+            code = response[1].get('Error', {}).get('Code')
+        with self._lock:
+            if code in THROTTLING_ERRORS:
+                self._stats['throttled'] += 1
+            elif caught_exception is not None:
+                self._stats['connection_errors'] += 1
+        return None
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pool_connections'] = self.pool_connections
+        return stats
+
 class AWSService:
     def __init__(self):
         self.region = os.getenv('AWS_REGION', 'us-east-1')
         self.textract_client = None
         self.rekognition_client = None
         self.bedrock_client = None
+        self.metrics = {}
+        self.rate_limiters = {}
         self._initialize_clients()
     
+    def _create_client(self, service_name):
+        config = build_client_config(service_name)
+        client = boto3.client(service_name, region_name=self.region, config=config)
+        self.metrics[service_name] = ClientMetrics(client)
+        self.rate_limiters[service_name] = RateLimiter(service_name).attach(client)
+        return client
+    
     def _initialize_clients(self):
         """Inicializa os clientes AWS"""
         try:
-            self.textract_client = boto3.client('textract', region_name=self.region)
-            self.rekognition_client = boto3.client('rekognition', region_name=self.region)
-            self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region)
+            self.textract_client = self._create_client('textract')
+            self.rekognition_client = self._create_client('rekognition')
+            self.bedrock_client = self._create_client('bedrock-runtime')
             print(f"✓ Clientes AWS inicializados com sucesso na região {self.region}")
         except Exception as e:
             print(f"✗ Erro ao inicializar clientes AWS: {str(e)}")
             raise
+    
+    def get_stats(self):
+        """Retorna pool, tentativas, throttling e limites de taxa de cada cliente"""
+        return {
+            service: {**metrics.get_stats(), 'rate_limits': self.rate_limiters[service].get_stats()}
+            for service, metrics in self.metrics.items()
+        }
@@ -1,19 +1,14 @@
 import json
+import os
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from services.circuit_breaker import CircuitBreaker
+from services.prompt_budget import PromptBuilder, estimate_tokens, format_table, truncate_to_tokens
 
-class BedrockService:
-    def __init__(self, bedrock_client):
-        self.client = bedrock_client
-        self.model_id = 'anthropic.claude-3-haiku-20240307-v1:0'
-    
-    def analyze_expense(self, extracted_text):
-        """Analisa texto extraído e classifica gastos usando AWS Bedrock"""
-        try:
-            prompt = f"""Analise o seguinte texto extraído de uma nota fiscal ou comprovante:
-
-{extracted_text}
-
-Por favor, forneça:
-1. Valor total gasto (em R$, apenas números com ponto decimal, exemplo: 150.50)
+ANALYSIS_FIELDS = """1. Valor total gasto (em R$, apenas números com ponto decimal, exemplo: 150.50)
 2. Categoria do gasto (escolha UMA das opções: alimentacao, transporte, lazer, saude, educacao, moradia, transferencia, investimento, outros)
 3. Data da transação (formato dd/mm/aaaa, se não encontrar use "N/A")
 4. CNPJ ou identificação da empresa (se disponível, senão use "N/A")
@@ -22,7 +17,14 @@ Por favor, forneça:
 
 IMPORTANTE sobre categorias:
 - Use "transferencia" para: PIX, TED, DOC, transferências bancárias de qualquer tipo
-- Use "investimento" para: aplicações financeiras, investimentos, aportes em fundos, ações, renda fixa, etc.
+- Use "investimento" para: aplicações financeiras, investimentos, aportes em fundos, ações, renda fixa, etc."""
+
+ANALYSIS_PROMPT_TEMPLATE = """Analise o seguinte texto extraído de uma nota fiscal ou comprovante:
+
+{extracted_text}
+
+Por favor, forneça:
+""" + ANALYSIS_FIELDS + """
 
 IMPORTANTE: Responda APENAS com um JSON válido, sem texto adicional antes ou depois:
 {{
@@ -34,24 +36,231 @@ IMPORTANTE: Responda APENAS com um JSON válido, sem texto adicional antes ou de
     "descricao": "descrição breve"
 }}"""
 
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
-            
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                body=body
-            )
-            
-            response_body = json.loads(response['body'].read())
-            content = response_body['content'][0]['text']
+BATCH_ANALYSIS_PROMPT_TEMPLATE = """Analise os {count} textos abaixo. Cada um foi extraído de uma nota fiscal ou comprovante diferente.
+
+{documents}
+
+Para CADA documento, forneça:
+""" + ANALYSIS_FIELDS + """
+
+IMPORTANTE: Responda APENAS com um array JSON válido, com exatamente um objeto por documento e sem texto adicional antes ou depois. Use "indice" com o número do documento:
+[
+    {{
+        "indice": 1,
+        "valor": "0.00",
+        "categoria": "categoria",
+        "data": "dd/mm/aaaa",
+        "cnpj": "cnpj ou N/A",
+        "instituicao": "nome da empresa/comércio",
+        "descricao": "descrição breve"
+    }}
+]"""
+
+class BedrockService:
+    def __init__(self, bedrock_client):
+        self.client = bedrock_client
+        self.model_id = 'anthropic.claude-3-haiku-20240307-v1:0'
+        # Textos longos (PDFs de várias páginas) são cortados antes da análise
+        self.max_document_tokens = int(os.getenv('BEDROCK_MAX_DOCUMENT_TOKENS', 3000))
+        self.summary_token_budget = int(os.getenv('BEDROCK_SUMMARY_TOKEN_BUDGET', 3000))
+        # Versão da análise para o cache: muda sempre que o prompt, o modelo ou o corte mudam
+        self.cache_version = hashlib.sha256(
+            (self.model_id + ANALYSIS_PROMPT_TEMPLATE + str(self.max_document_tokens)).encode('utf-8')
+        ).hexdigest()[:16]
+        
+        # Análise em lote: vários documentos por chamada, limitados por orçamento de tokens
+        self.batch_token_budget = int(os.getenv('BEDROCK_BATCH_TOKEN_BUDGET', 8000))
+        self.batch_max_documents = int(os.getenv('BEDROCK_BATCH_MAX_DOCS', 8))
+        
+        # Requisição duplicada quando a original passa do percentil de latência (desativado por padrão)
+        self.hedge_enabled = os.getenv('BEDROCK_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_percentile = float(os.getenv('BEDROCK_HEDGE_PERCENTILE', 95))
+        self.hedge_min_samples = int(os.getenv('BEDROCK_HEDGE_MIN_SAMPLES', 20))
+        self.hedge_min_delay = float(os.getenv('BEDROCK_HEDGE_MIN_DELAY', 1.0))
+        # Latências por tipo de chamada: um lote de 8 documentos não serve de referência para um documento só
+        self._latencies = {}
+        # As requisições perdedoras não são canceladas e seguram um worker até terminar; sem worker
+        # livre a chamada segue sem hedging, para não ficar na fila atrás delas
+        self.hedge_workers = int(os.getenv('BEDROCK_MAX_CONCURRENCY', 4)) * 2
+        self._hedge_in_flight = 0
+        self.hedge_executor = ThreadPoolExecutor(
+            max_workers=self.hedge_workers,
+            thread_name_prefix='bedrock-hedge'
+        ) if self.hedge_enabled else None
+        
+        # Com o Bedrock falhando seguidamente, as chamadas falham na hora em vez de esperar o timeout
+        self.breaker = CircuitBreaker(
+            'bedrock',
+            failure_threshold=int(os.getenv('BEDROCK_BREAKER_FAILURES', 5)),
+            reset_seconds=float(os.getenv('BEDROCK_BREAKER_RESET_SECONDS', 30))
+        )
+        
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'invocations': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'hedge_skipped': 0,
+            'batch_invocations': 0,
+            'batched_documents': 0,
+            'batch_fallbacks': 0,
+            'estimated_input_tokens': 0,
+            'max_input_tokens': 0,
+            'truncated_documents': 0,
+            'latency_seconds': 0.0
+        }
+    
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+    
+    def get_stats(self):
+        """Retorna os contadores de chamadas ao Bedrock"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['latency_seconds'] = round(stats['latency_seconds'], 2)
+        stats['average_latency_seconds'] = self.average_latency()
+        with self._stats_lock:
+            call_types = list(self._latencies)
+        stats['hedge_threshold_seconds'] = {call_type: self._hedge_threshold(call_type) for call_type in call_types}
+        stats['circuit_breaker'] = self.breaker.get_stats()
+        stats['average_input_tokens'] = (
+            stats['estimated_input_tokens'] // stats['invocations'] if stats['invocations'] else 0
+        )
+        return stats
+    
+    def average_latency(self):
+        """Latência média de invoke_model em segundos"""
+        with self._stats_lock:
+            if not self._stats['invocations']:
+                return 0.0
+            return round(self._stats['latency_seconds'] / self._stats['invocations'], 3)
+    
+    def prepare_text(self, extracted_text):
+        """Corta o texto extraído para caber em max_document_tokens, mantendo início e fim"""
+        truncated = truncate_to_tokens(extracted_text, self.max_document_tokens)
+        if truncated is not extracted_text:
+            self._count(truncated_documents=1)
+        return truncated
+    
+    def _invoke(self, prompt, max_tokens, call_type, temperature=None):
+        """
+        Envia um prompt ao modelo e retorna o texto da resposta
+        
+        Args:
+            call_type: Tipo da chamada ('single', 'batch-N', 'summary'); o hedging
+                compara a latência apenas com chamadas do mesmo tipo
+        """
+        payload = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        if temperature is not None:
+            payload["temperature"] = temperature
+        
+        body = json.dumps(payload)
+        input_tokens = estimate_tokens(prompt)
+        
+        self.breaker.before_call()
+        try:
+            threshold = self._hedge_threshold(call_type)
+            if threshold is None:
+                text = self._send(body, input_tokens, call_type)
+            else:
+                text = self._send_hedged(body, input_tokens, call_type, threshold)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return text
+    
+    def _send(self, body, input_tokens, call_type):
+        """Uma chamada invoke_model"""
+        start = time.perf_counter()
+        response = self.client.invoke_model(
+            modelId=self.model_id,
+            body=body
+        )
+        elapsed = time.perf_counter() - start
+        self._count(invocations=1, estimated_input_tokens=input_tokens, latency_seconds=elapsed)
+        with self._stats_lock:
+            self._stats['max_input_tokens'] = max(self._stats['max_input_tokens'], input_tokens)
+            self._latencies.setdefault(call_type, deque(maxlen=200)).append(elapsed)
+        
+        response_body = json.loads(response['body'].read())
+        return response_body['content'][0]['text']
+    
+    def _hedge_threshold(self, call_type):
+        """Segundos de espera antes de duplicar a requisição, ou None sem hedging"""
+        if not self.hedge_enabled:
+            return None
+        with self._stats_lock:
+            samples = self._latencies.get(call_type, ())
+            if len(samples) < self.hedge_min_samples:
+                return None
+            latencies = sorted(samples)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return round(max(self.hedge_min_delay, latencies[index]), 3)
+    
+    def _send_hedged(self, body, input_tokens, call_type, threshold):
+        """
+        Envia a requisição e, se não houver resposta em `threshold` segundos,
+        envia uma cópia; usa a primeira resposta bem-sucedida
+        
+        A requisição perdedora não é cancelada (o boto3 não permite) e é cobrada.
+        Sem worker livre no pool, a chamada segue sem cópia (hedge_skipped).
+        """
+        primary = self._submit_send(body, input_tokens, call_type)
+        if primary is None:
+            self._count(hedge_skipped=1)
+            return self._send(body, input_tokens, call_type)
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result()
+        
+        hedge = self._submit_send(body, input_tokens, call_type)
+        if hedge is None:
+            self._count(hedge_skipped=1)
+            return primary.result()
+        self._count(hedged=1)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(hedge_wins=1)
+                    return future.result()
+                error = future.exception()
+        raise error
+    
+    def _submit_send(self, body, input_tokens, call_type):
+        """Envia pelo pool de hedging se houver worker livre; senão retorna None"""
+        with self._stats_lock:
+            if self._hedge_in_flight >= self.hedge_workers:
+                return None
+            self._hedge_in_flight += 1
+        future = self.hedge_executor.submit(self._send, body, input_tokens, call_type)
+        future.add_done_callback(self._release_hedge_worker)
+        return future
+    
+    def _release_hedge_worker(self, future):
+        with self._stats_lock:
+            self._hedge_in_flight -= 1
+    
+    def analyze_expense(self, extracted_text):
+        """Analisa texto extraído e classifica gastos usando AWS Bedrock"""
+        try:
+            prompt = ANALYSIS_PROMPT_TEMPLATE.format(extracted_text=self.prepare_text(extracted_text))
+            content = self._invoke(prompt, max_tokens=1000, call_type='single')
             
             # Extrair JSON da resposta
             start = content.find('{')
@@ -69,6 +278,95 @@ IMPORTANTE: Responda APENAS com um JSON válido, sem texto adicional antes ou de
             print(f"Erro no Bedrock: {str(e)}")
             return self._default_analysis()
     
+    def pack_batches(self, extracted_texts):
+        """
+        Agrupa textos em lotes que cabem no orçamento de tokens
+        
+        Args:
+            extracted_texts: Lista de textos extraídos
+        
+        Returns:
+            list: Lotes, cada um como lista de índices em extracted_texts
+        """
+        instructions_tokens = estimate_tokens(BATCH_ANALYSIS_PROMPT_TEMPLATE)
+        batches = []
+        current = []
+        current_tokens = instructions_tokens
+        
+        for index, text in enumerate(extracted_texts):
+            # Mesmo corte aplicado em analyze_batch
+            tokens = estimate_tokens(truncate_to_tokens(text, self.max_document_tokens)) + 10  # Cabeçalho do documento
+            if current and (current_tokens + tokens > self.batch_token_budget or len(current) >= self.batch_max_documents):
+                batches.append(current)
+                current = []
+                current_tokens = instructions_tokens
+            current.append(index)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    def analyze_batch(self, extracted_texts):
+        """
+        Analisa vários textos em uma única chamada ao Bedrock
+        
+        Documentos ausentes ou malformados na resposta são reanalisados
+        individualmente com analyze_expense.
+        
+        Args:
+            extracted_texts: Lista de textos extraídos (um lote de pack_batches)
+        
+        Returns:
+            list: Análises na mesma ordem dos textos
+        """
+        if len(extracted_texts) == 1:
+            return [self.analyze_expense(extracted_texts[0])]
+        
+        parsed = {}
+        try:
+            documents = "\n\n".join(
+                f"=== DOCUMENTO {number} ===\n{self.prepare_text(text)}"
+                for number, text in enumerate(extracted_texts, 1)
+            )
+            prompt = BATCH_ANALYSIS_PROMPT_TEMPLATE.format(count=len(extracted_texts), documents=documents)
+            content = self._invoke(
+                prompt,
+                max_tokens=min(4096, 250 * len(extracted_texts)),
+                call_type=f"batch-{len(extracted_texts)}"
+            )
+            self._count(batch_invocations=1, batched_documents=len(extracted_texts))
+            parsed = self._parse_batch_response(content, len(extracted_texts))
+        except Exception as e:
+            print(f"Erro no Bedrock (lote de {len(extracted_texts)} documentos): {str(e)}")
+        
+        analyses = []
+        for number, text in enumerate(extracted_texts, 1):
+            if number in parsed:
+                analyses.append(parsed[number])
+            else:
+                self._count(batch_fallbacks=1)
+                analyses.append(self.analyze_expense(text))
+        return analyses
+    
+    def _parse_batch_response(self, content, count):
+        """Extrai o array JSON da resposta em lote, mantendo apenas elementos válidos"""
+        start = content.find('[')
+        end = content.rfind(']') + 1
+        if start == -1 or end <= start:
+            return {}
+        
+        parsed = {}
+        for item in json.loads(content[start:end]):
+            try:
+                number = int(item['indice'])
+                float(str(item['valor']).replace(',', '.'))
+                if 1 <= number <= count and item.get('categoria') and number not in parsed:
+                    parsed[number] = self._validate_analysis(item)
+            except (KeyError, TypeError, ValueError):
+                continue
+        return parsed
+    
     def _validate_analysis(self, analysis):
         """Valida e normaliza os dados da análise"""
         try:
@@ -106,39 +404,57 @@ IMPORTANTE: Responda APENAS com um JSON válido, sem texto adicional antes ou de
         }
     
     def generate_summary(self, all_expenses):
-        """Gera um resumo geral de todos os gastos"""
+        """
+        Gera um resumo geral de todos os gastos
+        
+        Os gastos vão em tabela compacta, dos maiores para os menores; se não
+        couberem em summary_token_budget, os menores são omitidos (os totais
+        por categoria sempre consideram todos).
+        """
         try:
-            total = sum(float(exp['analysis']['valor']) for exp in all_expenses if 'analysis' in exp)
+            analyses = [exp for exp in all_expenses if 'analysis' in exp]
+            total = sum(float(exp['analysis']['valor']) for exp in analyses)
             
-            prompt = f"""Com base nos seguintes gastos totalizando R$ {total:.2f}, gere um resumo financeiro inteligente:
-
-{json.dumps(all_expenses, indent=2, ensure_ascii=False)}
+            por_categoria = {}
+            for exp in analyses:
+                categoria = exp['analysis'].get('categoria', 'outros')
+                por_categoria[categoria] = por_categoria.get(categoria, 0) + float(exp['analysis']['valor'])
+            
+            rows = sorted(
+                (
+                    {
+                        'arquivo': exp.get('filename'),
+                        'valor': float(exp['analysis']['valor']),
+                        'categoria': exp['analysis'].get('categoria'),
+                        'data': exp['analysis'].get('data'),
+                        'instituicao': exp['analysis'].get('instituicao')
+                    }
+                    for exp in analyses
+                ),
+                key=lambda row: row['valor'],
+                reverse=True
+            )
+            table = format_table(['arquivo', 'valor', 'categoria', 'data', 'instituicao'], rows).split('\n')
+            
+            builder = PromptBuilder(self.summary_token_budget)
+            builder.add(f"""Com base nos seguintes gastos totalizando R$ {total:.2f}, gere um resumo financeiro inteligente:
 
+""", required=True)
+            builder.add_lines("TOTAIS POR CATEGORIA:\n", [
+                f"- {categoria}: R$ {valor:.2f}"
+                for categoria, valor in sorted(por_categoria.items(), key=lambda item: item[1], reverse=True)
+            ], priority=2)
+            builder.add_lines(f"GASTOS:\n{table[0]}\n", table[1:], priority=1)
+            builder.add("""
 Forneça insights sobre:
 1. Principais categorias de gasto
 2. Recomendações de economia
 3. Padrões identificados
 
-Responda em português, de forma clara e objetiva (máximo 200 palavras)."""
-
-            body = json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 500,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            })
-            
-            response = self.client.invoke_model(
-                modelId=self.model_id,
-                body=body
-            )
+Responda em português, de forma clara e objetiva (máximo 200 palavras).""", required=True)
+            prompt, _ = builder.build()
             
-            response_body = json.loads(response['body'].read())
-            summary = response_body['content'][0]['text']
+            summary = self._invoke(prompt, max_tokens=500, call_type='summary')
             
             return summary
             
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from services.connection_pool import ConnectionPool
+
+class CacheService:
+    """Cache persistente de resultados por estágio, endereçado pelo SHA-256 do arquivo"""
+
+    EVICTION_INTERVAL = 50  # Escritas entre verificações de expiração/tamanho
+    # Um acerto só regrava last_access se o valor anterior for mais antigo que isso (segundos),
+    # para que leituras não virem escritas serializadas; basta para a ordem de remoção por tamanho
+    ACCESS_UPDATE_INTERVAL = 300
+
+    def __init__(self, db_path='data/cache.db', max_size_mb=None, max_age_days=None):
+        self.db_path = db_path
+        if max_size_mb is None:
+            max_size_mb = os.getenv('RESULT_CACHE_MAX_MB', 256)
+        if max_age_days is None:
+            max_age_days = os.getenv('RESULT_CACHE_MAX_AGE_DAYS', 30)
+        self.max_size_bytes = int(float(max_size_mb) * 1024 * 1024)
+        self.max_age_seconds = float(max_age_days) * 86400
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._writes = 0
+        self._ensure_db_directory()
+        self.pool = ConnectionPool(self.db_path, size=int(os.getenv('RESULT_CACHE_POOL_SIZE', 4)))
+        self._init_database()
+        self._evict()
+
+    def _ensure_db_directory(self):
+        """Garante que o diretório do cache existe"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+    def _init_database(self):
+        """Cria a tabela de cache"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stage_cache (
+                    content_hash TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    stage_version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (content_hash, stage, stage_version)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stage_cache_last_access ON stage_cache(last_access)')
+
+            conn.commit()
+        print(f"✓ Cache de resultados inicializado: {self.db_path}")
+
+    def _count(self, stage, hit):
+        with self._lock:
+            counters = self._counters.setdefault(stage, {'hits': 0, 'misses': 0})
+            counters['hits' if hit else 'misses'] += 1
+
+    def get(self, content_hash, stage, stage_version):
+        """
+        Busca a saída de um estágio no cache
+
+        Args:
+            content_hash: SHA-256 do conteúdo do arquivo
+            stage: Nome do estágio (ex.: extracted_text, logos, analysis)
+            stage_version: Versão do estágio; mudar a versão invalida apenas este estágio
+
+        Returns:
+            Valor armazenado ou None se não houver entrada válida
+        """
+        now = time.time()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT value, created_at, last_access FROM stage_cache
+                WHERE content_hash = ? AND stage = ? AND stage_version = ?
+            ''', (content_hash, stage, stage_version))
+            row = cursor.fetchone()
+
+            if row and now - row[1] <= self.max_age_seconds:
+                if now - row[2] >= self.ACCESS_UPDATE_INTERVAL:
+                    cursor.execute('''
+                        UPDATE stage_cache SET last_access = ?
+                        WHERE content_hash = ? AND stage = ? AND stage_version = ?
+                    ''', (now, content_hash, stage, stage_version))
+                    conn.commit()
+                self._count(stage, True)
+                return json.loads(row[0])
+
+        self._count(stage, False)
+        return None
+
+    def contains(self, content_hash, stage, stage_version):
+        """Verifica se há entrada válida, sem afetar os contadores de acertos/faltas"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT 1 FROM stage_cache
+                WHERE content_hash = ? AND stage = ? AND stage_version = ? AND created_at >= ?
+            ''', (content_hash, stage, stage_version, time.time() - self.max_age_seconds))
+            found = cursor.fetchone() is not None
+        return found
+
+    def set(self, content_hash, stage, stage_version, value):
+        """Armazena a saída de um estágio no cache"""
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO stage_cache
+                (content_hash, stage, stage_version, value, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (content_hash, stage, stage_version, payload, len(payload.encode('utf-8')), now, now))
+            conn.commit()
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.EVICTION_INTERVAL == 0
+        if should_evict:
+            self._evict()
+
+    def _evict(self):
+        """Remove entradas expiradas e as menos acessadas quando o tamanho máximo é excedido"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('DELETE FROM stage_cache WHERE created_at < ?', (time.time() - self.max_age_seconds,))
+                expired = cursor.rowcount
+
+                cursor.execute('SELECT COALESCE(SUM(size), 0) FROM stage_cache')
+                excess = cursor.fetchone()[0] - self.max_size_bytes
+                removed = 0
+                if excess > 0:
+                    cursor.execute('SELECT rowid, size FROM stage_cache ORDER BY last_access ASC')
+                    to_delete = []
+                    for rowid, size in cursor.fetchall():
+                        if excess <= 0:
+                            break
+                        to_delete.append((rowid,))
+                        excess -= size
+                    cursor.executemany('DELETE FROM stage_cache WHERE rowid = ?', to_delete)
+                    removed = len(to_delete)
+
+                conn.commit()
+
+            if expired or removed:
+                print(f"✓ Cache: {expired} entrada(s) expirada(s) e {removed} removida(s) por tamanho")
+        except Exception as e:
+            print(f"Erro ao limpar cache: {str(e)}")
+
+    def get_stats(self):
+        """Retorna contadores de acertos/faltas e ocupação do cache"""
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._counters.items()}
+
+        hits = sum(c['hits'] for c in stages.values())
+        misses = sum(c['misses'] for c in stages.values())
+
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM stage_cache')
+                entries, size_bytes = cursor.fetchone()
+        except Exception as e:
+            print(f"Erro ao consultar cache: {str(e)}")
+            entries, size_bytes = None, None
+
+        return {
+            'enabled': True,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0,
+            'stages': stages,
+            'entries': entries,
+            'size_bytes': size_bytes,
+            'max_size_bytes': self.max_size_bytes
+        }
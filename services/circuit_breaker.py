@@ -0,0 +1,70 @@
+import threading
+import time
+
+class CircuitOpenError(Exception):
+    """Chamada recusada porque o circuito está aberto"""
+
+class CircuitBreaker:
+    """
+    Disjuntor para chamadas a um serviço externo
+
+    Após `failure_threshold` falhas seguidas o circuito abre e as chamadas são
+    recusadas na hora (CircuitOpenError) por `reset_seconds`. Depois disso uma
+    única chamada de teste passa (meio aberto): se der certo o circuito fecha,
+    se falhar abre de novo.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._stats = {'trips': 0, 'rejected': 0, 'failures': 0}
+
+    def before_call(self):
+        """Verifica se a chamada pode seguir; lança CircuitOpenError se não"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+
+            self._stats['rejected'] += 1
+            raise CircuitOpenError(f"Circuito {self.name} aberto após {self._failures} falhas seguidas")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats['failures'] += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._stats['trips'] += 1
+                print(f"⚠ Circuito {self.name} aberto por {self.reset_seconds}s após {self._failures} falhas seguidas")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._failures
+        return stats
@@ -0,0 +1,81 @@
+import sqlite3
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+class ConnectionPool:
+    """
+    Pool pequeno de conexões SQLite reutilizáveis
+
+    Cada conexão é aberta uma única vez com WAL, synchronous=NORMAL, cache de
+    páginas e mmap configurados, e mantém seu cache de statements preparados
+    entre requisições. Em WAL, leitores não bloqueiam o escritor (e vice-versa).
+    """
+
+    def __init__(self, db_path, size=None):
+        self.db_path = db_path
+        self.size = size or int(os.getenv('SQLITE_POOL_SIZE', 8))
+        self.cache_size_kb = int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))
+        self.mmap_size = int(os.getenv('SQLITE_MMAP_SIZE_MB', 256)) * 1024 * 1024
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _create(self):
+        """Abre uma nova conexão e aplica as pragmas de desempenho"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30,
+            check_same_thread=False,  # A conexão troca de thread, mas só uma a usa por vez
+            cached_statements=256
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{self.cache_size_kb}')
+        conn.execute(f'PRAGMA mmap_size={self.mmap_size}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._create()
+                self._connections.append(conn)
+                return conn
+
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão do pool
+
+        Transações não confirmadas são desfeitas se ocorrer uma exceção.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close_all(self):
+        """Fecha todas as conexões (ex.: ao encerrar a aplicação ou nos testes)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            conn.close()
@@ -1,7 +1,52 @@
-import sqlite3
+import base64
 import json
+import re
+import threading
 from datetime import datetime
 import os
+from services.connection_pool import ConnectionPool
+from services.write_queue import WriteQueue
+
+DOCUMENT_DATE_PATTERN = re.compile(r'^\s*(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\s*$')
+ISO_DATE_PATTERN = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})')
+
+# Marcadores do trecho destacado devolvido pela busca
+SNIPPET_MARKERS = ('<mark>', '</mark>')
+# Tamanho mínimo do último termo para buscar por prefixo: prefixos curtos casam com muitos tokens
+FTS_MIN_PREFIX_LENGTH = 3
+
+# Colunas de analyses que podem ser projetadas em get_analyses_page
+ANALYSIS_FIELDS = (
+    'id', 'filename', 'valor', 'categoria', 'data_documento', 'document_date',
+    'cnpj', 'empresa', 'descricao', 'extracted_text', 'logos', 'created_at'
+)
+# Listagens não carregam o texto extraído nem os logos por padrão
+LIST_FIELDS = tuple(field for field in ANALYSIS_FIELDS if field not in ('extracted_text', 'logos'))
+
+def normalize_document_date(value):
+    """
+    Converte a data do documento (dd/mm/aaaa, dd-mm-aa, aaaa-mm-dd...) para ISO
+    
+    Returns:
+        str: Data no formato AAAA-MM-DD, ou None se ausente/inválida
+    """
+    if not isinstance(value, str):
+        return None
+    
+    match = DOCUMENT_DATE_PATTERN.match(value)
+    if match:
+        day, month, year = match.groups()
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+    else:
+        match = ISO_DATE_PATTERN.match(value)
+        if not match:
+            return None
+        year, month, day = match.groups()
+    
+    try:
+        return datetime(int(year), int(month), int(day)).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
 
 class DatabaseService:
     """Serviço para gerenciar o banco de dados SQLite"""
@@ -9,7 +54,30 @@ class DatabaseService:
     def __init__(self, db_path='data/expenses.db'):
         self.db_path = db_path
         self._ensure_db_directory()
+        self.pool = ConnectionPool(self.db_path)
         self._init_database()
+        self.writer = WriteQueue(self._insert_analyses)
+        # Incrementado a cada gravação em analyses feita por esta instância
+        self._data_version = 0
+        self._version_lock = threading.Lock()
+    
+    @property
+    def data_version(self):
+        """
+        Versão dos dados de analyses, usada para invalidar caches derivados
+        
+        Só reflete gravações feitas por esta aplicação (não edições externas no SQLite).
+        """
+        return self._data_version
+    
+    def _bump_data_version(self):
+        with self._version_lock:
+            self._data_version += 1
+    
+    def close(self):
+        """Conclui as gravações pendentes e fecha as conexões abertas pelo pool"""
+        self.writer.close()
+        self.pool.close_all()
     
     def _ensure_db_directory(self):
         """Garante que o diretório do banco existe"""
@@ -18,10 +86,33 @@ class DatabaseService:
             os.makedirs(db_dir, exist_ok=True)
     
     def _init_database(self):
-        """Inicializa o banco de dados e cria tabelas"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Inicializa o banco de dados aplicando as migrações pendentes"""
+        # A posição na lista define a versão do esquema (PRAGMA user_version)
+        migrations = [
+            self._migration_001_initial_schema,
+            self._migration_002_document_date_and_indexes,
+            self._migration_003_full_text_search,
+            self._migration_004_history_indexes,
+            self._migration_005_aggregate_tables,
+            self._migration_006_descricao,
+            self._migration_007_analyses_job_id,
+        ]
         
+        with self.pool.connection() as conn:
+            # BEGIN IMMEDIATE serializa processos que iniciam ao mesmo tempo
+            conn.execute('BEGIN IMMEDIATE')
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, migration in enumerate(migrations, start=1):
+                if version <= current:
+                    continue
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version}')
+                print(f"✓ Migração {version} aplicada: {migration.__doc__.strip()}")
+            conn.commit()
+        print(f"✓ Banco de dados inicializado: {self.db_path}")
+    
+    def _migration_001_initial_schema(self, cursor):
+        """Tabelas analyses e jobs"""
         # Tabela de análises de documentos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS analyses (
@@ -38,9 +129,169 @@ class DatabaseService:
             )
         ''')
         
-        conn.commit()
-        conn.close()
-        print(f"✓ Banco de dados inicializado: {self.db_path}")
+        # Tabela de jobs de processamento assíncrono
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                total_files INTEGER NOT NULL,
+                processed_files INTEGER NOT NULL DEFAULT 0,
+                files TEXT NOT NULL,
+                results TEXT,
+                statistics TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+    
+    def _migration_002_document_date_and_indexes(self, cursor):
+        """Coluna document_date (ISO) e índices secundários de analyses"""
+        cursor.execute('ALTER TABLE analyses ADD COLUMN document_date TEXT')
+        
+        # Preenche os registros existentes a partir do data_documento livre
+        cursor.execute('SELECT id, data_documento FROM analyses')
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            updates = [
+                (normalize_document_date(data_documento), row_id)
+                for row_id, data_documento in rows
+            ]
+            cursor.connection.executemany(
+                'UPDATE analyses SET document_date = ? WHERE id = ?',
+                [update for update in updates if update[0]]
+            )
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analyses_categoria ON analyses (categoria)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analyses_cnpj ON analyses (cnpj)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analyses_document_date ON analyses (document_date)')
+    
+    def _migration_003_full_text_search(self, cursor):
+        """Índice de busca textual FTS5 sincronizado por triggers"""
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS analyses_fts USING fts5(
+                empresa, categoria, cnpj, filename, extracted_text,
+                content='analyses',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3 4'
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS analyses_fts_insert AFTER INSERT ON analyses BEGIN
+                INSERT INTO analyses_fts (rowid, empresa, categoria, cnpj, filename, extracted_text)
+                VALUES (new.id, new.empresa, new.categoria, new.cnpj, new.filename, new.extracted_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS analyses_fts_delete AFTER DELETE ON analyses BEGIN
+                INSERT INTO analyses_fts (analyses_fts, rowid, empresa, categoria, cnpj, filename, extracted_text)
+                VALUES ('delete', old.id, old.empresa, old.categoria, old.cnpj, old.filename, old.extracted_text);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS analyses_fts_update AFTER UPDATE ON analyses BEGIN
+                INSERT INTO analyses_fts (analyses_fts, rowid, empresa, categoria, cnpj, filename, extracted_text)
+                VALUES ('delete', old.id, old.empresa, old.categoria, old.cnpj, old.filename, old.extracted_text);
+                INSERT INTO analyses_fts (rowid, empresa, categoria, cnpj, filename, extracted_text)
+                VALUES (new.id, new.empresa, new.categoria, new.cnpj, new.filename, new.extracted_text);
+            END
+        ''')
+        
+        # Peso do BM25 por coluna: nome da empresa e CNPJ valem mais que o texto extraído
+        cursor.execute("INSERT INTO analyses_fts (analyses_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 8.0, 2.0, 1.0)')")
+        
+        # Indexa os registros já existentes
+        cursor.execute("INSERT INTO analyses_fts (analyses_fts) VALUES ('rebuild')")
+    
+    def _migration_004_history_indexes(self, cursor):
+        """Índice (categoria, created_at, id) para o histórico paginado por categoria"""
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_analyses_categoria_created_at ON analyses (categoria, created_at, id)')
+        # O índice composto também atende às buscas só por categoria
+        cursor.execute('DROP INDEX IF EXISTS idx_analyses_categoria')
+    
+    def _migration_005_aggregate_tables(self, cursor):
+        """Tabelas de totais por categoria e por mês mantidas por triggers"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS category_totals (
+                categoria TEXT PRIMARY KEY,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL
+            )
+        ''')
+        # month é AAAA-MM do document_date, ou '' quando a data do documento é desconhecida
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS monthly_totals (
+                month TEXT NOT NULL,
+                categoria TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, categoria)
+            )
+        ''')
+        
+        add_new = '''
+            INSERT INTO category_totals (categoria, total, count) VALUES (new.categoria, new.valor, 1)
+            ON CONFLICT (categoria) DO UPDATE SET total = total + excluded.total, count = count + 1;
+            INSERT INTO monthly_totals (month, categoria, total, count)
+            VALUES (COALESCE(substr(new.document_date, 1, 7), ''), new.categoria, new.valor, 1)
+            ON CONFLICT (month, categoria) DO UPDATE SET total = total + excluded.total, count = count + 1;
+        '''
+        remove_old = '''
+            UPDATE category_totals SET total = total - old.valor, count = count - 1
+            WHERE categoria = old.categoria;
+            DELETE FROM category_totals WHERE categoria = old.categoria AND count <= 0;
+            UPDATE monthly_totals SET total = total - old.valor, count = count - 1
+            WHERE month = COALESCE(substr(old.document_date, 1, 7), '') AND categoria = old.categoria;
+            DELETE FROM monthly_totals
+            WHERE month = COALESCE(substr(old.document_date, 1, 7), '') AND categoria = old.categoria AND count <= 0;
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS analyses_totals_insert AFTER INSERT ON analyses BEGIN
+                {add_new}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS analyses_totals_delete AFTER DELETE ON analyses BEGIN
+                {remove_old}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS analyses_totals_update
+            AFTER UPDATE OF valor, categoria, document_date ON analyses BEGIN
+                {remove_old}
+                {add_new}
+            END
+        ''')
+        
+        self._rebuild_aggregates(cursor)
+    
+    def _rebuild_aggregates(self, cursor):
+        """Recalcula category_totals e monthly_totals a partir de analyses"""
+        cursor.execute('DELETE FROM category_totals')
+        cursor.execute('''
+            INSERT INTO category_totals (categoria, total, count)
+            SELECT categoria, SUM(valor), COUNT(*) FROM analyses GROUP BY categoria
+        ''')
+        cursor.execute('DELETE FROM monthly_totals')
+        cursor.execute('''
+            INSERT INTO monthly_totals (month, categoria, total, count)
+            SELECT COALESCE(substr(document_date, 1, 7), ''), categoria, SUM(valor), COUNT(*)
+            FROM analyses GROUP BY 1, 2
+        ''')
+    
+    def _migration_006_descricao(self, cursor):
+        """Coluna descricao com o resumo da análise"""
+        cursor.execute('ALTER TABLE analyses ADD COLUMN descricao TEXT')
+    
+    def _migration_007_analyses_job_id(self, cursor):
+        """Coluna job_id em analyses, para que um job retomado não grave suas análises duas vezes"""
+        cursor.execute('ALTER TABLE analyses ADD COLUMN job_id TEXT')
+        cursor.execute('CREATE INDEX idx_analyses_job_id ON analyses(job_id) WHERE job_id IS NOT NULL')
     
     def save_analysis(self, result):
         """
@@ -55,32 +306,70 @@ class DatabaseService:
         if not result.get('success'):
             return None
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        return self.save_analyses([result])[0]
+    
+    def save_analyses(self, results, job_id=None):
+        """
+        Salva várias análises de uma vez
         
+        As linhas são entregues ao gravador único, que agrupa os lotes de
+        requisições concorrentes em uma só transação (um único commit/fsync);
+        o lote de um job é gravado por inteiro ou não é gravado.
+        
+        Args:
+            results: Lista de dicionários no formato de save_analysis
+            job_id: Job que gerou as análises (ver count_job_analyses)
+        
+        Returns:
+            list: IDs inseridos, na ordem de results (None para resultados sem sucesso)
+        """
+        rows = [self._analysis_row(result, job_id) if result.get('success') else None for result in results]
+        pending = [row for row in rows if row is not None]
+        if not pending:
+            return [None] * len(results)
+        
+        ids = iter(self.writer.submit(pending).result())
+        return [next(ids) if row is not None else None for row in rows]
+    
+    def _analysis_row(self, result, job_id=None):
+        """Converte um resultado do processamento em valores para a tabela analyses"""
         analysis = result.get('analysis', {})
         logos = result.get('logos', [])
         
-        cursor.execute('''
-            INSERT INTO analyses 
-            (filename, valor, categoria, data_documento, cnpj, empresa, extracted_text, logos)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        return (
             result.get('filename'),
             float(analysis.get('valor', 0)),
             analysis.get('categoria', 'Outros'),
             analysis.get('data', 'N/A'),
+            normalize_document_date(analysis.get('data')),
             analysis.get('cnpj', 'N/A'),
-            analysis.get('empresa', 'N/A'),
+            # O BedrockService devolve o nome do estabelecimento em 'instituicao'
+            analysis.get('empresa', analysis.get('instituicao', 'N/A')),
+            analysis.get('descricao'),
             result.get('extracted_text', ''),
-            json.dumps(logos)
-        ))
+            json.dumps(logos),
+            job_id
+        )
+    
+    def _insert_analyses(self, rows):
+        """
+        Insere as linhas em uma única transação (executado pelo gravador)
         
-        conn.commit()
-        record_id = cursor.lastrowid
-        conn.close()
+        Returns:
+            list: IDs inseridos, na ordem das linhas
+        """
+        with self.pool.connection() as conn:
+            conn.executemany('''
+                INSERT INTO analyses 
+                (filename, valor, categoria, data_documento, document_date, cnpj, empresa, descricao, extracted_text, logos, job_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # Com um único gravador e AUTOINCREMENT, os IDs do lote são consecutivos
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            conn.commit()
+        self._bump_data_version()
         
-        return record_id
+        return list(range(last_id - len(rows) + 1, last_id + 1))
     
     def get_all_analyses(self):
         """
@@ -89,17 +378,15 @@ class DatabaseService:
         Returns:
             list: Lista de dicionários com as análises
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM analyses 
-            ORDER BY created_at DESC
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM analyses 
+                ORDER BY created_at DESC, id DESC
+            ''')
+            
+            rows = cursor.fetchall()
         
         analyses = []
         for row in rows:
@@ -109,8 +396,10 @@ class DatabaseService:
                 'valor': row['valor'],
                 'categoria': row['categoria'],
                 'data_documento': row['data_documento'],
+                'document_date': row['document_date'],
                 'cnpj': row['cnpj'],
                 'empresa': row['empresa'],
+                'descricao': row['descricao'],
                 'extracted_text': row['extracted_text'],
                 'logos': json.loads(row['logos']) if row['logos'] else [],
                 'created_at': row['created_at']
@@ -118,78 +407,295 @@ class DatabaseService:
         
         return analyses
     
+    def get_analyses_page(self, limit=50, cursor=None, fields=None, categoria=None, date_from=None, date_to=None):
+        """
+        Retorna uma página do histórico, do registro mais novo para o mais antigo
+        
+        A paginação é por cursor (keyset) sobre (created_at, id): cada página é
+        uma busca no índice a partir do último registro da anterior, com custo
+        independente da posição no histórico.
+        
+        Args:
+            limit: Tamanho da página
+            cursor: Valor de next_cursor devolvido pela página anterior
+            fields: Colunas a retornar (padrão: LIST_FIELDS, sem extracted_text e logos)
+            categoria: Filtra por categoria
+            date_from: Data inicial do documento (AAAA-MM-DD), inclusive
+            date_to: Data final do documento (AAAA-MM-DD), inclusive
+        
+        Returns:
+            dict: {'analyses': [...], 'next_cursor': str ou None, 'total': registros no filtro (só na primeira página)}
+        """
+        fields = self._projection(fields)
+        # created_at e id formam o cursor
+        columns = list(dict.fromkeys(fields + ['created_at', 'id']))
+        
+        filters = []
+        params = []
+        if categoria:
+            filters.append('categoria = ?')
+            params.append(categoria)
+        if date_from:
+            filters.append('document_date >= ?')
+            params.append(date_from)
+        if date_to:
+            filters.append('document_date <= ?')
+            params.append(date_to)
+        
+        page_filters = list(filters)
+        page_params = list(params)
+        if cursor:
+            page_filters.append('(created_at, id) < (?, ?)')
+            page_params.extend(self._decode_cursor(cursor))
+        
+        def where(conditions):
+            return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(columns)} FROM analyses
+                {where(page_filters)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', page_params + [limit + 1]).fetchall()
+            
+            # O total só é contado na primeira página; as seguintes reaproveitam o valor no cliente
+            total = None
+            if not cursor:
+                total = conn.execute(f'SELECT COUNT(*) FROM analyses {where(filters)}', params).fetchone()[0]
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        analyses = [self._project_row(row, fields) for row in rows]
+        
+        next_cursor = self._encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+        return {'analyses': analyses, 'next_cursor': next_cursor, 'total': total}
+    
+    def get_analyses_after(self, last_id, limit=1000, fields=None):
+        """
+        Retorna registros com id maior que last_id, em ordem crescente de id
+        
+        Usado para acompanhar incrementalmente as novas gravações (ex.: índice de busca do agente).
+        """
+        fields = self._projection(fields)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(dict.fromkeys(fields + ['id']))} FROM analyses WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit)
+            ).fetchall()
+        return [self._project_row(row, fields + ['id']) for row in rows]
+    
+    def get_analyses_by_ids(self, ids, fields=None):
+        """Retorna os registros com os IDs informados, na mesma ordem de ids"""
+        if not ids:
+            return []
+        fields = self._projection(fields)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(dict.fromkeys(fields + ['id']))} FROM analyses "
+                f"WHERE id IN ({', '.join('?' for _ in ids)})",
+                list(ids)
+            ).fetchall()
+        by_id = {row['id']: self._project_row(row, fields) for row in rows}
+        return [by_id[record_id] for record_id in ids if record_id in by_id]
+    
+    @staticmethod
+    def _projection(fields):
+        """Valida a lista de colunas pedida (padrão: LIST_FIELDS)"""
+        fields = list(fields or LIST_FIELDS)
+        invalid = [field for field in fields if field not in ANALYSIS_FIELDS]
+        if invalid:
+            raise ValueError(f"Campos inválidos: {', '.join(invalid)}")
+        return fields
+    
+    @staticmethod
+    def _project_row(row, fields):
+        analysis = {field: row[field] for field in fields}
+        if 'logos' in analysis:
+            analysis['logos'] = json.loads(analysis['logos']) if analysis['logos'] else []
+        return analysis
+    
+    @staticmethod
+    def _encode_cursor(created_at, record_id):
+        """Cursor opaco com a posição (created_at, id) do último registro da página"""
+        raw = json.dumps([created_at, record_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return str(created_at), int(record_id)
+        except Exception:
+            raise ValueError("Cursor inválido")
+    
     def get_statistics(self):
         """
         Calcula estatísticas gerais dos dados armazenados
         
+        Lê a tabela category_totals (uma linha por categoria), mantida pelos
+        triggers de analyses, em vez de agregar o histórico inteiro.
+        
         Returns:
             dict: Estatísticas com total gasto, categorias, etc.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT categoria, total, count
+                FROM category_totals
+                ORDER BY total DESC
+            ''').fetchall()
         
-        # Total gasto
-        cursor.execute('SELECT SUM(valor) as total FROM analyses')
-        total_gasto = cursor.fetchone()[0] or 0
-        
-        # Total de arquivos
-        cursor.execute('SELECT COUNT(*) as count FROM analyses')
-        total_arquivos = cursor.fetchone()[0] or 0
-        
-        # Gastos por categoria
-        cursor.execute('''
-            SELECT categoria, SUM(valor) as total, COUNT(*) as count
-            FROM analyses
-            GROUP BY categoria
-            ORDER BY total DESC
-        ''')
+        total_gasto = sum(row['total'] for row in rows)
+        total_arquivos = sum(row['count'] for row in rows)
         
         categorias = {}
-        for row in cursor.fetchall():
-            categoria, total, count = row
+        for categoria, total, count in rows:
             categorias[categoria] = {
                 'valor': round(total, 2),
                 'percentual': round((total / total_gasto * 100) if total_gasto > 0 else 0, 2),
                 'count': count
             }
         
-        conn.close()
-        
         return {
             'total_gasto': round(total_gasto, 2),
             'total_arquivos': total_arquivos,
             'categorias': categorias
         }
     
-    def search_analyses(self, query):
+    def get_period_totals(self, granularity='year'):
+        """
+        Totais por período e categoria, lidos da tabela monthly_totals
+        
+        Documentos sem data reconhecida ficam de fora, como no agrupamento anterior.
+        
+        Args:
+            granularity: 'year' (AAAA) ou 'month' (AAAA-MM)
+        
+        Returns:
+            dict: {período: {'total', 'count', 'categorias': {categoria: total}}}, do mais recente ao mais antigo
+        """
+        if granularity not in ('year', 'month'):
+            raise ValueError(f"Granularidade inválida: {granularity}")
+        period = 'substr(month, 1, 4)' if granularity == 'year' else 'month'
+        
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {period} AS period, categoria, SUM(total) AS total, SUM(count) AS count
+                FROM monthly_totals
+                WHERE month != ''
+                GROUP BY period, categoria
+                ORDER BY period DESC, total DESC
+            ''').fetchall()
+        
+        totals = {}
+        for row in rows:
+            entry = totals.setdefault(row['period'], {'total': 0, 'count': 0, 'categorias': {}})
+            entry['total'] += row['total']
+            entry['count'] += row['count']
+            entry['categorias'][row['categoria']] = row['total']
+        
+        return totals
+    
+    def check_aggregates(self, repair=False):
+        """
+        Compara as tabelas de totais com os dados de analyses
+        
+        Args:
+            repair: Se True, reconstrói as tabelas quando houver divergência
+        
+        Returns:
+            dict: {'consistent': bool, 'differences': [...], 'repaired': bool}
+        """
+        checks = {
+            'category_totals': (
+                'SELECT categoria, total, count FROM category_totals',
+                'SELECT categoria, SUM(valor), COUNT(*) FROM analyses GROUP BY categoria'
+            ),
+            'monthly_totals': (
+                'SELECT month || \'|\' || categoria, total, count FROM monthly_totals',
+                '''SELECT COALESCE(substr(document_date, 1, 7), '') || '|' || categoria, SUM(valor), COUNT(*)
+                   FROM analyses GROUP BY 1'''
+            )
+        }
+        
+        differences = []
+        with self.pool.connection() as conn:
+            # Leitura consistente das duas versões dentro da mesma transação
+            conn.execute('BEGIN')
+            for table, (stored_sql, expected_sql) in checks.items():
+                stored = {key: (total, count) for key, total, count in conn.execute(stored_sql)}
+                expected = {key: (total, count) for key, total, count in conn.execute(expected_sql)}
+                for key in sorted(set(stored) | set(expected)):
+                    stored_total, stored_count = stored.get(key, (0, 0))
+                    expected_total, expected_count = expected.get(key, (0, 0))
+                    if stored_count != expected_count or abs(stored_total - expected_total) > 0.005:
+                        differences.append({
+                            'table': table,
+                            'key': key,
+                            'stored': {'total': stored_total, 'count': stored_count},
+                            'expected': {'total': expected_total, 'count': expected_count}
+                        })
+            conn.rollback()
+            
+            repaired = False
+            if differences and repair:
+                conn.execute('BEGIN IMMEDIATE')
+                self._rebuild_aggregates(conn.cursor())
+                conn.commit()
+                self._bump_data_version()
+                repaired = True
+        
+        return {'consistent': not differences, 'differences': differences, 'repaired': repaired}
+    
+    def search_analyses(self, query, limit=20, offset=0, match_any=False):
         """
         Busca análises por texto (empresa, categoria, CNPJ, etc.)
         
+        Usa o índice FTS5 analyses_fts: sem distinção de acentos e maiúsculas,
+        cada termo é tratado como prefixo e os resultados são ordenados por BM25.
+        
         Args:
             query: Texto de busca
+            limit: Tamanho da página
+            offset: Quantidade de resultados a pular
+            match_any: Se True, basta um dos termos (ex.: perguntas em linguagem natural)
         
         Returns:
-            list: Lista de análises que correspondem à busca
+            list: Lista de análises que correspondem à busca, com trecho destacado em 'snippet'
         """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        search_term = f'%{query}%'
+        fts_query = self._fts_query(query, match_any)
+        if not fts_query:
+            return []
         
-        cursor.execute('''
-            SELECT * FROM analyses 
-            WHERE 
-                empresa LIKE ? OR
-                categoria LIKE ? OR
-                cnpj LIKE ? OR
-                filename LIKE ? OR
-                extracted_text LIKE ?
-            ORDER BY created_at DESC
-        ''', (search_term, search_term, search_term, search_term, search_term))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # A página é escolhida só pelo rank; snippet() e a junção rodam apenas nela
+            cursor.execute('''
+                WITH page AS (
+                    SELECT rowid AS id, rank FROM analyses_fts
+                    WHERE analyses_fts MATCH :query
+                    ORDER BY rank, rowid DESC
+                    LIMIT :limit OFFSET :offset
+                )
+                SELECT a.*, page.rank AS rank,
+                       snippet(analyses_fts, -1, :mark_start, :mark_end, '…', 12) AS snippet
+                FROM page
+                JOIN analyses_fts ON analyses_fts.rowid = page.id
+                JOIN analyses a ON a.id = page.id
+                WHERE analyses_fts MATCH :query
+                ORDER BY page.rank, page.id DESC
+            ''', {
+                'query': fts_query,
+                'limit': limit,
+                'offset': offset,
+                'mark_start': SNIPPET_MARKERS[0],
+                'mark_end': SNIPPET_MARKERS[1]
+            })
+            
+            rows = cursor.fetchall()
         
         analyses = []
         for row in rows:
@@ -199,11 +705,121 @@ class DatabaseService:
                 'valor': row['valor'],
                 'categoria': row['categoria'],
                 'data_documento': row['data_documento'],
+                'document_date': row['document_date'],
                 'cnpj': row['cnpj'],
                 'empresa': row['empresa'],
-                'extracted_text': row['extracted_text'][:200],
+                'descricao': row['descricao'],
+                'extracted_text': (row['extracted_text'] or '')[:200],
                 'logos': json.loads(row['logos']) if row['logos'] else [],
-                'created_at': row['created_at']
+                'created_at': row['created_at'],
+                'snippet': row['snippet'],
+                'score': round(-row['rank'], 4)
             })
         
         return analyses
+    
+    @staticmethod
+    def _fts_query(query, match_any=False):
+        """
+        Converte o texto digitado em uma expressão FTS5 segura
+        
+        Cada termo vira uma frase entre aspas, de modo que pontuação (CNPJ,
+        valores) e operadores digitados não quebram a consulta. Só o último
+        termo, que pode estar sendo digitado, é buscado por prefixo, e apenas
+        com FTS_MIN_PREFIX_LENGTH caracteres ou mais.
+        """
+        words = [term for term in query.split() if any(c.isalnum() for c in term)]
+        terms = ['"' + term.replace('"', '""') + '"' for term in words]
+        if words and sum(c.isalnum() for c in words[-1]) >= FTS_MIN_PREFIX_LENGTH:
+            terms[-1] += '*'
+        return (' OR ' if match_any else ' ').join(terms)
+    
+    def create_job(self, job_id, files):
+        """
+        Registra um novo job de processamento
+        
+        Args:
+            job_id: Identificador do job
+            files: Lista de tuplas (caminho em disco ou None se em memória, nome do arquivo)
+        """
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO jobs (id, status, total_files, files)
+                VALUES (?, 'queued', ?, ?)
+            ''', (job_id, len(files), json.dumps(files)))
+            conn.commit()
+    
+    def count_job_analyses(self, job_id):
+        """Número de análises já gravadas por um job"""
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT COUNT(*) FROM analyses WHERE job_id = ?', (job_id,)).fetchone()[0]
+    
+    def update_job(self, job_id, **fields):
+        """
+        Atualiza campos de um job (status, processed_files, results, statistics, error)
+        """
+        allowed = {'status', 'processed_files', 'results', 'statistics', 'error'}
+        columns = []
+        values = []
+        for key, value in fields.items():
+            if key not in allowed:
+                raise ValueError(f"Campo de job inválido: {key}")
+            columns.append(f"{key} = ?")
+            values.append(json.dumps(value) if key in ('results', 'statistics') else value)
+        
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(columns)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                values + [job_id]
+            )
+            conn.commit()
+    
+    def get_job(self, job_id):
+        """
+        Retorna um job pelo ID
+        
+        Returns:
+            dict: Dados do job ou None se não existir
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+            row = cursor.fetchone()
+        
+        return self._job_from_row(row) if row else None
+    
+    def get_unfinished_jobs(self):
+        """
+        Retorna jobs que ainda não terminaram (usado para retomar após reinício)
+        
+        Returns:
+            list: Jobs com status queued ou running, do mais antigo ao mais novo
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM jobs
+                WHERE status IN ('queued', 'running')
+                ORDER BY created_at ASC
+            ''')
+            
+            rows = cursor.fetchall()
+        
+        return [self._job_from_row(row) for row in rows]
+    
+    def _job_from_row(self, row):
+        """Converte uma linha da tabela jobs em dicionário"""
+        return {
+            'id': row['id'],
+            'status': row['status'],
+            'total_files': row['total_files'],
+            'processed_files': row['processed_files'],
+            'files': [tuple(item) for item in json.loads(row['files'])],
+            'results': json.loads(row['results']) if row['results'] else None,
+            'statistics': json.loads(row['statistics']) if row['statistics'] else None,
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
@@ -1,40 +1,111 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from services.textract_service import TextractService
 from services.rekognition_service import RekognitionService
 from services.bedrock_service import BedrockService
+from services.image_preprocessor import ImagePreprocessor
+from services.local_extractor import LocalExtractor
+from services.pipeline import StageGraph
+from services.prompt_budget import estimate_tokens, truncate_to_tokens
+from services.textract_blocks import render_structured_data
 
 class DocumentProcessor:
-    def __init__(self, aws_service):
-        self.textract = TextractService(aws_service.textract_client)
+    def __init__(self, aws_service, cache_service=None):
+        self.cache = cache_service
+        
+        # Paralelismo entre arquivos e limite de chamadas simultâneas por serviço AWS
+        self.max_workers = int(os.getenv('PROCESSING_MAX_WORKERS', 4))
+        self.service_limits = {
+            'textract': threading.BoundedSemaphore(int(os.getenv('TEXTRACT_MAX_CONCURRENCY', 4))),
+            'rekognition': threading.BoundedSemaphore(int(os.getenv('REKOGNITION_MAX_CONCURRENCY', 4))),
+            'bedrock': threading.BoundedSemaphore(int(os.getenv('BEDROCK_MAX_CONCURRENCY', 4)))
+        }
+        
+        # O Textract aplica o limite em cada chamada, pois PDFs são divididos em várias páginas
+        self.textract = TextractService(aws_service.textract_client, cache_service, self.service_limits['textract'])
         self.rekognition = RekognitionService(aws_service.rekognition_client)
         self.bedrock = BedrockService(aws_service.bedrock_client)
+        self.local_extractor = LocalExtractor() if os.getenv('LOCAL_EXTRACTOR_ENABLED', 'true').lower() == 'true' else None
+        self.batch_analysis = os.getenv('BEDROCK_BATCH_ANALYSIS', 'true').lower() == 'true'
+        self.preprocessor = ImagePreprocessor() if os.getenv('IMAGE_PREPROCESSING_ENABLED', 'true').lower() == 'true' else None
+        # always: logos em todo arquivo; fallback: só quando a análise não identificou a instituição; off: nunca
+        self.logo_mode = os.getenv('REKOGNITION_MODE', 'always').lower()
+        # Formulários e tabelas (analyze_document) complementam o texto da análise; custo maior por página
+        self.structured_data = os.getenv('TEXTRACT_STRUCTURED_DATA', 'false').lower() == 'true'
+        
+        # Pool separado para os estágios de cada documento (evita bloqueio com o pool de arquivos)
+        self.stage_executor = ThreadPoolExecutor(max_workers=self.max_workers * 2, thread_name_prefix='doc-stage')
+    
+    def _call_limited(self, service, func, *args):
+        """Executa uma chamada respeitando o limite de concorrência do serviço"""
+        with self.service_limits[service]:
+            return func(*args)
     
-    def process_file(self, file_path, filename):
-        """Processa um arquivo individual"""
+    def process_file(self, source, filename, defer_analysis=False):
+        """
+        Processa um arquivo individual
+        
+        Args:
+            source: UploadBuffer com o conteúdo do upload ou caminho do arquivo em disco
+            filename: Nome do arquivo
+            defer_analysis: Se True, a análise (quando não está em cache) fica pendente
+                para ser feita em lote por process_multiple_files
+        """
         try:
-            with open(file_path, 'rb') as f:
-                file_bytes = f.read()
+            file_bytes = self._read_source(source)
             
             print(f"Processando arquivo: {filename}")
             
-            # Extração de texto com Textract
-            extracted_text = self.textract.extract_text(file_bytes)
-            print(f"✓ Texto extraído: {len(extracted_text)} caracteres")
+            # A imagem é pré-processada uma vez; Textract e Rekognition são independentes
+            # entre si e o Bedrock depende apenas do texto
+            graph = StageGraph(self.stage_executor)
+            graph.add_stage('image', self._preprocess_stage)
+            graph.add_stage('extracted_text', self._extract_text_stage, depends_on=('image',))
+            if self.structured_data:
+                graph.add_stage('structured_data', self._structured_data_stage, depends_on=('image',))
+            graph.add_stage(
+                'analysis',
+                self._deferred_analysis_stage if defer_analysis else self._analysis_stage,
+                depends_on=('extracted_text', 'structured_data') if self.structured_data else ('extracted_text',)
+            )
+            if self.logo_mode == 'always':
+                # detect_labels só precisa da imagem; o texto do Textract entra depois, e só se faltar logo
+                graph.add_stage('labels', self._detect_labels_stage, depends_on=('image',))
+                graph.add_stage('logos', self._merge_logos_stage, depends_on=('labels', 'extracted_text'))
+            else:
+                graph.add_stage(
+                    'logos',
+                    self._detect_logos_stage,
+                    depends_on=('image', 'extracted_text', 'analysis') if self.logo_mode == 'fallback' else ()
+                )
             
-            # Detecção de logos com Rekognition
-            logos = self.rekognition.detect_logos(file_bytes)
-            print(f"✓ Logos detectados: {len(logos)}")
+            context, timings = graph.run({
+                'file_bytes': file_bytes,
+                'content_hash': hashlib.sha256(file_bytes).hexdigest()
+            })
             
-            # Análise com Bedrock
-            analysis = self.bedrock.analyze_expense(extracted_text)
-            print(f"✓ Análise concluída: R$ {analysis['valor']} - {analysis['categoria']}")
-            
-            return {
+            result = {
                 "filename": filename,
-                "extracted_text": extracted_text[:500],  # Primeiros 500 caracteres
-                "logos": logos,  # Retornar objetos completos com name e confidence
-                "analysis": analysis,
+                "extracted_text": context['extracted_text'][:500],  # Primeiros 500 caracteres
+                "logos": context['logos'],  # Retornar objetos completos com name e confidence
+                "analysis": context['analysis'],
+                "preprocessing": context['image']['stats'],
+                "timings": timings,
                 "success": True
             }
+            if self.structured_data:
+                result['structured_data'] = context['structured_data']
+            if context['analysis'] is None:
+                result['_pending_analysis'] = {
+                    'text': self._analysis_text(context),
+                    'content_hash': context['content_hash'],
+                    # Modo fallback: os logos dependem da análise feita no lote
+                    'image': context['image']['data'] if context['logos'] is None else None
+                }
+            return result
         except Exception as e:
             print(f"✗ Erro ao processar {filename}: {str(e)}")
             return {
@@ -43,13 +114,266 @@ class DocumentProcessor:
                 "success": False
             }
     
-    def process_multiple_files(self, file_paths_and_names):
-        """Processa múltiplos arquivos"""
-        results = []
+    def _read_source(self, source):
+        """Obtém o conteúdo do arquivo; o buffer do upload é compartilhado entre os estágios sem cópia"""
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return f.read()
+        return source.data()
+    
+    def _cached_stage(self, context, stage, version, compute, is_cacheable):
+        """Executa um estágio consultando antes o cache de resultados pelo hash do arquivo"""
+        if not self.cache:
+            return compute(), False
+        
+        cached = self.cache.get(context['content_hash'], stage, version)
+        if cached is not None:
+            return cached, True
+        
+        value = compute()
+        if is_cacheable(value):
+            self.cache.set(context['content_hash'], stage, version, value)
+        return value, False
+    
+    def _image_version(self, base_version):
+        """Versão de um estágio que consome a imagem pré-processada"""
+        return f"{base_version}+{self.preprocessor.cache_version}" if self.preprocessor else base_version
+    
+    def _preprocess_stage(self, context):
+        """Estágio de pré-processamento da imagem, cujo resultado é reutilizado pelos dois serviços"""
+        if not self.preprocessor:
+            return {'data': context['file_bytes'], 'stats': None}
+        
+        # Se texto e logos já estão em cache, a imagem não será enviada a nenhum serviço
+        stages = [('extracted_text', self.textract.cache_version), ('labels', self.rekognition.cache_version)]
+        if self.structured_data:
+            stages.append(('structured_data', self.textract.structured_cache_version))
+        if self.cache and all(
+            self.cache.contains(context['content_hash'], stage, self._image_version(version))
+            for stage, version in stages
+        ):
+            return {'data': context['file_bytes'], 'stats': None}
+        
+        data, stats = self.preprocessor.process(context['file_bytes'])
+        if stats['applied']:
+            print(f"✓ Imagem pré-processada: {stats['original_bytes']} → {stats['processed_bytes']} bytes em {stats['seconds']}s")
+        return {'data': data, 'stats': stats}
+    
+    def _extract_text_stage(self, context):
+        """Estágio de extração de texto com Textract"""
+        extracted_text, cached = self._cached_stage(
+            context, 'extracted_text', self._image_version(self.textract.cache_version),
+            lambda: self.textract.extract_text(context['image']['data'], context['content_hash']),
+            is_cacheable=bool  # Texto vazio indica erro no Textract
+        )
+        print(f"✓ Texto extraído: {len(extracted_text)} caracteres{' (cache)' if cached else ''}")
+        return extracted_text
+    
+    def _structured_data_stage(self, context):
+        """Estágio de formulários e tabelas com Textract analyze_document"""
+        structured_data, cached = self._cached_stage(
+            context, 'structured_data', self._image_version(self.textract.structured_cache_version),
+            lambda: self.textract.extract_structured_data(context['image']['data']),
+            is_cacheable=lambda data: bool(data['key_values'] or data['tables'])  # Vazio pode indicar erro
+        )
+        print(f"✓ Dados estruturados: {len(structured_data['key_values'])} campos, {len(structured_data['tables'])} tabelas{' (cache)' if cached else ''}")
+        return structured_data
+    
+    def _analysis_text(self, context):
+        """Texto usado na análise: linhas do Textract mais campos e tabelas, se habilitados"""
+        structured = render_structured_data(context.get('structured_data'))
+        if not structured:
+            return context['extracted_text']
+        return f"{context['extracted_text']}\n{structured}"
+    
+    def _analysis_version(self):
+        """Versão da análise no cache; muda quando os dados estruturados entram no texto"""
+        return f"{self.bedrock.cache_version}+structured" if self.structured_data else self.bedrock.cache_version
+    
+    def _detect_logos_stage(self, context):
+        """Estágio de logos dos modos fallback e off"""
+        if self.logo_mode == 'off':
+            return []
+        if context['analysis'] is None:
+            return None  # Análise adiada para o lote; os logos são decididos em _analyze_pending
+        return self._fallback_logos(context, context['analysis'])
+    
+    def _fallback_logos(self, context, analysis):
+        """Detecta logos apenas se a análise não identificou a instituição"""
+        if analysis.get('instituicao', 'N/A') != 'N/A':
+            self.rekognition._count('skipped_identified')
+            return []
+        return self._detect_logos(context)
+    
+    def _detect_logos(self, context):
+        return self._merge_logos_stage({**context, 'labels': self._detect_labels_stage(context)})
+    
+    def _detect_labels_stage(self, context):
+        """Estágio de logos e marcas com Rekognition detect_labels, em paralelo com o Textract"""
+        labels, cached = self._cached_stage(
+            context, 'labels', self._image_version(self.rekognition.cache_version),
+            lambda: self._call_limited('rekognition', self.rekognition.detect_labels, context['image']['data']),
+            # None: PDF, que não vai ao Rekognition
+            is_cacheable=lambda labels: labels is not None and not any(label['name'].startswith('Erro ao detectar') for label in labels)
+        )
+        if cached:
+            print("✓ Labels do Rekognition (cache)")
+        return labels
+    
+    def _merge_logos_stage(self, context):
+        """Junta as labels com as linhas do Textract quando nenhum logo ou marca foi encontrado"""
+        logos = self.rekognition.merge_text(context['labels'], context['extracted_text'])
+        print(f"✓ Logos detectados: {len(logos)}")
+        return logos
+    
+    def _local_analysis(self, extracted_text):
+        """Tenta a extração local por regras; retorna a análise apenas se a confiança for suficiente"""
+        if not self.local_extractor or not extracted_text:
+            return None
+        
+        analysis, confidence = self.local_extractor.extract(extracted_text)
+        bypassed = confidence >= self.local_extractor.confidence_threshold
+        self.local_extractor.record(
+            bypassed,
+            estimated_tokens=estimate_tokens(truncate_to_tokens(extracted_text, self.bedrock.max_document_tokens)) + 300,
+            estimated_seconds=self.bedrock.average_latency()
+        )
+        if not bypassed:
+            return None
+        
+        print(f"✓ Análise concluída: R$ {analysis['valor']} - {analysis['categoria']} (extração local, confiança {confidence})")
+        return analysis
+    
+    def _analysis_stage(self, context):
+        """Estágio de análise: extração local quando confiável, senão Bedrock"""
+        text = self._analysis_text(context)
+        local = self._local_analysis(text)
+        if local:
+            return local
+        
+        analysis, cached = self._cached_stage(
+            context, 'analysis', self._analysis_version(),
+            lambda: self._call_limited('bedrock', self.bedrock.analyze_expense, text),
+            is_cacheable=lambda analysis: analysis != self.bedrock._default_analysis()
+        )
+        print(f"✓ Análise concluída: R$ {analysis['valor']} - {analysis['categoria']}{' (cache)' if cached else ''}")
+        return analysis
+    
+    def _deferred_analysis_stage(self, context):
+        """Estágio de análise adiado para o lote: resolve apenas localmente ou pelo cache"""
+        local = self._local_analysis(self._analysis_text(context))
+        if local:
+            return local
+        
+        if self.cache:
+            analysis = self.cache.get(context['content_hash'], 'analysis', self._analysis_version())
+            if analysis is not None:
+                print(f"✓ Análise concluída: R$ {analysis['valor']} - {analysis['categoria']} (cache)")
+                return analysis
+        return None
+    
+    def _analyze_pending(self, results, on_result=None):
+        """Analisa em lote, no Bedrock, os resultados com análise pendente"""
+        pending = [index for index, result in enumerate(results) if result.get('_pending_analysis')]
+        if not pending:
+            return
+        
+        texts = [results[index]['_pending_analysis']['text'] for index in pending]
+        batches = self.bedrock.pack_batches(texts)
+        print(f"Analisando {len(pending)} documento(s) em {len(batches)} lote(s) no Bedrock")
+        
+        def run_batch(batch):
+            start = time.perf_counter()
+            try:
+                analyses = self._call_limited('bedrock', self.bedrock.analyze_batch, [texts[j] for j in batch])
+            except Exception as e:
+                # Mesma saída da resposta malformada: cada documento é analisado individualmente
+                print(f"✗ Erro na análise em lote: {str(e)}; analisando {len(batch)} documento(s) individualmente")
+                analyses = [self._analyze_single(texts[j]) for j in batch]
+            return analyses, round(time.perf_counter() - start, 3)
+        
+        futures = {self.stage_executor.submit(run_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            analyses, elapsed = future.result()
+            for j, analysis in zip(batch, analyses):
+                index = pending[j]
+                result = results[index]
+                pending_info = result.pop('_pending_analysis')
+                
+                if analysis is None:
+                    results[index] = {"filename": result['filename'], "error": "Falha na análise no Bedrock", "success": False}
+                else:
+                    result['analysis'] = analysis
+                    if pending_info['image'] is not None:
+                        try:
+                            result['logos'] = self._fallback_logos({
+                                'content_hash': pending_info['content_hash'],
+                                'image': {'data': pending_info['image']},
+                                'extracted_text': pending_info['text']
+                            }, analysis)
+                        except Exception as e:
+                            print(f"✗ Erro ao detectar logos de {result['filename']}: {str(e)}")
+                            result['logos'] = []
+                    result['timings']['analysis'] = elapsed
+                    result['timings']['analysis_batch_size'] = len(batch)
+                    if self.cache and analysis != self.bedrock._default_analysis():
+                        self.cache.set(pending_info['content_hash'], 'analysis', self._analysis_version(), analysis)
+                    print(f"✓ Análise concluída: {result['filename']} - R$ {analysis['valor']} - {analysis['categoria']}")
+                
+                if on_result:
+                    on_result(index, results[index])
+    
+    def _analyze_single(self, text):
+        """Análise de um documento fora do lote; None se a chamada falhar"""
+        self.bedrock._count(batch_fallbacks=1)
+        try:
+            return self._call_limited('bedrock', self.bedrock.analyze_expense, text)
+        except Exception as e:
+            print(f"✗ Erro na análise individual: {str(e)}")
+            return None
+    
+    def process_multiple_files(self, file_paths_and_names, concurrent=True, on_result=None):
+        """
+        Processa múltiplos arquivos
+        
+        Args:
+            file_paths_and_names: Lista de tuplas (UploadBuffer ou caminho, nome do arquivo)
+            concurrent: Se True, processa os arquivos em paralelo usando um pool limitado
+            on_result: Callback opcional chamado com (índice, resultado) a cada arquivo concluído
+        
+        Returns:
+            list: Resultados na mesma ordem dos arquivos de entrada
+        """
+        file_paths_and_names = list(file_paths_and_names)
+        results = [None] * len(file_paths_and_names)
+        
+        # Em lote, a análise no Bedrock é adiada e feita com vários documentos por chamada
+        batch = self.batch_analysis and len(file_paths_and_names) > 1
+        
+        def report(index, result):
+            results[index] = result
+            if on_result and not result.get('_pending_analysis'):
+                on_result(index, result)
+        
+        if not concurrent or len(file_paths_and_names) <= 1 or self.max_workers <= 1:
+            for index, (source, filename) in enumerate(file_paths_and_names):
+                report(index, self.process_file(source, filename, defer_analysis=batch))
+        else:
+            workers = min(self.max_workers, len(file_paths_and_names))
+            print(f"Processando {len(file_paths_and_names)} arquivo(s) com {workers} worker(s)")
+            
+            # Falhas ficam isoladas em process_file; a ordem de entrada é mantida pelo índice
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='doc-worker') as executor:
+                futures = {
+                    executor.submit(self.process_file, source, filename, batch): index
+                    for index, (source, filename) in enumerate(file_paths_and_names)
+                }
+                for future in as_completed(futures):
+                    report(futures[future], future.result())
         
-        for file_path, filename in file_paths_and_names:
-            result = self.process_file(file_path, filename)
-            results.append(result)
+        if batch:
+            self._analyze_pending(results, on_result)
         
         return results
     
@@ -0,0 +1,115 @@
+import io
+import os
+import time
+from PIL import Image, ImageOps, ImageStat
+
+class ImagePreprocessor:
+    """Reduz fotos de comprovantes antes do envio ao Textract e ao Rekognition"""
+
+    REKOGNITION_MAX_BYTES = 5 * 1024 * 1024  # Limite de Image.Bytes do Rekognition
+
+    def __init__(self, max_dimension=None, jpeg_quality=None, grayscale_saturation=None):
+        if max_dimension is None:
+            max_dimension = os.getenv('IMAGE_MAX_DIMENSION', 2400)
+        if jpeg_quality is None:
+            jpeg_quality = os.getenv('IMAGE_JPEG_QUALITY', 85)
+        # Saturação média (0-255) abaixo da qual a imagem é tratada como tons de cinza; 0 desativa
+        if grayscale_saturation is None:
+            grayscale_saturation = os.getenv('IMAGE_GRAYSCALE_SATURATION', 20)
+        self.max_dimension = int(max_dimension)
+        self.jpeg_quality = int(jpeg_quality)
+        self.grayscale_saturation = float(grayscale_saturation)
+        self.cache_version = f"pillow-v1-{self.max_dimension}-{self.jpeg_quality}"
+
+    def process(self, file_bytes):
+        """
+        Corrige orientação, reduz e recomprime uma imagem
+
+        Args:
+            file_bytes: Conteúdo original do arquivo
+
+        Returns:
+            tuple: (conteúdo a enviar aos serviços, estatísticas do pré-processamento)
+        """
+        start = time.perf_counter()
+        original_size = len(file_bytes)
+        stats = {
+            'applied': False,
+            'original_bytes': original_size,
+            'processed_bytes': original_size,
+            'bytes_saved': 0
+        }
+
+        if bytes(file_bytes[:5]) == b'%PDF-':
+            stats['seconds'] = round(time.perf_counter() - start, 3)
+            return file_bytes, stats
+
+        try:
+            image = Image.open(io.BytesIO(file_bytes))
+            image.load()
+        except Exception:
+            # Não é uma imagem suportada pelo Pillow (ex.: DOC/DOCX): enviar sem alterações
+            stats['seconds'] = round(time.perf_counter() - start, 3)
+            return file_bytes, stats
+
+        try:
+            # exif_transpose devolve uma imagem nova, sem o formato de origem
+            original_format = image.format
+            orientation = image.getexif().get(0x0112, 1)
+            image = ImageOps.exif_transpose(image)
+            resized = max(image.size) > self.max_dimension
+            needs_processing = (
+                resized
+                or orientation != 1
+                or original_size > self.REKOGNITION_MAX_BYTES
+                or original_format not in ('JPEG', 'PNG')
+            )
+
+            if needs_processing:
+                image = self._normalize_mode(image)
+                if resized:
+                    image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+                processed = self._encode(image)
+                # Manter o original se a recompressão não ajudou e não havia outra correção a fazer
+                if len(processed) < original_size or orientation != 1 or resized:
+                    stats.update({
+                        'applied': True,
+                        'processed_bytes': len(processed),
+                        'bytes_saved': original_size - len(processed),
+                        'size': list(image.size),
+                        'mode': image.mode
+                    })
+                    file_bytes = processed
+        except Exception as e:
+            # Falha na conversão: seguir com o arquivo original
+            print(f"Pré-processamento ignorado: {str(e)}")
+
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        return file_bytes, stats
+
+    def _normalize_mode(self, image):
+        """Converte para RGB ou, quando a imagem quase não tem cor, para tons de cinza"""
+        if image.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        if image.mode == 'RGB':
+            saturation = ImageStat.Stat(image.convert('HSV').split()[1]).mean[0]
+            if saturation < self.grayscale_saturation:
+                image = image.convert('L')
+        return image
+
+    def _encode(self, image):
+        """Codifica em JPEG, reduzindo a qualidade até caber no limite do Rekognition"""
+        quality = self.jpeg_quality
+        while True:
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+            if output.tell() <= self.REKOGNITION_MAX_BYTES or quality <= 50:
+                return output.getvalue()
+            quality -= 10
@@ -0,0 +1,215 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from services.upload_buffer import UploadBuffer
+
+class JobService:
+    """Fila de jobs de processamento assíncrono com estado persistido no SQLite"""
+
+    TERMINAL_STATUSES = ('completed', 'failed')
+    EVENT_RETENTION = 300  # Segundos que os eventos de um job concluído ficam em memória
+
+    def __init__(self, document_processor, database_service, max_workers=None, spool_dir='uploads', spool_uploads=None):
+        self.processor = document_processor
+        self.database = database_service
+        self.spool_dir = spool_dir
+        # Gravar em disco também os uploads pequenos ao enfileirar, para que todo job possa ser
+        # retomado após um reinício (desativado: só os acima de UPLOAD_MEMORY_THRESHOLD_MB vão para disco)
+        if spool_uploads is None:
+            spool_uploads = os.getenv('JOB_SPOOL_UPLOADS', 'false').lower() == 'true'
+        self.spool_uploads = spool_uploads
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('JOB_MAX_WORKERS', 2)),
+            thread_name_prefix='job-worker'
+        )
+        # Eventos de progresso em memória, usados pelo stream SSE
+        self._events = {}
+        self._condition = threading.Condition()
+        self._resume_unfinished_jobs()
+
+    def new_job_id(self):
+        """Gera um identificador único para um job"""
+        return uuid.uuid4().hex
+
+    def submit(self, job_id, uploads):
+        """
+        Registra e enfileira um job
+
+        Args:
+            job_id: Identificador gerado por new_job_id
+            uploads: Lista de UploadBuffer com os arquivos enviados
+        """
+        # Com spool_uploads, todos os arquivos vão para disco ao enfileirar e o job pode ser
+        # retomado após um reinício; sem ele, jobs com arquivos em memória falham ao reiniciar
+        if self.spool_uploads:
+            for upload in uploads:
+                upload.spool(self.spool_dir)
+        self.database.create_job(job_id, [(upload.path, upload.filename) for upload in uploads])
+        self._publish(job_id, {'type': 'queued', 'total': len(uploads)})
+        self.executor.submit(self._run_job, job_id, uploads)
+        print(f"✓ Job {job_id} enfileirado com {len(uploads)} arquivo(s)")
+
+    def get_job(self, job_id):
+        """Retorna o estado público de um job"""
+        job = self.database.get_job(job_id)
+        if not job:
+            return None
+
+        data = {
+            'id': job['id'],
+            'status': job['status'],
+            'total_files': job['total_files'],
+            'processed_files': job['processed_files'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+        if job['status'] == 'completed':
+            data['result'] = self._build_result(job['results'], job['statistics'])
+        return data
+
+    def _build_result(self, results, statistics):
+        """Monta o resultado no mesmo formato da resposta síncrona de /process"""
+        return {
+            "success": True,
+            "total_arquivos": statistics['total_arquivos'],
+            "total_gasto": statistics['total_gasto'],
+            "categorias": statistics['categorias'],
+            "detalhes": results
+        }
+
+    def _run_job(self, job_id, uploads):
+        """Executa um job em um worker do pool"""
+        processed = [0]
+        lock = threading.Lock()
+
+        def on_result(index, result):
+            with lock:
+                processed[0] += 1
+                count = processed[0]
+            self.database.update_job(job_id, processed_files=count)
+            self._publish(job_id, {
+                'type': 'file',
+                'index': index,
+                'filename': result['filename'],
+                'success': result['success'],
+                'error': result.get('error'),
+                'processed': count,
+                'total': len(uploads)
+            })
+
+        try:
+            self.database.update_job(job_id, status='running', processed_files=0)
+            self._publish(job_id, {'type': 'running', 'total': len(uploads)})
+
+            print(f"\n{'='*60}")
+            print(f"Job {job_id}: processando {len(uploads)} arquivo(s)...")
+            print(f"{'='*60}\n")
+
+            results = self.processor.process_multiple_files(
+                [(upload, upload.filename) for upload in uploads],
+                on_result=on_result
+            )
+
+            saved = [result['filename'] for result in results if result.get('success')]
+            if saved and self.database.count_job_analyses(job_id):
+                # Job retomado após um reinício entre a gravação e a conclusão: as análises já estão no banco
+                print(f"✓ Análises do job {job_id} já estavam salvas no banco")
+            elif saved:
+                self.database.save_analyses(results, job_id=job_id)
+                print(f"✓ {len(saved)} análise(s) salva(s) no banco: {', '.join(saved)}")
+
+            statistics = self.processor.calculate_statistics(results)
+            self.database.update_job(job_id, status='completed', results=results, statistics=statistics)
+
+            print(f"\n{'='*60}")
+            print(f"Job {job_id} concluído!")
+            print(f"Total gasto: R$ {statistics['total_gasto']:.2f}")
+            print(f"Arquivos processados: {statistics['arquivos_processados']}/{statistics['total_arquivos']}")
+            print(f"{'='*60}\n")
+
+            final_event = {'type': 'completed', 'result': self._build_result(results, statistics)}
+        except Exception as e:
+            print(f"✗ Erro no job {job_id}: {str(e)}")
+            self.database.update_job(job_id, status='failed', error=str(e))
+            final_event = {'type': 'failed', 'error': str(e)}
+        finally:
+            for upload in uploads:
+                upload.close()
+
+        self._publish(job_id, final_event)
+        timer = threading.Timer(self.EVENT_RETENTION, self._discard_events, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _resume_unfinished_jobs(self):
+        """Reenfileira jobs interrompidos por um reinício do servidor"""
+        for job in self.database.get_unfinished_jobs():
+            # Jobs criados antes da gravação em disco ao enfileirar podem ter arquivos só em memória
+            missing = [path for path, _ in job['files'] if not path or not os.path.exists(path)]
+            if missing:
+                for path, _ in job['files']:
+                    if path and os.path.exists(path):
+                        os.remove(path)
+                self.database.update_job(
+                    job['id'], status='failed',
+                    error='Arquivos do job não estão mais disponíveis após reinício'
+                )
+                print(f"✗ Job {job['id']} não pôde ser retomado: arquivos ausentes")
+                continue
+
+            uploads = [UploadBuffer.from_path(path, filename) for path, filename in job['files']]
+            self.database.update_job(job['id'], status='queued', processed_files=0)
+            self.executor.submit(self._run_job, job['id'], uploads)
+            print(f"✓ Job {job['id']} retomado após reinício")
+
+    def _publish(self, job_id, event):
+        """Registra um evento de progresso e acorda os assinantes"""
+        with self._condition:
+            self._events.setdefault(job_id, []).append(event)
+            self._condition.notify_all()
+
+    def iter_events(self, job_id, keepalive=15):
+        """
+        Gera os eventos de progresso de um job até sua conclusão
+
+        Args:
+            job_id: Identificador do job
+            keepalive: Intervalo (s) para emitir None, permitindo manter a conexão viva
+
+        Yields:
+            dict: Eventos de progresso (ou None como keepalive)
+        """
+        job = self.get_job(job_id)
+        if not job:
+            return
+
+        yield {'type': 'status', 'job': job}
+        if job['status'] in self.TERMINAL_STATUSES:
+            return
+
+        # Jobs retomados após reinício não têm o histórico de eventos; partimos do estado atual
+        position = 0
+        while True:
+            with self._condition:
+                events = self._events.get(job_id, [])
+                if position >= len(events):
+                    self._condition.wait(timeout=keepalive)
+                    events = self._events.get(job_id, [])
+                new_events = events[position:]
+                position = len(events)
+
+            if not new_events:
+                yield None
+                continue
+
+            for event in new_events:
+                yield event
+                if event['type'] in self.TERMINAL_STATUSES:
+                    return
+
+    def _discard_events(self, job_id):
+        """Libera os eventos em memória de um job concluído"""
+        with self._condition:
+            self._events.pop(job_id, None)
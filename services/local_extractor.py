@@ -0,0 +1,273 @@
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+
+# Palavras-chave (sem acentos, maiúsculas) que identificam a categoria do gasto, comparadas
+# como palavras inteiras. A ordem importa: a primeira categoria com correspondência é usada.
+MERCHANT_CATEGORIES = [
+    ('transferencia', ['PIX', 'TRANSFERENCIA', 'TED', 'DOC']),
+    ('investimento', ['CDB', 'TESOURO DIRETO', 'APLICACAO', 'RENDA FIXA', 'FUNDO DE INVESTIMENTO', 'CORRETORA']),
+    ('transporte', ['UBER', '99APP', '99 TECNOLOGIA', 'POSTO', 'COMBUSTIVEL', 'GASOLINA', 'ETANOL', 'ESTACIONAMENTO', 'PEDAGIO', 'METRO', 'CABIFY']),
+    ('saude', ['FARMACIA', 'DROGARIA', 'DROGASIL', 'RAIA', 'PACHECO', 'HOSPITAL', 'CLINICA', 'LABORATORIO', 'ODONTO']),
+    ('alimentacao', ['IFOOD', 'SUPERMERCADO', 'MERCADO', 'PADARIA', 'RESTAURANTE', 'LANCHONETE', 'PIZZARIA', 'ACOUGUE', 'HORTIFRUTI', 'ATACADAO', 'ASSAI', 'CARREFOUR', 'PAO DE ACUCAR', 'MCDONALD', 'BURGER KING']),
+    ('educacao', ['ESCOLA', 'FACULDADE', 'UNIVERSIDADE', 'COLEGIO', 'CURSO', 'LIVRARIA', 'MENSALIDADE ESCOLAR']),
+    ('moradia', ['ALUGUEL', 'CONDOMINIO', 'ENERGIA ELETRICA', 'ENEL', 'CEMIG', 'SABESP', 'COPASA', 'CONTA DE AGUA', 'CONTA DE LUZ', 'IPTU']),
+    ('lazer', ['NETFLIX', 'SPOTIFY', 'CINEMA', 'INGRESSO', 'TEATRO', 'STEAM', 'PLAYSTATION', 'SHOW']),
+]
+CATEGORY_PATTERNS = [
+    (categoria, re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in keywords) + r')\b'))
+    for categoria, keywords in MERCHANT_CATEGORIES
+]
+
+# Rótulos de total, do mais ao menos confiável (VALOR PAGO inclui o troco)
+TOTAL_KEYWORDS = re.compile(
+    r'\b(TOTAL\s+A\s+PAGAR|VALOR\s+A\s+PAGAR|VALOR\s+TOTAL|VALOR\s+DA\s+TRANSFERENCIA|VALOR\s+PAGO|TOTAL|VALOR)\b'
+)
+TOTAL_PRIORITY = {
+    'TOTAL A PAGAR': 0,
+    'VALOR A PAGAR': 0,
+    'VALOR TOTAL': 1,
+    'VALOR DA TRANSFERENCIA': 1,
+    'TOTAL': 1,
+    'VALOR': 2,
+    'VALOR PAGO': 3
+}
+# Linhas cujo valor não é o total do documento
+NON_TOTAL_LINE = re.compile(r'\b(SUBTOTAL|TROCO|TRIBUTOS?|IMPOSTOS?|DESCONTOS?|ACRESCIMOS?|ITENS|UNIT\w*)\b')
+# Forma de pagamento, tributos e troco: não dizem nada sobre o estabelecimento
+PAYMENT_LINE = re.compile(
+    r'\b(FORMAS?\s+(?:DE\s+)?PAGAMENTO|MEIO\s+DE\s+PAGAMENTO|VALOR\s+PAGO|TROCO|TRIBUTOS?|IMPOSTOS?|LEI\s+(?:FEDERAL\s+)?12\.?741)\b'
+    r'|^(?:PAGAMENTO\s+INSTANTANEO\s*)?\(?(?:PIX|DINHEIRO|CARTAO(?:\s+DE)?(?:\s+(?:CREDITO|DEBITO))?|CREDITO|DEBITO|VALE\s+\w+)\)?'
+    r'\s*(?:R\$)?\s*[\d.,]*$'
+)
+AMOUNT_PATTERN = re.compile(r'(?:R\$\s*)?(\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d{2})(?!\d)')
+CNPJ_PATTERN = re.compile(r'(?<!\d)(\d{2})\.?(\d{3})\.?(\d{3})/?(\d{4})-?(\d{2})(?!\d)')
+CPF_PATTERN = re.compile(r'(?<![\d*])[\d*]{3}\.[\d*]{3}\.[\d*]{3}-[\d*]{2}(?![\d*])')
+DATE_PATTERN = re.compile(r'(?<!\d)(\d{2})[/.-](\d{2})[/.-](\d{4}|\d{2})(?!\d)')
+# Aplicado à linha original (com acentos), para que o nome saia sem deslocamento
+RECIPIENT_PATTERN = re.compile(
+    r'^(?:NOME|PARA|DESTINO|DESTINAT[AÁ]RIO|RECEBEDOR|FAVORECIDO)\b\s*:?\s*(.*)$', re.IGNORECASE
+)
+HEADER_STOPWORDS = ('CNPJ', 'CPF', 'CUPOM', 'DOCUMENTO', 'NOTA FISCAL', 'DANFE', 'COMPROVANTE', 'EXTRATO', 'ENDERECO', 'RUA ', 'AV ', 'TEL')
+
+class LocalExtractor:
+    """Extrator local baseado em regras para comprovantes e notas fiscais brasileiras"""
+
+    # Peso de cada campo na confiança (soma 1.0)
+    WEIGHTS = {
+        'valor': 0.35,
+        'categoria': 0.20,
+        'data': 0.15,
+        'cnpj': 0.15,
+        'instituicao': 0.15
+    }
+
+    def __init__(self, confidence_threshold=None):
+        self.confidence_threshold = float(confidence_threshold or os.getenv('LOCAL_EXTRACTOR_THRESHOLD', 0.85))
+        self._lock = threading.Lock()
+        self._stats = {
+            'documents': 0,
+            'bypassed': 0,
+            'estimated_tokens_saved': 0,
+            'estimated_seconds_saved': 0.0
+        }
+
+    def extract(self, extracted_text):
+        """
+        Extrai valor, categoria, data, CNPJ e instituição das linhas do Textract
+
+        Args:
+            extracted_text: Texto extraído (uma linha LINE do Textract por linha)
+
+        Returns:
+            tuple: (análise no formato do BedrockService, confiança entre 0 e 1)
+        """
+        # NFC: acentos compostos, como a RECIPIENT_PATTERN espera
+        lines = [unicodedata.normalize('NFC', line).strip() for line in extracted_text.splitlines() if line.strip()]
+        normalized = [self._normalize(line) for line in lines]
+        full_text = "\n".join(normalized)
+
+        valor, valor_score = self._find_amount(normalized)
+        categoria, categoria_score = self._find_category(normalized)
+        data = self._find_date(full_text)
+        cnpj = self._find_cnpj(full_text)
+        instituicao = self._find_institution(lines, normalized, categoria)
+
+        # Comprovantes de transferência raramente têm CNPJ; o CPF (mesmo mascarado) identifica a contraparte
+        identified = cnpj is not None or (categoria == 'transferencia' and CPF_PATTERN.search(full_text))
+
+        confidence = (
+            self.WEIGHTS['valor'] * valor_score
+            + self.WEIGHTS['categoria'] * categoria_score
+            + self.WEIGHTS['data'] * (data is not None)
+            + self.WEIGHTS['cnpj'] * bool(identified)
+            + self.WEIGHTS['instituicao'] * (instituicao is not None)
+        )
+        if categoria_score < 1.0 and categoria is not None:
+            # Mais de uma categoria casou: a escolha fica com o Bedrock, mesmo com os outros campos completos
+            confidence = min(confidence, self.confidence_threshold * 0.9)
+
+        categoria = categoria or 'outros'
+        instituicao = instituicao or 'N/A'
+        if categoria == 'transferencia':
+            descricao = f"Transferência para {instituicao}" if instituicao != 'N/A' else "Transferência"
+        else:
+            descricao = f"Compra em {instituicao}" if instituicao != 'N/A' else "Compra"
+
+        analysis = {
+            'valor': valor or '0.00',
+            'categoria': categoria,
+            'data': data or 'N/A',
+            'cnpj': cnpj or 'N/A',
+            'instituicao': instituicao,
+            'descricao': descricao[:100]
+        }
+        return analysis, round(confidence, 3)
+
+    def record(self, bypassed, estimated_tokens=0, estimated_seconds=0.0):
+        """Registra o resultado de uma tentativa de extração local"""
+        with self._lock:
+            self._stats['documents'] += 1
+            if bypassed:
+                self._stats['bypassed'] += 1
+                self._stats['estimated_tokens_saved'] += estimated_tokens
+                self._stats['estimated_seconds_saved'] += estimated_seconds
+
+    def get_stats(self):
+        """Retorna a taxa de desvio do Bedrock e a economia estimada"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['bypass_rate'] = round(stats['bypassed'] / stats['documents'], 3) if stats['documents'] else 0
+        stats['estimated_seconds_saved'] = round(stats['estimated_seconds_saved'], 2)
+        stats['confidence_threshold'] = self.confidence_threshold
+        return stats
+
+    @staticmethod
+    def _normalize(text):
+        """Maiúsculas sem acentos, para comparação com as palavras-chave"""
+        text = unicodedata.normalize('NFD', text.upper())
+        return ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+
+    @staticmethod
+    def _parse_amount(raw):
+        return float(raw.replace('.', '').replace(',', '.'))
+
+    def _find_amount(self, lines):
+        """
+        Procura o valor total, priorizando os rótulos mais confiáveis
+        (TOTAL A PAGAR, VALOR TOTAL, TOTAL) sobre VALOR PAGO, que inclui o troco
+
+        Returns:
+            tuple: (valor formatado ou None, pontuação entre 0 e 1)
+        """
+        candidates = []
+        for index, line in enumerate(lines):
+            keyword = TOTAL_KEYWORDS.search(line)
+            if not keyword or NON_TOTAL_LINE.search(line):
+                continue
+            priority = TOTAL_PRIORITY[' '.join(keyword.group(1).split())]
+            # O Textract costuma separar o rótulo e o valor em linhas consecutivas
+            following = lines[index + 1] if index + 1 < len(lines) and not NON_TOTAL_LINE.search(lines[index + 1]) else ''
+            for candidate_line in (line[keyword.end():], following):
+                match = AMOUNT_PATTERN.search(candidate_line)
+                if match:
+                    candidates.append((priority, self._parse_amount(match.group(1))))
+                    break
+
+        if candidates:
+            best = min(priority for priority, _ in candidates)
+            amounts = [amount for priority, amount in candidates if priority == best]
+            total = amounts[-1]
+            score = 1.0 if len(set(amounts)) == 1 else 0.5
+            return f"{total:.2f}", score
+
+        amounts = {
+            self._parse_amount(m.group(1))
+            for line in lines if 'R$' in line and not NON_TOTAL_LINE.search(line)
+            for m in AMOUNT_PATTERN.finditer(line)
+        }
+        if len(amounts) == 1:
+            return f"{amounts.pop():.2f}", 0.5
+        return None, 0.0
+
+    @staticmethod
+    def _find_category(lines):
+        """
+        Categoria pelas palavras-chave, ignorando forma de pagamento, tributos e troco
+
+        Returns:
+            tuple: (categoria ou None, pontuação: 1 se só uma categoria bate, 0.5 se mais de
+                uma; nesse caso extract mantém a confiança abaixo do limiar)
+        """
+        text = "\n".join(line for line in lines if not PAYMENT_LINE.search(line))
+        matches = [categoria for categoria, pattern in CATEGORY_PATTERNS if pattern.search(text)]
+        if not matches:
+            return None, 0.0
+        return matches[0], 1.0 if len(matches) == 1 else 0.5
+
+    @staticmethod
+    def _find_date(text):
+        today = datetime.now()
+        for day, month, year in DATE_PATTERN.findall(text):
+            year = int(year) + 2000 if len(year) == 2 else int(year)
+            try:
+                date = datetime(year, int(month), int(day))
+            except ValueError:
+                continue
+            if 2000 <= year and date <= today:
+                return date.strftime('%d/%m/%Y')
+        return None
+
+    @staticmethod
+    def _valid_cnpj(digits):
+        """Valida os dígitos verificadores de um CNPJ"""
+        if len(digits) != 14 or len(set(digits)) == 1:
+            return False
+
+        def check_digit(base, weights):
+            remainder = sum(int(d) * w for d, w in zip(base, weights)) % 11
+            return '0' if remainder < 2 else str(11 - remainder)
+
+        weights = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+        return (
+            digits[12] == check_digit(digits[:12], weights)
+            and digits[13] == check_digit(digits[:13], [6] + weights)
+        )
+
+    def _find_cnpj(self, text):
+        for match in CNPJ_PATTERN.finditer(text):
+            digits = ''.join(match.groups())
+            if self._valid_cnpj(digits):
+                return f"{digits[:2]}.{digits[2:5]}.{digits[5:8]}/{digits[8:12]}-{digits[12:]}"
+        return None
+
+    @staticmethod
+    def _is_name(line):
+        letters = sum(c.isalpha() for c in line)
+        return letters >= 3 and letters >= len(line) * 0.6
+
+    def _find_institution(self, lines, normalized, categoria):
+        """Nome do recebedor (transferências) ou do estabelecimento (primeiras linhas da nota)"""
+        if categoria == 'transferencia':
+            for index, line in enumerate(lines):
+                match = RECIPIENT_PATTERN.match(line)
+                if not match:
+                    continue
+                if match.group(1):
+                    name = match.group(1).strip()
+                else:
+                    # Rótulo sozinho na linha ("Destino", "Nome"): o nome vem na próxima linha que não é rótulo
+                    following = [
+                        lines[j] for j in range(index + 1, min(index + 3, len(lines)))
+                        if not RECIPIENT_PATTERN.match(lines[j])
+                    ]
+                    name = following[0] if following else ''
+                if self._is_name(name):
+                    return name[:100]
+
+        for line, upper in zip(lines[:5], normalized[:5]):
+            if self._is_name(line) and not any(word in upper for word in HEADER_STOPWORDS):
+                return line[:100]
+        return None
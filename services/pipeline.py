@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class StageGraph:
+    """
+    Grafo de estágios de processamento de um documento
+
+    Cada estágio é uma função que recebe o contexto (entradas iniciais mais as
+    saídas dos estágios já concluídos) e é iniciado assim que todas as suas
+    dependências terminam. Estágios independentes rodam ao mesmo tempo.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.stages = {}
+
+    def add_stage(self, name, func, depends_on=()):
+        """
+        Registra um estágio no grafo
+
+        Args:
+            name: Nome do estágio (também é a chave da sua saída no contexto)
+            func: Função que recebe o contexto e retorna a saída do estágio
+            depends_on: Nomes dos estágios cuja saída é necessária
+        """
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Estágio '{name}' depende de '{dependency}', que não foi registrado")
+        self.stages[name] = (func, tuple(depends_on))
+        return self
+
+    def run(self, initial_context=None):
+        """
+        Executa o grafo até que todos os estágios terminem
+
+        Args:
+            initial_context: Entradas disponíveis para todos os estágios
+
+        Returns:
+            tuple: (contexto com todas as saídas, tempos de cada estágio em segundos)
+        """
+        context = dict(initial_context or {})
+        timings = {}
+        pending = dict(self.stages)
+        running = {}
+        started_at = time.perf_counter()
+
+        def timed(name, func):
+            start = time.perf_counter()
+            try:
+                return func(context)
+            finally:
+                timings[name] = round(time.perf_counter() - start, 3)
+
+        try:
+            while pending or running:
+                ready = [
+                    name for name, (_, depends_on) in pending.items()
+                    if all(dependency in context for dependency in depends_on)
+                ]
+                for name in ready:
+                    func, _ = pending.pop(name)
+                    running[self.executor.submit(timed, name, func)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    context[name] = future.result()
+        except Exception:
+            for future in running:
+                future.cancel()
+            raise
+
+        timings['total'] = round(time.perf_counter() - started_at, 3)
+        return context, timings
@@ -0,0 +1,143 @@
+import math
+import re
+
+# Palavras, números e cada símbolo isolado, aproximando a segmentação do tokenizador
+TOKEN_PIECES = re.compile(r'[^\W\d_]+|\d+|[^\w\s]')
+
+TRUNCATION_MARKER = "\n[...]\n"
+OMITTED_LINE_TOKENS = 5  # Linha "(+N omitidos)"
+
+def estimate_tokens(text):
+    """
+    Estimativa de tokens de um texto, sem depender do tokenizador do modelo
+
+    Palavras contam ~1 token a cada 4 letras, números ~1 a cada 3 dígitos e
+    cada símbolo/pontuação conta 1 — mais fiel que len/4 para notas fiscais,
+    cheias de valores, CNPJs e separadores.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in TOKEN_PIECES.findall(text):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isalpha():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+def truncate_to_tokens(text, max_tokens, tail_ratio=0.4):
+    """
+    Corta um texto para caber em max_tokens, mantendo o início e o fim
+
+    O fim é preservado porque em notas e comprovantes o total e a forma de
+    pagamento costumam estar nas últimas linhas.
+
+    Returns:
+        str: Texto original, ou início + marcador + fim
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    # Proporção de caracteres que cabe no orçamento, com folga para o marcador
+    ratio = (max_tokens - estimate_tokens(TRUNCATION_MARKER)) / estimate_tokens(text)
+    keep = max(int(len(text) * ratio), 0)
+    tail = int(keep * tail_ratio)
+    head = keep - tail
+    truncated = text[:head] + TRUNCATION_MARKER + (text[-tail:] if tail else '')
+
+    # A proporção é aproximada: ajusta até caber
+    while estimate_tokens(truncated) > max_tokens and keep > 0:
+        keep = int(keep * 0.9)
+        tail = int(keep * tail_ratio)
+        head = keep - tail
+        truncated = text[:head] + TRUNCATION_MARKER + (text[-tail:] if tail else '')
+    return truncated
+
+def format_table(columns, rows):
+    """
+    Serialização tabular compacta (cabeçalho + uma linha por registro, separados por |)
+
+    Gasta bem menos tokens que JSON indentado, que repete as chaves em cada registro.
+    """
+    def cell(value):
+        if isinstance(value, float):
+            return f"{value:.2f}"
+        return str(value if value is not None else 'N/A').replace('|', '/').replace('\n', ' ')
+
+    lines = ['|'.join(columns)]
+    lines.extend('|'.join(cell(row.get(column)) for column in columns) for row in rows)
+    return '\n'.join(lines)
+
+class PromptBuilder:
+    """
+    Monta um prompt por seções respeitando um orçamento de tokens
+
+    Seções obrigatórias entram sempre. As demais são cortadas por prioridade
+    (menor primeiro): seções de linhas perdem as últimas linhas, com um aviso
+    de quantas foram omitidas; seções de texto são removidas inteiras.
+    """
+
+    def __init__(self, token_budget):
+        self.token_budget = token_budget
+        self._sections = []
+
+    def add(self, text, priority=0, required=False):
+        """Adiciona um trecho fixo de texto"""
+        self._sections.append({'header': '', 'lines': [text], 'priority': priority,
+                               'required': required, 'splittable': False, 'footer': ''})
+        return self
+
+    def add_lines(self, header, lines, priority=0, footer='\n'):
+        """Adiciona uma seção cujas últimas linhas podem ser descartadas para caber no orçamento"""
+        self._sections.append({'header': header, 'lines': list(lines), 'priority': priority,
+                               'required': False, 'splittable': True, 'footer': footer})
+        return self
+
+    def build(self):
+        """
+        Returns:
+            tuple: (prompt, tokens estimados)
+        """
+        sections = self._sections
+        costs = [[estimate_tokens(line + '\n') for line in section['lines']] for section in sections]
+        fixed = [estimate_tokens(section['header'] + section['footer']) for section in sections]
+        kept = [len(section['lines']) for section in sections]
+        current = sum(fixed) + sum(sum(section_costs) for section_costs in costs)
+
+        # Corta primeiro as seções de menor prioridade; na mesma prioridade, as que vêm depois
+        order = sorted(
+            (i for i, section in enumerate(sections) if not section['required']),
+            key=lambda i: (sections[i]['priority'], -i)
+        )
+        for i in order:
+            if current <= self.token_budget:
+                break
+            if sections[i]['splittable']:
+                if kept[i]:
+                    current += OMITTED_LINE_TOKENS
+                while kept[i] and current > self.token_budget:
+                    kept[i] -= 1
+                    current -= costs[i][kept[i]]
+                if not kept[i]:
+                    current -= fixed[i] + OMITTED_LINE_TOKENS
+            else:
+                kept[i] = 0
+                current -= fixed[i] + sum(costs[i])
+
+        parts = []
+        for i, section in enumerate(sections):
+            if not kept[i]:
+                continue
+            lines = section['lines'][:kept[i]]
+            omitted = len(section['lines']) - kept[i]
+            if omitted:
+                lines.append(f"(+{omitted} omitidos)")
+            if section['splittable']:
+                parts.append(section['header'] + ''.join(line + '\n' for line in lines) + section['footer'])
+            else:
+                parts.append(''.join(lines))
+
+        prompt = ''.join(parts)
+        return prompt, estimate_tokens(prompt)
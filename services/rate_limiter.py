@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+import time
+
+# Códigos de erro que indicam limite de taxa do serviço
+THROTTLING_ERRORS = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded', 'SlowDown',
+    'LimitExceededException', 'ServiceQuotaExceededException'
+])
+
+# Chamadas por segundo de cada operação, abaixo das cotas padrão da conta
+# Sobrescreva com RATE_LIMIT_<OPERAÇÃO> (ex.: RATE_LIMIT_DETECT_DOCUMENT_TEXT=5); 0 desativa
+DEFAULT_RATE_LIMITS = {
+    'textract': {'DetectDocumentText': 5, 'AnalyzeDocument': 2},
+    'rekognition': {'DetectLabels': 10, 'DetectText': 10},
+    'bedrock-runtime': {'InvokeModel': 10, 'InvokeModelWithResponseStream': 10}
+}
+
+def is_throttling_error(error):
+    """Indica se uma exceção do boto3 é de limite de taxa"""
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+class TokenBucket:
+    """
+    Balde de tokens com taxa ajustada por AIMD
+
+    acquire() reserva um token e espera até ele estar disponível, de modo que
+    as chamadas acima da taxa ficam na fila em vez de falhar. Cada throttling
+    reduz a taxa pela metade (no máximo uma vez por segundo); cada sucesso a
+    aumenta em `increase`, até a taxa configurada.
+    """
+
+    def __init__(self, rate, increase=None, decrease=None, min_rate=None):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.increase = float(increase or os.getenv('RATE_LIMIT_INCREASE', 0.1))
+        self.decrease = float(decrease or os.getenv('RATE_LIMIT_DECREASE', 0.5))
+        self.min_rate = float(min_rate or os.getenv('RATE_LIMIT_MIN_TPS', 0.2))
+        self._tokens = max(self.rate, 1.0)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'waited': 0, 'wait_seconds': 0.0, 'throttled': 0, 'decreases': 0}
+
+    def _refill(self, now):
+        capacity = max(self.rate, 1.0)
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Reserva um token; retorna os segundos esperados"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            # Saldo negativo: reservas à frente na fila
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self._stats['requests'] += 1
+            if wait:
+                self._stats['waited'] += 1
+                self._stats['wait_seconds'] += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def on_throttle(self):
+        with self._lock:
+            self._stats['throttled'] += 1
+            now = time.monotonic()
+            # Throttlings de chamadas simultâneas contam como um só corte
+            if now - self._last_decrease < 1.0:
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            self._last_decrease = now
+            self._stats['decreases'] += 1
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rate'] = round(self.rate, 2)
+        stats['max_rate'] = self.max_rate
+        stats['wait_seconds'] = round(stats['wait_seconds'], 2)
+        return stats
+
+class RateLimiter:
+    """
+    Limitadores por operação de um cliente boto3
+
+    Registrado nos eventos do botocore, fica na frente de toda chamada do
+    cliente, inclusive das novas tentativas feitas pelo próprio botocore.
+    """
+
+    def __init__(self, service_name):
+        self.buckets = {}
+        for operation, default in DEFAULT_RATE_LIMITS.get(service_name, {}).items():
+            name = re.sub(r'(?<!^)(?=[A-Z])', '_', operation).upper()
+            rate = float(os.getenv(f'RATE_LIMIT_{name}', default))
+            if rate > 0:
+                self.buckets[operation] = TokenBucket(rate)
+
+    def attach(self, client):
+        events = client.meta.events
+        events.register('before-send', self._before_send)
+        events.register('needs-retry', self._needs_retry)
+        events.register('after-call', self._after_call)
+        return self
+
+    def _bucket(self, event_name):
+        return self.buckets.get(event_name.rsplit('.', 1)[-1])
+
+    def _before_send(self, event_name, **kwargs):
+        bucket = self._bucket(event_name)
+        if bucket:
+            bucket.acquire()
+        return None
+
+    def _needs_retry(self, event_name, response=None, **kwargs):
+        bucket = self._bucket(event_name)
+        if bucket and response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERRORS:
+            bucket.on_throttle()
+        return None
+
+    def _after_call(self, event_name, parsed=None, **kwargs):
+        bucket = self._bucket(event_name)
+        if bucket and parsed is not None and 'Error' not in parsed:
+            bucket.on_success()
+
+    def get_stats(self):
+        return {operation: bucket.get_stats() for operation, bucket in self.buckets.items()}
@@ -1,10 +1,63 @@
+import threading
+from services.rate_limiter import is_throttling_error
+
 class RekognitionService:
     def __init__(self, rekognition_client):
         self.client = rekognition_client
+        self.cache_version = 'detect_labels-v2'  # Alterar ao mudar o pós-processamento da resposta
+        self._stats_lock = threading.Lock()
+        self._stats = {'detect_labels_calls': 0, 'detect_text_calls': 0, 'skipped_pdf': 0, 'skipped_identified': 0, 'textract_lines_reused': 0}
     
-    def detect_logos(self, file_bytes):
-        """Detecta logos e marcas em imagens usando AWS Rekognition"""
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+    
+    def get_stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+    
+    def detect_logos(self, file_bytes, extracted_text=None):
+        """
+        Detecta logos e marcas em imagens usando AWS Rekognition
+        
+        Args:
+            file_bytes: Imagem (PDFs são ignorados: o Rekognition só aceita JPEG e PNG)
+            extracted_text: Texto do Textract; sem logos, as primeiras linhas dele são
+                usadas no lugar de uma chamada a detect_text
+        """
+        labels = self.detect_labels(file_bytes)
+        if labels or labels is None or extracted_text is not None:
+            return self.merge_text(labels, extracted_text or '')
+        
+        try:
+            text_response = self.detect_text(file_bytes)
+        except Exception as e:
+            return [{"name": f"Erro ao detectar: {str(e)}", "confidence": 0}]
+        if text_response:
+            # Pegar as primeiras linhas de texto (geralmente contém o nome da empresa)
+            return [{
+                'name': f"Texto detectado: {text['text'][:30]}...",
+                'confidence': text['confidence']
+            } for text in text_response[:3]]
+        
+        # Se nada foi encontrado
+        return [{"name": "Nenhuma logo ou marca detectada", "confidence": 0}]
+    
+    def detect_labels(self, file_bytes):
+        """
+        Logos ou, na falta deles, marcas entre as labels do detect_labels
+        
+        Não depende do texto extraído, então roda em paralelo com o Textract.
+        
+        Returns:
+            list: Logos/marcas (vazia se não houver), ou None para PDFs, que não são enviados
+        """
+        if bytes(file_bytes[:5]) == b'%PDF-':
+            self._count('skipped_pdf')
+            return None
+        
         try:
+            self._count('detect_labels_calls')
             response = self.client.detect_labels(
                 Image={'Bytes': file_bytes},
                 MaxLabels=20,
@@ -32,35 +85,40 @@ class RekognitionService:
                         'confidence': confidence
                     })
             
-            # Se encontrou logos específicos, retornar
-            if logos:
-                return logos
-            
-            # Se não encontrou logos mas encontrou marcas, retornar marcas
-            if brands:
-                return brands
-            
-            # Tentar detectar texto que pode conter nome da empresa
-            text_response = self.detect_text(file_bytes)
-            if text_response:
-                # Pegar as primeiras linhas de texto (geralmente contém o nome da empresa)
-                top_texts = text_response[:3]
-                if top_texts:
-                    return [{
-                        'name': f"Texto detectado: {text['text'][:30]}...",
-                        'confidence': text['confidence']
-                    } for text in top_texts]
-            
-            # Se nada foi encontrado
-            return [{"name": "Nenhuma logo ou marca detectada", "confidence": 0}]
+            # Logos específicos têm prioridade sobre marcas
+            return logos or brands
             
         except Exception as e:
             print(f"Erro no Rekognition: {str(e)}")
+            if is_throttling_error(e):
+                raise
             return [{"name": f"Erro ao detectar: {str(e)}", "confidence": 0}]
     
+    def merge_text(self, labels, extracted_text):
+        """
+        Completa o resultado de detect_labels com o texto do Textract
+        
+        Sem logos nem marcas, as primeiras linhas do texto (que costumam ter o
+        nome da empresa) substituem uma chamada a detect_text.
+        """
+        if labels is None:
+            return []
+        if labels:
+            return labels
+        
+        lines = [line.strip() for line in extracted_text.splitlines() if line.strip()]
+        if lines:
+            self._count('textract_lines_reused')
+            return [{
+                'name': f"Texto detectado: {line[:30]}...",
+                'confidence': None
+            } for line in lines[:3]]
+        return [{"name": "Nenhuma logo ou marca detectada", "confidence": 0}]
+    
     def detect_text(self, file_bytes):
         """Detecta texto em imagens"""
         try:
+            self._count('detect_text_calls')
             response = self.client.detect_text(
                 Image={'Bytes': file_bytes}
             )
@@ -76,6 +134,8 @@ class RekognitionService:
             return detected_text
         except Exception as e:
             print(f"Erro ao detectar texto: {str(e)}")
+            if is_throttling_error(e):
+                raise
             return []
     
     def analyze_document(self, file_bytes):
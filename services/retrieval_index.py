@@ -0,0 +1,130 @@
+import heapq
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Palavras sem valor de busca, comuns nas perguntas feitas ao assistente (sem acentos)
+STOPWORDS = frozenset('''
+    a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela para pra com sem
+    e ou que qual quais quanto quanta quantos quantas quando onde como meu minha meus minhas
+    eu me mim voce foi era sao ser estar tem tive tenho fiz mais menos muito pouco todo toda
+    todos todas esse essa este esta isso isto ano mes dia gastei gasto gastos gastar valor total
+    r reais
+'''.split())
+
+class RetrievalIndex:
+    """
+    Índice BM25 em memória sobre os registros de analyses
+
+    Indexa empresa, categoria, descrição e o início do texto extraído. O índice
+    é construído na primeira consulta e depois só recebe os registros novos
+    (id maior que o último indexado), quando a versão dos dados muda.
+    """
+
+    FIELDS = ['empresa', 'categoria', 'descricao', 'extracted_text', 'valor', 'data_documento']
+    # Termos de empresa, categoria e descrição contam mais que os do texto extraído
+    FIELD_WEIGHTS = {'empresa': 3, 'categoria': 2, 'descricao': 2, 'extracted_text': 1}
+    BATCH_SIZE = 2000
+
+    def __init__(self, database_service, k1=1.2, b=0.75, max_text_chars=None):
+        self.database = database_service
+        self.k1 = k1
+        self.b = b
+        self.max_text_chars = int(max_text_chars or os.getenv('AI_RETRIEVAL_MAX_TEXT_CHARS', 2000))
+        self._postings = defaultdict(dict)  # termo -> {id: frequência ponderada}
+        self._lengths = {}
+        self._total_length = 0
+        self._records = {}  # id -> resumo usado no prompt
+        self._last_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tokenize(text):
+        """Minúsculas, sem acentos e sem stopwords"""
+        text = unicodedata.normalize('NFKD', str(text).lower()).encode('ascii', 'ignore').decode('ascii')
+        return [token for token in TOKEN_PATTERN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+    def warm_up(self):
+        """Constrói o índice em segundo plano, para a primeira pergunta não esperar"""
+        thread = threading.Thread(target=self.refresh, name='retrieval-index', daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self):
+        """Indexa os registros gravados desde a última atualização"""
+        version = self.database.data_version
+        with self._lock:
+            if version == self._version:
+                return
+            while True:
+                rows = self.database.get_analyses_after(self._last_id, limit=self.BATCH_SIZE, fields=self.FIELDS)
+                for row in rows:
+                    self._add(row)
+                if len(rows) < self.BATCH_SIZE:
+                    break
+            self._version = version
+
+    def _add(self, row):
+        terms = Counter()
+        for field, weight in self.FIELD_WEIGHTS.items():
+            value = row.get(field) or ''
+            if field == 'extracted_text':
+                value = value[:self.max_text_chars]
+            for token in self.tokenize(value):
+                terms[token] += weight
+
+        record_id = row['id']
+        for term, frequency in terms.items():
+            self._postings[term][record_id] = frequency
+        length = sum(terms.values())
+        self._lengths[record_id] = length
+        self._total_length += length
+        self._records[record_id] = {
+            'id': record_id,
+            'empresa': row.get('empresa'),
+            'categoria': row.get('categoria'),
+            'descricao': row.get('descricao'),
+            'valor': row.get('valor'),
+            'data': row.get('data_documento')
+        }
+        self._last_id = max(self._last_id, record_id)
+
+    def search(self, query, limit=10):
+        """
+        Retorna os registros mais relevantes para a consulta
+
+        Returns:
+            list: Tuplas (resumo do registro, pontuação BM25), da maior para a menor
+        """
+        self.refresh()
+        terms = set(self.tokenize(query))
+
+        with self._lock:
+            count = len(self._lengths)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for record_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[record_id] / average_length)
+                    scores[record_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            # Empate na pontuação: o registro mais novo primeiro
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [(self._records[record_id], round(score, 4)) for record_id, score in ranked]
+
+    def get_stats(self):
+        with self._lock:
+            return {'documents': len(self._lengths), 'terms': len(self._postings), 'last_id': self._last_id}
@@ -0,0 +1,91 @@
+class TextractBlockGraph:
+    """
+    Blocos de uma resposta do Textract indexados por Id
+
+    Os relacionamentos (CHILD, VALUE) são resolvidos pelo índice, então
+    formulários e tabelas são montados em tempo linear no número de blocos.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.by_id = {block['Id']: block for block in blocks}
+
+    def related(self, block, relationship_type):
+        """Blocos ligados a `block` pelo tipo de relacionamento informado"""
+        for relationship in block.get('Relationships', []):
+            if relationship['Type'] == relationship_type:
+                for related_id in relationship['Ids']:
+                    related = self.by_id.get(related_id)
+                    if related is not None:
+                        yield related
+
+    def text(self, block):
+        """Texto das palavras filhas do bloco (caixas de seleção marcadas viram 'X')"""
+        words = []
+        for child in self.related(block, 'CHILD'):
+            if child['BlockType'] == 'WORD':
+                words.append(child['Text'])
+            elif child['BlockType'] == 'SELECTION_ELEMENT' and child.get('SelectionStatus') == 'SELECTED':
+                words.append('X')
+        return ' '.join(words)
+
+    def key_values(self):
+        """
+        Pares chave-valor dos formulários
+
+        Returns:
+            dict: Texto da chave -> texto do valor (chaves repetidas ficam com o último valor)
+        """
+        key_values = {}
+        for block in self.blocks:
+            if block['BlockType'] != 'KEY_VALUE_SET' or 'KEY' not in block.get('EntityTypes', []):
+                continue
+            key_text = self.text(block)
+            value_text = ' '.join(filter(None, (self.text(value) for value in self.related(block, 'VALUE'))))
+            if key_text and value_text:
+                key_values[key_text] = value_text
+        return key_values
+
+    def tables(self):
+        """
+        Tabelas do documento
+
+        Returns:
+            list: Uma lista de linhas por tabela; cada linha é uma lista de células (texto)
+        """
+        tables = []
+        for block in self.blocks:
+            if block['BlockType'] != 'TABLE':
+                continue
+            cells = {}
+            rows = columns = 0
+            for cell in self.related(block, 'CHILD'):
+                if cell['BlockType'] != 'CELL':
+                    continue
+                row, column = cell['RowIndex'], cell['ColumnIndex']
+                cells[(row, column)] = self.text(cell)
+                rows, columns = max(rows, row), max(columns, column)
+            if cells:
+                tables.append([
+                    [cells.get((row, column), '') for column in range(1, columns + 1)]
+                    for row in range(1, rows + 1)
+                ])
+        return tables
+
+
+def render_structured_data(structured_data):
+    """
+    Texto com campos e tabelas, no formato de linhas que o LocalExtractor e o prompt do Bedrock leem
+
+    Returns:
+        str: Seções CAMPOS/TABELA, ou '' se não houver dados
+    """
+    if not structured_data:
+        return ''
+    parts = []
+    key_values = structured_data.get('key_values') or {}
+    if key_values:
+        parts.append('CAMPOS:\n' + '\n'.join(f"{key}: {value}" for key, value in key_values.items()))
+    for number, table in enumerate(structured_data.get('tables') or [], 1):
+        parts.append(f"TABELA {number}:\n" + '\n'.join(' | '.join(row) for row in table))
+    return '\n\n'.join(parts)
@@ -1,66 +1,167 @@
+import io
+import os
+import time
+import random
+import hashlib
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from PyPDF2 import PdfReader, PdfWriter
+from services.rate_limiter import is_throttling_error
+from services.textract_blocks import TextractBlockGraph
+
+class PageExtractionError(RuntimeError):
+    """Páginas de um PDF falharam; as bem-sucedidas ficam no cache para a próxima tentativa"""
+
 class TextractService:
-    def __init__(self, textract_client):
+    def __init__(self, textract_client, cache_service=None, concurrency_limit=None):
         self.client = textract_client
+        self.cache_version = 'detect_document_text-v1'  # Alterar ao mudar o pós-processamento da resposta
+        self.structured_cache_version = 'analyze_document-v1'
+        self.cache = cache_service
+        self.concurrency_limit = concurrency_limit
+        # Novas tentativas por página só para erros que não são de limite de taxa (estes já têm as do botocore)
+        self.page_retries = int(os.getenv('TEXTRACT_PAGE_RETRIES', 2))
+        self.page_retry_delay = float(os.getenv('TEXTRACT_PAGE_RETRY_DELAY', 0.5))
+        # Pool compartilhado que limita o fan-out de páginas de todos os PDFs em processamento
+        self.page_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('TEXTRACT_PAGE_CONCURRENCY', 4)),
+            thread_name_prefix='textract-page'
+        )
     
-    def extract_text(self, file_bytes):
+    def extract_text(self, file_bytes, content_hash=None):
         """Extrai texto de documentos usando AWS Textract"""
         try:
-            response = self.client.detect_document_text(
-                Document={'Bytes': file_bytes}
-            )
+            if bytes(file_bytes[:5]) == b'%PDF-':
+                pages = self._split_pdf(file_bytes)
+                if pages:
+                    return self._extract_pages_text(pages, content_hash or hashlib.sha256(file_bytes).hexdigest())
             
-            text = ""
-            for block in response['Blocks']:
-                if block['BlockType'] == 'LINE':
-                    text += block['Text'] + "\n"
-            
-            return text
+            return self._detect_document_text(file_bytes)
         except Exception as e:
             print(f"Erro no Textract: {str(e)}")
+            # Limite de taxa esgotado ou páginas faltando: falhar o arquivo em vez de analisar texto vazio
+            if is_throttling_error(e) or isinstance(e, PageExtractionError):
+                raise
             return ""
     
+    def _detect_document_text(self, file_bytes):
+        """Chama detect_document_text e junta as linhas (LINE) do resultado"""
+        with self.concurrency_limit or contextlib.nullcontext():
+            response = self.client.detect_document_text(
+                Document={'Bytes': file_bytes}
+            )
+        
+        text = ""
+        for block in response['Blocks']:
+            if block['BlockType'] == 'LINE':
+                text += block['Text'] + "\n"
+        
+        return text
+    
+    def _split_pdf(self, file_bytes, max_pages=None):
+        """
+        Divide um PDF em documentos de uma página cada usando PyPDF2
+        
+        Args:
+            max_pages: Reescreve só as primeiras páginas (None: todas)
+        
+        Returns:
+            list: Bytes de cada página, ou [] se o PDF tiver uma página só (ou não
+                puder ser lido) e deve ser enviado inteiro
+        """
+        try:
+            reader = PdfReader(io.BytesIO(file_bytes))
+            if len(reader.pages) <= 1:
+                return []
+            pages = []
+            for page in reader.pages[:max_pages]:
+                writer = PdfWriter()
+                writer.add_page(page)
+                output = io.BytesIO()
+                writer.write(output)
+                pages.append(output.getvalue())
+            return pages
+        except Exception as e:
+            # PDF criptografado ou malformado: enviar o documento inteiro ao Textract
+            print(f"Não foi possível dividir o PDF em páginas: {str(e)}")
+            return []
+    
+    def _extract_pages_text(self, pages, content_hash):
+        """Extrai o texto das páginas em paralelo e junta na ordem original"""
+        futures = [
+            self.page_executor.submit(self._extract_page_text, page_bytes, content_hash, number)
+            for number, page_bytes in enumerate(pages, 1)
+        ]
+        
+        texts = []
+        failed = []
+        throttled = None
+        for number, future in enumerate(futures, 1):
+            try:
+                texts.append(future.result())
+            except Exception as e:
+                print(f"Erro no Textract (página {number}): {str(e)}")
+                failed.append(number)
+                if is_throttling_error(e):
+                    throttled = e
+        
+        if throttled:
+            raise throttled
+        if failed:
+            # Páginas bem-sucedidas ficam no cache; um novo envio reprocessa só as que falharam
+            raise PageExtractionError(f"Falha ao extrair texto das páginas {failed} de {len(pages)}")
+        
+        print(f"✓ Textract: {len(pages)} páginas processadas")
+        return "".join(texts)
+    
+    def _extract_page_text(self, page_bytes, content_hash, number):
+        """Extrai o texto de uma página, usando o cache por página e novas tentativas"""
+        page_key = f"{content_hash}:{number}"
+        if self.cache:
+            cached = self.cache.get(page_key, 'textract_page', self.cache_version)
+            if cached is not None:
+                return cached
+        
+        for attempt in range(self.page_retries + 1):
+            try:
+                text = self._detect_document_text(page_bytes)
+                break
+            except Exception as e:
+                if attempt == self.page_retries or is_throttling_error(e):
+                    raise
+                # Backoff exponencial com jitter antes de tentar a página de novo
+                time.sleep(random.uniform(0, self.page_retry_delay * 2 ** attempt))
+        
+        if self.cache:
+            self.cache.set(page_key, 'textract_page', self.cache_version, text)
+        return text
+    
     def extract_structured_data(self, file_bytes):
-        """Extrai dados estruturados como tabelas e formulários"""
+        """
+        Extrai dados estruturados como tabelas e formulários
+        
+        Usa analyze_document (FORMS e TABLES), cobrado bem acima de
+        detect_document_text; em PDFs com várias páginas só a primeira é analisada.
+        
+        Returns:
+            dict: {'key_values': {chave: valor}, 'tables': [[[célula, ...], ...], ...]}
+        """
         try:
-            response = self.client.analyze_document(
-                Document={'Bytes': file_bytes},
-                FeatureTypes=['TABLES', 'FORMS']
-            )
+            if bytes(file_bytes[:5]) == b'%PDF-':
+                pages = self._split_pdf(file_bytes, max_pages=1)
+                if pages:
+                    file_bytes = pages[0]
             
-            # Extrair key-value pairs
-            key_values = {}
-            for block in response.get('Blocks', []):
-                if block['BlockType'] == 'KEY_VALUE_SET':
-                    if 'KEY' in block.get('EntityTypes', []):
-                        key_text = self._get_text_from_block(block, response['Blocks'])
-                        value_text = self._get_value_from_key(block, response['Blocks'])
-                        if key_text and value_text:
-                            key_values[key_text] = value_text
+            with self.concurrency_limit or contextlib.nullcontext():
+                response = self.client.analyze_document(
+                    Document={'Bytes': file_bytes},
+                    FeatureTypes=['TABLES', 'FORMS']
+                )
             
-            return key_values
+            graph = TextractBlockGraph(response.get('Blocks', []))
+            return {'key_values': graph.key_values(), 'tables': graph.tables()}
         except Exception as e:
             print(f"Erro ao extrair dados estruturados: {str(e)}")
-            return {}
-    
-    def _get_text_from_block(self, block, all_blocks):
-        """Extrai texto de um bloco"""
-        text = ""
-        if 'Relationships' in block:
-            for relationship in block['Relationships']:
-                if relationship['Type'] == 'CHILD':
-                    for child_id in relationship['Ids']:
-                        child_block = next((b for b in all_blocks if b['Id'] == child_id), None)
-                        if child_block and child_block['BlockType'] == 'WORD':
-                            text += child_block['Text'] + " "
-        return text.strip()
-    
-    def _get_value_from_key(self, key_block, all_blocks):
-        """Obtém o valor associado a uma chave"""
-        if 'Relationships' in key_block:
-            for relationship in key_block['Relationships']:
-                if relationship['Type'] == 'VALUE':
-                    for value_id in relationship['Ids']:
-                        value_block = next((b for b in all_blocks if b['Id'] == value_id), None)
-                        if value_block:
-                            return self._get_text_from_block(value_block, all_blocks)
-        return ""
+            if is_throttling_error(e):
+                raise
+            return {'key_values': {}, 'tables': []}
@@ -0,0 +1,144 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+
+class UploadBuffer:
+    """
+    Conteúdo de um arquivo enviado, lido uma única vez
+
+    Arquivos até o limite ficam em um bytearray pré-alocado; acima dele vão para
+    um arquivo temporário com nome único e são lidos via mmap. Em ambos os casos
+    data() devolve sempre o mesmo buffer, compartilhado por todos os estágios.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, filename, data=None, path=None):
+        self.filename = filename
+        self.path = path
+        self._data = data
+        self._file = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_stream(cls, stream, filename, spool_dir, max_memory_bytes):
+        """
+        Cria o buffer a partir do stream do upload (ex.: FileStorage.stream)
+
+        Args:
+            stream: Objeto com read(); se for posicionável, o tamanho é conhecido antes da leitura
+            filename: Nome do arquivo (já sanitizado)
+            spool_dir: Diretório para arquivos acima do limite
+            max_memory_bytes: Tamanho máximo mantido em memória
+        """
+        size = cls._stream_size(stream)
+
+        if size is not None and size <= max_memory_bytes:
+            # Leitura direta para um buffer do tamanho exato, sem realocações
+            buffer = bytearray(size)
+            view = memoryview(buffer)
+            position = 0
+            while position < size:
+                chunk = stream.read(min(cls.CHUNK_SIZE, size - position))
+                if not chunk:
+                    break
+                view[position:position + len(chunk)] = chunk
+                position += len(chunk)
+            view.release()
+            del buffer[position:]
+            return cls(filename, data=buffer)
+
+        buffer = bytearray()
+        if size is None:
+            while len(buffer) <= max_memory_bytes:
+                chunk = stream.read(cls.CHUNK_SIZE)
+                if not chunk:
+                    return cls(filename, data=buffer)
+                buffer += chunk
+
+        os.makedirs(spool_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix='upload_', suffix=os.path.splitext(filename)[1], dir=spool_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(buffer)
+            del buffer
+            shutil.copyfileobj(stream, f, cls.CHUNK_SIZE)
+        return cls(filename, path=path)
+
+    @classmethod
+    def from_path(cls, path, filename):
+        """Cria o buffer para um arquivo já gravado em disco (ex.: job retomado)"""
+        return cls(filename, path=path)
+
+    @staticmethod
+    def _stream_size(stream):
+        """Tamanho restante do stream, ou None se não for posicionável"""
+        try:
+            start = stream.tell()
+            stream.seek(0, io.SEEK_END)
+            size = stream.tell() - start
+            stream.seek(start)
+            return size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+
+    def spool(self, spool_dir):
+        """
+        Grava em disco um buffer mantido em memória e libera a memória
+
+        Usado ao enfileirar jobs com JOB_SPOOL_UPLOADS: o arquivo sobrevive a
+        um reinício e a fila de espera não segura os uploads em memória.
+        """
+        with self._lock:
+            if self.path is not None:
+                return self.path
+            os.makedirs(spool_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix='upload_', suffix=os.path.splitext(self.filename)[1], dir=spool_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._data)
+            self.path = path
+            self._data = None
+            return path
+    
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def data(self):
+        """
+        Retorna o conteúdo como objeto compatível com o protocolo de buffer
+
+        Returns:
+            bytearray (em memória) ou mmap somente leitura (em disco)
+        """
+        with self._lock:
+            if self._data is None:
+                if os.path.getsize(self.path) == 0:
+                    # mmap não aceita arquivos vazios
+                    self._data = bytearray()
+                else:
+                    self._file = open(self.path, 'rb')
+                    try:
+                        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                    except Exception:
+                        self._file.close()
+                        self._file = None
+                        raise
+            return self._data
+
+    def close(self):
+        """Libera o buffer e remove o arquivo temporário, se houver"""
+        with self._lock:
+            if isinstance(self._data, mmap.mmap):
+                self._data.close()
+            self._data = None
+            if self._file:
+                self._file.close()
+                self._file = None
+            if self.path and os.path.exists(self.path):
+                try:
+                    os.remove(self.path)
+                except Exception as e:
+                    print(f"Erro ao remover arquivo {self.path}: {str(e)}")
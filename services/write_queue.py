@@ -0,0 +1,110 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class WriteQueue:
+    """
+    Gravador único com group commit
+
+    Os lotes enviados por várias threads entram em uma fila; uma única thread
+    junta tudo o que estiver pendente e chama write_batch uma vez, de modo que
+    requisições concorrentes compartilham a mesma transação e o mesmo fsync.
+    """
+
+    _STOP = object()
+
+    def __init__(self, write_batch, max_rows=None, max_delay_ms=None):
+        """
+        Args:
+            write_batch: Função que recebe uma lista de linhas, grava em uma transação
+                e devolve um resultado por linha (ex.: IDs inseridos)
+            max_rows: Máximo de linhas por transação
+            max_delay_ms: Espera opcional por mais lotes antes de gravar
+        """
+        self.write_batch = write_batch
+        self.max_rows = int(max_rows or os.getenv('DB_WRITE_BATCH_MAX_ROWS', 5000))
+        self.max_delay = float(max_delay_ms or os.getenv('DB_WRITE_BATCH_DELAY_MS', 0)) / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {'transactions': 0, 'rows': 0, 'requests': 0}
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows):
+        """
+        Enfileira linhas para gravação
+
+        Returns:
+            Future: Resolvida com a lista de resultados das linhas (na mesma ordem)
+        """
+        future = Future()
+        self._queue.put((list(rows), future))
+        return future
+
+    def get_stats(self):
+        """Retorna o total de transações e a média de linhas/requisições por commit"""
+        with self._lock:
+            stats = dict(self._stats)
+        transactions = stats['transactions']
+        stats['rows_per_transaction'] = round(stats['rows'] / transactions, 2) if transactions else 0
+        stats['requests_per_transaction'] = round(stats['requests'] / transactions, 2) if transactions else 0
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        """Grava o que estiver pendente e encerra a thread"""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+
+            group = [item]
+            row_count = len(item[0])
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while row_count < self.max_rows:
+                try:
+                    timeout = deadline - time.monotonic()
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                group.append(item)
+                row_count += len(item[0])
+
+            self._write_group(group)
+            if stop:
+                return
+
+    def _write_group(self, group):
+        """Grava um grupo de lotes em uma transação, com fallback por lote em caso de erro"""
+        rows = [row for batch, _ in group for row in batch]
+        try:
+            results = self.write_batch(rows)
+        except Exception as e:
+            if len(group) == 1:
+                group[0][1].set_exception(e)
+                return
+            # Um lote inválido não deve derrubar os demais do grupo
+            for batch in group:
+                self._write_group([batch])
+            return
+
+        with self._lock:
+            self._stats['transactions'] += 1
+            self._stats['rows'] += len(rows)
+            self._stats['requests'] += len(group)
+
+        position = 0
+        for batch, future in group:
+            future.set_result(results[position:position + len(batch)])
+            position += len(batch)
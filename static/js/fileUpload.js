@@ -95,6 +95,7 @@ class FileUploadManager {
         this.processBtn.disabled = true;
         this.loading.style.display = 'block';
         this.results.style.display = 'none';
+        this.setLoadingMessage('Enviando seus documentos...');
 
         try {
             const response = await fetch(API_ENDPOINTS.process, {
@@ -105,7 +106,8 @@ class FileUploadManager {
             const data = await response.json();
             
             if (data.success) {
-                this.displayResults(data);
+                const result = await this.waitForJob(data);
+                this.displayResults(result);
             } else {
                 this.showError(data.error || 'Erro desconhecido ao processar arquivos');
             }
@@ -117,6 +119,88 @@ class FileUploadManager {
         }
     }
 
+    /**
+     * Acompanha o job de processamento via Server-Sent Events
+     * (com polling como alternativa) até sua conclusão
+     * @param {Object} job - Resposta de /process com job_id, status_url e events_url
+     * @returns {Promise<Object>} Resultado final do job
+     */
+    waitForJob(job) {
+        this.setLoadingMessage(`Processando 0 de ${job.total_arquivos} documento(s)...`);
+
+        if (!window.EventSource) {
+            return this.pollJob(job.status_url);
+        }
+
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(job.events_url);
+
+            source.addEventListener('file', e => {
+                const event = JSON.parse(e.data);
+                this.setLoadingMessage(`Processando ${event.processed} de ${event.total} documento(s)...`);
+            });
+
+            source.addEventListener('status', e => {
+                const event = JSON.parse(e.data);
+                if (event.job.status === 'completed') {
+                    source.close();
+                    resolve(event.job.result);
+                } else if (event.job.status === 'failed') {
+                    source.close();
+                    reject(new Error(event.job.error));
+                }
+            });
+
+            source.addEventListener('completed', e => {
+                source.close();
+                resolve(JSON.parse(e.data).result);
+            });
+
+            source.addEventListener('failed', e => {
+                source.close();
+                reject(new Error(JSON.parse(e.data).error));
+            });
+
+            source.onerror = () => {
+                // Conexão SSE perdida: continuar acompanhando por polling
+                source.close();
+                this.pollJob(job.status_url).then(resolve, reject);
+            };
+        });
+    }
+
+    /**
+     * Consulta o estado do job periodicamente até sua conclusão
+     * @param {string} statusUrl - URL de consulta do job
+     * @returns {Promise<Object>} Resultado final do job
+     */
+    async pollJob(statusUrl) {
+        while (true) {
+            const response = await fetch(statusUrl);
+            const data = await response.json();
+
+            if (!data.success) {
+                throw new Error(data.error || 'Erro ao consultar o processamento');
+            }
+
+            const job = data.job;
+            if (job.status === 'completed') return job.result;
+            if (job.status === 'failed') throw new Error(job.error);
+
+            this.setLoadingMessage(`Processando ${job.processed_files} de ${job.total_files} documento(s)...`);
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
+    /**
+     * Atualiza a mensagem exibida durante o processamento
+     * @param {string} message - Mensagem de progresso
+     */
+    setLoadingMessage(message) {
+        const element = document.getElementById('loadingMessage');
+        if (element) element.textContent = message;
+    }
+
     /**
      * Exibe os resultados do processamento
      * @param {Object} data - Dados retornados pela API
@@ -6,6 +6,13 @@ class HistoryPage {
     constructor() {
         this.analyses = [];
         this.statistics = {};
+        this.pageSize = 50;
+        this.nextCursor = null;
+        this.total = 0;
+        this.searchQuery = '';
+        this.searchOffset = 0;
+        this.searchTimer = null;
+        this.searchResults = [];
         this.donutChart = null;
         this.barChart = null;
         this.init();
@@ -19,12 +26,14 @@ class HistoryPage {
 
     async loadData() {
         try {
-            const response = await fetch('/api/history');
+            const response = await fetch(`/api/history?limit=${this.pageSize}`);
             const data = await response.json();
 
             if (data.success) {
                 this.analyses = data.analyses;
                 this.statistics = data.statistics;
+                this.nextCursor = data.next_cursor;
+                this.total = data.total;
 
                 this.updateSummaryCards();
                 this.renderCharts();
@@ -38,6 +47,28 @@ class HistoryPage {
         }
     }
 
+    async loadMore() {
+        if (this.searchQuery) {
+            await this.searchRecords(this.searchQuery, this.searchOffset);
+            return;
+        }
+        if (!this.nextCursor) return;
+
+        try {
+            const params = new URLSearchParams({ limit: this.pageSize, cursor: this.nextCursor });
+            const response = await fetch(`/api/history?${params}`);
+            const data = await response.json();
+
+            if (data.success) {
+                this.analyses = this.analyses.concat(data.analyses);
+                this.nextCursor = data.next_cursor;
+                this.renderTable();
+            }
+        } catch (error) {
+            console.error('Erro ao carregar mais registros:', error);
+        }
+    }
+
     updateSummaryCards() {
         document.getElementById('totalGasto').textContent =
             this.formatCurrency(this.statistics.total_gasto);
@@ -207,9 +238,20 @@ class HistoryPage {
 
         document.getElementById('tableContainer').style.display = 'block';
         document.getElementById('noData').style.display = 'none';
+        this.updatePagination(analyses.length);
+    }
+
+    updatePagination(shown) {
+        const hasMore = this.searchQuery ? this.searchOffset > 0 : Boolean(this.nextCursor);
+        document.getElementById('loadMoreBtn').style.display = hasMore ? 'inline-block' : 'none';
+        document.getElementById('paginationInfo').textContent = this.searchQuery
+            ? `${shown} resultado(s) para "${this.searchQuery}"`
+            : `Mostrando ${shown} de ${this.total} registros`;
+        document.getElementById('pagination').style.display = 'flex';
     }
 
     showNoData() {
+        document.getElementById('pagination').style.display = 'none';
         document.getElementById('tableContainer').style.display = 'none';
         document.getElementById('noData').style.display = 'block';
     }
@@ -222,6 +264,9 @@ class HistoryPage {
         document.getElementById('searchInput')
             .addEventListener('input', e => this.filterTable(e.target.value));
 
+        document.getElementById('loadMoreBtn')
+            .addEventListener('click', () => this.loadMore());
+
         document.getElementById('aiQueryBtn')
             .addEventListener('click', () => this.askAI());
 
@@ -232,14 +277,47 @@ class HistoryPage {
     }
 
     filterTable(query) {
-        const q = query.toLowerCase();
-        const filtered = this.analyses.filter(a =>
-            a.empresa.toLowerCase().includes(q) ||
-            a.categoria.toLowerCase().includes(q) ||
-            a.cnpj.toLowerCase().includes(q) ||
-            a.filename.toLowerCase().includes(q)
-        );
-        this.renderTable(filtered);
+        // A busca roda no servidor (índice de texto), com espera curta entre as teclas
+        clearTimeout(this.searchTimer);
+        this.searchTimer = setTimeout(() => {
+            this.searchQuery = query.trim();
+            this.searchOffset = 0;
+            if (this.searchQuery) {
+                this.searchRecords(this.searchQuery, 0);
+            } else {
+                this.renderTable();
+            }
+        }, 300);
+    }
+
+    async searchRecords(query, offset) {
+        try {
+            const response = await fetch('/api/search', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ query: query, limit: this.pageSize, offset: offset })
+            });
+            const data = await response.json();
+
+            // Ignorar respostas de buscas que já foram substituídas
+            if (!data.success || query !== this.searchQuery) return;
+
+            this.searchResults = offset > 0
+                ? this.searchResults.concat(data.results)
+                : data.results;
+            this.searchOffset = data.has_more ? offset + data.count : 0;
+
+            if (this.searchResults.length === 0) {
+                document.getElementById('tableBody').innerHTML = '';
+                this.updatePagination(0);
+                return;
+            }
+            this.renderTable(this.searchResults);
+        } catch (error) {
+            console.error('Erro na busca:', error);
+        }
     }
 
     /* =================================================
@@ -260,7 +338,7 @@ class HistoryPage {
         responseDiv.style.display = 'block';
 
         try {
-            const response = await fetch('/api/ai-query', {
+            const response = await fetch('/api/ai-query/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -268,32 +346,97 @@ class HistoryPage {
                 body: JSON.stringify({ query: query })
             });
 
-            const data = await response.json();
+            if (!response.ok || !response.body) {
+                await this.askAIWithoutStreaming(query, responseDiv);
+                return;
+            }
 
-            if (data.success) {
+            await this.readAIStream(response, responseDiv);
+        } catch (error) {
+            console.error('Erro ao consultar IA:', error);
+            this.showAIError(responseDiv, 'Erro ao processar sua pergunta. Tente novamente.');
+        }
+    }
+
+    async readAIStream(response, responseDiv) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let answerEl = null;
+
+        const handleEvent = event => {
+            if (event.type === 'context') {
+                // Estatísticas e busca chegam antes do primeiro token
+                const count = event.search_results.length;
                 responseDiv.innerHTML = `
                     <div class="ai-answer">
                         <strong>💡 Resposta do Assistente:</strong>
-                        <p>${data.answer.replace(/\n/g, '<br>')}</p>
-                    </div>
-                `;
-            } else {
-                responseDiv.innerHTML = `
-                    <div class="ai-error">
-                        ❌ Erro: ${data.error}
+                        <p class="ai-answer-text"></p>
+                        ${count ? `<small>🔎 ${count} registro(s) relacionado(s)</small>` : ''}
                     </div>
                 `;
+                answerEl = responseDiv.querySelector('.ai-answer-text');
+                answerEl.innerHTML = '🤔 Pensando...';
+            } else if (event.type === 'token') {
+                answer += event.text;
+                answerEl.innerHTML = answer.replace(/\n/g, '<br>');
+            } else if (event.type === 'done') {
+                answerEl.innerHTML = event.answer.replace(/\n/g, '<br>');
+            } else if (event.type === 'error') {
+                this.showAIError(responseDiv, event.error);
             }
-        } catch (error) {
-            console.error('Erro ao consultar IA:', error);
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const messages = buffer.split('\n\n');
+            buffer = messages.pop();
+
+            messages.forEach(message => {
+                const data = message.split('\n')
+                    .filter(line => line.startsWith('data: '))
+                    .map(line => line.slice(6))
+                    .join('\n');
+                if (data) handleEvent(JSON.parse(data));
+            });
+        }
+    }
+
+    async askAIWithoutStreaming(query, responseDiv) {
+        const response = await fetch('/api/ai-query', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ query: query })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
             responseDiv.innerHTML = `
-                <div class="ai-error">
-                    ❌ Erro ao processar sua pergunta. Tente novamente.
+                <div class="ai-answer">
+                    <strong>💡 Resposta do Assistente:</strong>
+                    <p>${data.answer.replace(/\n/g, '<br>')}</p>
                 </div>
             `;
+        } else {
+            this.showAIError(responseDiv, `Erro: ${data.error}`);
         }
     }
 
+    showAIError(responseDiv, message) {
+        responseDiv.innerHTML = `
+            <div class="ai-error">
+                ❌ ${message}
+            </div>
+        `;
+    }
+
     /* =================================================
        UTILITÁRIOS
     ================================================= */
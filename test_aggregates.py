@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Testes das tabelas de totais por categoria e por mês mantidas por triggers
+"""
+
+import os
+import sys
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+
+def temp_db_path():
+    return os.path.join(tempfile.mkdtemp(), 'expenses.db')
+
+def result(filename, valor, categoria, data='15/01/2025', empresa='Loja'):
+    return {
+        'success': True,
+        'filename': filename,
+        'analysis': {'valor': valor, 'categoria': categoria, 'data': data, 'cnpj': 'N/A', 'empresa': empresa},
+        'extracted_text': f"{empresa} TOTAL {valor}",
+        'logos': []
+    }
+
+def test_aggregates_follow_inserts_updates_and_deletes():
+    db = DatabaseService(temp_db_path())
+    ids = db.save_analyses([
+        result('a.pdf', 10.0, 'saude', data='05/01/2025'),
+        result('b.pdf', 25.5, 'saude', data='20/01/2025'),
+        result('c.pdf', 40.0, 'lazer', data='03/02/2025'),
+    ])
+    stats = db.get_statistics()
+    assert stats['total_gasto'] == 75.5
+    assert stats['categorias']['saude'] == {'valor': 35.5, 'percentual': 47.02, 'count': 2}
+    assert db.get_period_totals('month')['2025-01']['total'] == 35.5
+
+    with db.pool.connection() as conn:
+        conn.execute("UPDATE analyses SET categoria = 'lazer' WHERE id = ?", (ids[0],))
+        conn.execute('DELETE FROM analyses WHERE id = ?', (ids[1],))
+        conn.commit()
+
+    assert db.check_aggregates()['consistent']
+    stats = db.get_statistics()
+    # Categoria sem registros some da tabela de totais
+    assert set(stats['categorias']) == {'lazer'}
+    assert stats['categorias']['lazer']['count'] == 2
+    assert db.get_period_totals('month')['2025-01'] == {'total': 10.0, 'count': 1, 'categorias': {'lazer': 10.0}}
+    db.close()
+
+def test_check_aggregates_detects_and_repairs_drift():
+    db = DatabaseService(temp_db_path())
+    db.save_analyses([result('a.pdf', 10.0, 'saude')])
+    with db.pool.connection() as conn:
+        conn.execute("UPDATE category_totals SET total = 99 WHERE categoria = 'saude'")
+        conn.commit()
+
+    report = db.check_aggregates(repair=True)
+    assert not report['consistent'] and report['repaired']
+    assert report['differences'][0]['key'] == 'saude'
+    assert db.check_aggregates()['consistent']
+    assert db.get_statistics()['total_gasto'] == 10.0
+    db.close()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Testes do agente de IA: contexto montado a partir dos totais do banco e cache de respostas
+"""
+
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.ai_agent_service import AIAgentService, RECORD_COLUMNS
+from services.database_service import DatabaseService
+from services.prompt_budget import estimate_tokens
+
+class FakeBedrock:
+    """Cliente do Bedrock que responde com um texto numerado e conta as chamadas"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke_model(self, modelId, body):
+        self.calls += 1
+        payload = {'content': [{'text': f"resposta {self.calls}"}]}
+        return {'body': io.BytesIO(json.dumps(payload).encode('utf-8'))}
+
+def result(filename, valor, categoria, data):
+    return {
+        'success': True,
+        'filename': filename,
+        'analysis': {'valor': valor, 'categoria': categoria, 'data': data, 'cnpj': 'N/A', 'empresa': f"Empresa {filename}"},
+        'extracted_text': 'texto que não deve ir para o contexto',
+        'logos': []
+    }
+
+def make_agent(results):
+    db = DatabaseService(os.path.join(tempfile.mkdtemp(), 'expenses.db'))
+    db.save_analyses(results)
+    return AIAgentService(FakeBedrock(), db), db
+
+SAMPLE = [
+    result('a.pdf', 10.0, 'saude', '05/01/2024'),
+    result('b.pdf', 20.0, 'lazer', '10/06/2024'),
+    result('c.pdf', 30.0, 'saude', '15/02/2025'),
+    result('d.pdf', 5.5, 'saude', '20/03/2025'),
+    result('e.pdf', 7.0, 'outros', 'N/A'),
+]
+
+def test_context_rollups_match_the_records():
+    agent, db = make_agent(SAMPLE)
+    context = agent._prepare_context(db.get_statistics())
+
+    assert context['total_gasto'] == 72.5
+    assert context['total_arquivos'] == 5
+    assert set(context['categorias']) == {'saude', 'lazer', 'outros'}
+
+    # Os totais por ano lidos de monthly_totals batem com a soma dos registros
+    expected = defaultdict(lambda: defaultdict(float))
+    for row in db.get_all_analyses():
+        if row['document_date']:
+            expected[row['document_date'][:4]][row['categoria']] += row['valor']
+    assert {year: dict(data['categorias']) for year, data in context['gastos_por_ano'].items()} == \
+        {year: dict(categories) for year, categories in expected.items()}
+    assert context['gastos_por_ano']['2025'] == {'total': 35.5, 'count': 2, 'categorias': {'saude': 35.5}}
+    db.close()
+
+def test_context_keeps_only_recent_records_without_text():
+    results = [result(f"doc{number}.pdf", number, 'outros', '01/01/2025') for number in range(30)]
+    agent, db = make_agent(results)
+    recent = agent._prepare_context(db.get_statistics())['ultimos_registros']
+
+    assert len(recent) == AIAgentService.RECENT_RECORDS
+    assert recent[0]['empresa'] == 'Empresa doc29.pdf'
+    assert all(set(record) == set(RECORD_COLUMNS) for record in recent)
+    db.close()
+
+def test_prompt_prefix_fits_the_token_budget():
+    results = [result(f"doc{number}.pdf", number, 'outros', f"01/01/{2000 + number % 25}") for number in range(60)]
+    agent, db = make_agent(results)
+    agent.context_token_budget = 250
+    _, prefix = agent._get_prompt_prefix(db.data_version)
+
+    assert estimate_tokens(prefix) <= 250
+    # Os dados gerais sempre entram; os registros recentes são os primeiros a sair
+    assert 'Total de arquivos: 60' in prefix
+    assert 'Empresa doc59.pdf' not in prefix
+    db.close()
+
+def test_repeated_question_is_answered_from_cache():
+    agent, db = make_agent(SAMPLE)
+    first = agent.query('Quanto gastei com saúde?')
+    # Mesma pergunta com outra grafia: sem nova chamada ao Bedrock
+    second = agent.query('  quanto gastei com SAUDE ')
+
+    assert second is first
+    assert agent.bedrock.client.calls == 1
+    stats = agent.get_stats()
+    assert (stats['answer_hits'], stats['answer_misses']) == (1, 1)
+    db.close()
+
+def test_new_records_invalidate_answers_and_context():
+    agent, db = make_agent(SAMPLE)
+    agent.query('Quanto gastei?')
+    db.save_analyses([result('f.pdf', 100.0, 'lazer', '01/04/2025')])
+    answer = agent.query('Quanto gastei?')
+
+    assert answer['answer'] == 'resposta 2'
+    assert answer['statistics']['total_arquivos'] == 6
+    stats = agent.get_stats()
+    assert (stats['context_hits'], stats['context_misses']) == (0, 2)
+    db.close()
+
+def test_answers_expire_after_ttl():
+    agent, db = make_agent(SAMPLE)
+    agent.answer_ttl = 0.05
+    agent.query('Quanto gastei?')
+    time.sleep(0.1)
+    agent.query('Quanto gastei?')
+
+    assert agent.bedrock.client.calls == 2
+    # O contexto não expira: os dados não mudaram
+    assert agent.get_stats()['context_hits'] == 1
+    db.close()
+
+def test_answer_cache_evicts_least_recently_used():
+    agent, db = make_agent(SAMPLE)
+    agent.answer_cache_size = 2
+    agent.query('pergunta a')
+    agent.query('pergunta b')
+    agent.query('pergunta a')  # 'b' passa a ser a menos usada
+    agent.query('pergunta c')
+
+    assert agent.get_stats()['cached_answers'] == 2
+    calls = agent.bedrock.client.calls
+    agent.query('pergunta a')
+    assert agent.bedrock.client.calls == calls
+    agent.query('pergunta b')
+    assert agent.bedrock.client.calls == calls + 1
+    db.close()
+
+def test_failed_answers_are_not_cached():
+    agent, db = make_agent(SAMPLE)
+    invoke_model = agent.bedrock.client.invoke_model
+
+    def fail_once(modelId, body):
+        agent.bedrock.client.invoke_model = invoke_model
+        raise RuntimeError('ThrottlingException')
+
+    agent.bedrock.client.invoke_model = fail_once
+    assert 'ThrottlingException' in agent.query('Quanto gastei?')['answer']
+    assert agent.query('Quanto gastei?')['answer'] == 'resposta 1'
+    db.close()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de resultados por estágio: acertos, versões e limpeza
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.cache_service import CacheService
+
+def make_cache(**kwargs):
+    """Cache em um diretório temporário próprio do teste"""
+    return CacheService(os.path.join(tempfile.mkdtemp(), 'cache.db'), **kwargs)
+
+def test_hit_and_miss_are_counted_per_stage():
+    cache = make_cache()
+    assert cache.get('hash', 'extracted_text', 'v1') is None
+    cache.set('hash', 'extracted_text', 'v1', 'TOTAL R$ 10,00')
+    assert cache.get('hash', 'extracted_text', 'v1') == 'TOTAL R$ 10,00'
+    # contains não altera os contadores
+    assert cache.contains('hash', 'extracted_text', 'v1')
+
+    stats = cache.get_stats()
+    assert stats['stages'] == {'extracted_text': {'hits': 1, 'misses': 1}}
+    assert stats['hit_rate'] == 0.5
+    assert stats['entries'] == 1
+    cache.pool.close_all()
+
+def test_values_round_trip_as_json():
+    cache = make_cache()
+    logos = [{'name': 'Logo', 'confidence': 97.5}]
+    cache.set('hash', 'labels', 'v1', logos)
+    cache.set('hash', 'empty', 'v1', [])
+    assert cache.get('hash', 'labels', 'v1') == logos
+    # Lista vazia é um resultado válido, diferente de "não está no cache"
+    assert cache.get('hash', 'empty', 'v1') == []
+    cache.pool.close_all()
+
+def test_new_version_invalidates_only_that_stage():
+    cache = make_cache()
+    cache.set('hash', 'extracted_text', 'v1', 'texto')
+    cache.set('hash', 'analysis', 'v1', {'valor': '10.00'})
+
+    assert cache.get('hash', 'analysis', 'v2') is None
+    assert cache.get('hash', 'extracted_text', 'v1') == 'texto'
+    assert cache.get('outro', 'extracted_text', 'v1') is None
+    cache.pool.close_all()
+
+def test_expired_entries_are_ignored_and_evicted():
+    # 0,05 s de validade
+    cache = make_cache(max_age_days=0.05 / 86400)
+    cache.set('hash', 'extracted_text', 'v1', 'texto')
+    time.sleep(0.1)
+
+    assert cache.get('hash', 'extracted_text', 'v1') is None
+    assert not cache.contains('hash', 'extracted_text', 'v1')
+    cache._evict()
+    assert cache.get_stats()['entries'] == 0
+    cache.pool.close_all()
+
+def test_size_limit_evicts_least_recently_used():
+    # Cabem duas entradas de ~200 bytes, não três
+    cache = make_cache(max_size_mb=500 / (1024 * 1024))
+    cache.ACCESS_UPDATE_INTERVAL = 0
+    for content_hash in ('a', 'b', 'c'):
+        cache.set(content_hash, 'extracted_text', 'v1', 'x' * 200)
+        time.sleep(0.01)
+    # Acessar 'a' faz de 'b' a entrada usada há mais tempo
+    assert cache.get('a', 'extracted_text', 'v1') is not None
+    cache._evict()
+
+    assert cache.contains('a', 'extracted_text', 'v1')
+    assert not cache.contains('b', 'extracted_text', 'v1')
+    assert cache.contains('c', 'extracted_text', 'v1')
+    cache.pool.close_all()
+
+def test_recent_hit_does_not_rewrite_last_access():
+    cache = make_cache()
+    cache.set('hash', 'extracted_text', 'v1', 'texto')
+
+    def last_access():
+        with cache.pool.connection() as conn:
+            return conn.execute('SELECT last_access FROM stage_cache').fetchone()[0]
+
+    stored = last_access()
+    time.sleep(0.01)
+    assert cache.get('hash', 'extracted_text', 'v1') == 'texto'
+    assert last_access() == stored
+
+    cache.ACCESS_UPDATE_INTERVAL = 0
+    cache.get('hash', 'extracted_text', 'v1')
+    assert last_access() > stored
+    cache.pool.close_all()
+
+def test_explicit_zero_size_is_not_the_default():
+    cache = make_cache(max_size_mb=0)
+    assert cache.max_size_bytes == 0
+    cache.set('hash', 'extracted_text', 'v1', 'texto')
+    cache._evict()
+    assert cache.get_stats()['entries'] == 0
+    cache.pool.close_all()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -71,6 +71,10 @@ def test_database():
         record_id = db.save_analysis(result)
         print(f"✓ Registro salvo: ID {record_id} - {result['filename']}")
     
+    record_ids = db.save_analyses(test_results)
+    assert len(record_ids) == len(test_results) and None not in record_ids
+    print(f"✓ Lote salvo em uma transação: IDs {record_ids}")
+    
     # Buscar todas as análises
     print("\n3. Buscando todas as análises...")
     analyses = db.get_all_analyses()
@@ -104,6 +108,7 @@ def test_database():
     
     # Limpar banco de teste
     print("\n6. Limpando banco de teste...")
+    db.close()
     if os.path.exists('data/test_expenses.db'):
         os.remove('data/test_expenses.db')
         print("✓ Banco de teste removido")
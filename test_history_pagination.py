@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Testes da paginação por cursor do histórico, com filtros e projeção de colunas
+"""
+
+import os
+import sys
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+
+def temp_db_path():
+    return os.path.join(tempfile.mkdtemp(), 'expenses.db')
+
+def result(filename, valor, categoria, data='15/01/2025', empresa='Loja'):
+    return {
+        'success': True,
+        'filename': filename,
+        'analysis': {'valor': valor, 'categoria': categoria, 'data': data, 'cnpj': 'N/A', 'empresa': empresa},
+        'extracted_text': f"{empresa} TOTAL {valor}",
+        'logos': []
+    }
+
+def test_cursor_pagination_boundaries():
+    db = DatabaseService(temp_db_path())
+    # Gravados no mesmo lote: created_at igual, a ordem é decidida pelo id
+    ids = db.save_analyses([result(f"doc{number}.pdf", number, 'outros') for number in range(1, 6)])
+
+    seen = []
+    page = db.get_analyses_page(limit=2)
+    assert page['total'] == 5
+    while True:
+        seen.extend(analysis['id'] for analysis in page['analyses'])
+        if not page['next_cursor']:
+            break
+        page = db.get_analyses_page(limit=2, cursor=page['next_cursor'])
+        # O total só vem na primeira página
+        assert page['total'] is None
+    assert seen == sorted(ids, reverse=True)
+
+    # Página exatamente do tamanho do resultado não tem próxima
+    page = db.get_analyses_page(limit=5)
+    assert len(page['analyses']) == 5 and page['next_cursor'] is None
+
+    empty = db.get_analyses_page(limit=2, categoria='saude')
+    assert empty == {'analyses': [], 'next_cursor': None, 'total': 0}
+
+    try:
+        db.get_analyses_page(cursor='invalido')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('cursor inválido foi aceito')
+    db.close()
+
+def test_pagination_filters_and_projection():
+    db = DatabaseService(temp_db_path())
+    db.save_analyses([
+        result('a.pdf', 10, 'saude', data='05/01/2025'),
+        result('b.pdf', 20, 'saude', data='05/02/2025'),
+        result('c.pdf', 30, 'lazer', data='05/02/2025'),
+    ])
+
+    page = db.get_analyses_page(categoria='saude', date_from='2025-02-01', fields=['filename', 'valor'])
+    assert page['analyses'] == [{'filename': 'b.pdf', 'valor': 20.0}]
+    assert page['total'] == 1
+    db.close()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Testes das migrações do esquema do banco a partir de uma instalação antiga
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+
+def temp_db_path():
+    return os.path.join(tempfile.mkdtemp(), 'expenses.db')
+
+def test_migrates_baseline_database():
+    # Esquema da versão 1 com dados, como em uma instalação antiga
+    path = temp_db_path()
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE analyses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            valor REAL NOT NULL,
+            categoria TEXT NOT NULL,
+            data_documento TEXT,
+            cnpj TEXT,
+            empresa TEXT,
+            extracted_text TEXT,
+            logos TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            total_files INTEGER NOT NULL,
+            processed_files INTEGER NOT NULL DEFAULT 0,
+            files TEXT NOT NULL,
+            results TEXT,
+            statistics TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        INSERT INTO analyses (filename, valor, categoria, data_documento, empresa)
+        VALUES ('mercado.pdf', 42.9, 'alimentacao', '15/01/2025', 'Supermercado Central'),
+               ('uber.pdf', 18.5, 'transporte', 'N/A', 'Uber');
+        PRAGMA user_version = 1;
+    ''')
+    conn.close()
+
+    db = DatabaseService(path)
+    with db.pool.connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == 7
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(analyses)')}
+        dates = dict(conn.execute('SELECT filename, document_date FROM analyses').fetchall())
+    assert {'document_date', 'descricao', 'job_id'} <= columns
+    assert dates == {'mercado.pdf': '2025-01-15', 'uber.pdf': None}
+
+    # Registros antigos entram no índice de busca e nas tabelas de totais
+    assert [row['filename'] for row in db.search_analyses('supermercado')] == ['mercado.pdf']
+    assert db.check_aggregates()['consistent']
+    assert db.get_statistics()['total_arquivos'] == 2
+    assert db.count_job_analyses('job-1') == 0
+    db.close()
+
+    # Reabrir não aplica as migrações de novo
+    db = DatabaseService(path)
+    assert db.get_statistics()['total_arquivos'] == 2
+    db.close()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Testes do grafo de estágios: ordem das dependências e propagação de erros
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.pipeline import StageGraph
+
+def test_stage_sees_outputs_of_its_dependencies():
+    events = []
+    lock = threading.Lock()
+
+    def stage(name, result):
+        def run(context):
+            with lock:
+                events.append(name)
+            return result(context)
+        return run
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        graph = StageGraph(executor)
+        graph.add_stage('image', stage('image', lambda context: context['file_bytes'].upper()))
+        graph.add_stage('text', stage('text', lambda context: context['image'] + b'-text'), depends_on=('image',))
+        graph.add_stage('labels', stage('labels', lambda context: context['image'] + b'-labels'), depends_on=('image',))
+        graph.add_stage('merge', stage('merge', lambda context: (context['text'], context['labels'])), depends_on=('text', 'labels'))
+        context, timings = graph.run({'file_bytes': b'abc'})
+
+    assert context['merge'] == (b'ABC-text', b'ABC-labels')
+    assert events[0] == 'image' and events[-1] == 'merge'
+    assert set(timings) == {'image', 'text', 'labels', 'merge', 'total'}
+
+def test_independent_stages_run_at_the_same_time():
+    # Os dois estágios só passam da barreira se estiverem rodando juntos
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_sibling(context):
+        barrier.wait()
+        return True
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        graph = StageGraph(executor)
+        graph.add_stage('text', wait_for_sibling)
+        graph.add_stage('labels', wait_for_sibling)
+        context, _ = graph.run()
+
+    assert context['text'] and context['labels']
+
+def test_error_propagates_and_dependents_do_not_run():
+    started = []
+
+    def fail(context):
+        raise RuntimeError('Textract indisponível')
+
+    def analysis(context):
+        started.append('analysis')
+        return {}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        graph = StageGraph(executor)
+        graph.add_stage('text', fail)
+        graph.add_stage('analysis', analysis, depends_on=('text',))
+        try:
+            graph.run()
+        except RuntimeError as e:
+            assert str(e) == 'Textract indisponível'
+        else:
+            raise AssertionError('erro do estágio não foi propagado')
+
+    assert started == []
+
+def test_unknown_dependency_is_rejected():
+    graph = StageGraph(executor=None)
+    try:
+        graph.add_stage('analysis', lambda context: None, depends_on=('text',))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('dependência não registrada foi aceita')
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Testes da busca textual (FTS5): montagem da consulta, acentos, prefixos e paginação
+"""
+
+import os
+import sys
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+
+def result(filename, empresa, categoria='alimentacao', text=''):
+    return {
+        'success': True,
+        'filename': filename,
+        'analysis': {'valor': 10.0, 'categoria': categoria, 'data': '15/01/2025', 'cnpj': '11.222.333/0001-81', 'empresa': empresa},
+        'extracted_text': text or f"{empresa} TOTAL R$ 10,00",
+        'logos': []
+    }
+
+def make_db():
+    db = DatabaseService(os.path.join(tempfile.mkdtemp(), 'expenses.db'))
+    db.save_analyses([
+        result('acai.pdf', 'Açaí do Pará'),
+        result('padaria.pdf', 'Padaria Pão Quente'),
+        result('posto.pdf', 'Posto Shell', categoria='transporte'),
+        result('operadores.pdf', 'Loja NOT AND OR', categoria='outros', text='cliente "especial" (vip)'),
+    ])
+    return db
+
+def filenames(results):
+    return [row['filename'] for row in results]
+
+def test_fts_query_quotes_terms_and_prefixes_only_the_last():
+    assert DatabaseService._fts_query('padaria pa') == '"padaria" "pa"'
+    assert DatabaseService._fts_query('padaria que') == '"padaria" "que"*'
+    # Aspas e operadores digitados viram texto literal; termos só com pontuação são descartados
+    assert DatabaseService._fts_query('a"b OR ( -') == '"a""b" "OR"'
+    assert DatabaseService._fts_query('uber posto', match_any=True) == '"uber" OR "posto"*'
+    assert DatabaseService._fts_query('  ( ) ') == ''
+
+def test_operators_and_quotes_in_input_do_not_break_the_query():
+    db = make_db()
+    assert filenames(db.search_analyses('NOT AND OR')) == ['operadores.pdf']
+    assert filenames(db.search_analyses('"especial')) == ['operadores.pdf']
+    assert filenames(db.search_analyses('(vip) cliente:')) == ['operadores.pdf']
+    assert db.search_analyses('* ( )') == []
+    db.close()
+
+def test_search_ignores_accents_and_case():
+    db = make_db()
+    assert filenames(db.search_analyses('acai para')) == ['acai.pdf']
+    assert filenames(db.search_analyses('PÃO')) == ['padaria.pdf']
+    db.close()
+
+def test_prefix_matching_on_last_term():
+    db = make_db()
+    assert filenames(db.search_analyses('padaria que')) == ['padaria.pdf']
+    # Termos anteriores precisam ser palavras inteiras
+    assert db.search_analyses('pad quente') == []
+    # Prefixos curtos demais não são expandidos
+    assert db.search_analyses('pa') == []
+    db.close()
+
+def test_match_any_needs_only_one_term():
+    db = make_db()
+    assert db.search_analyses('posto padaria') == []
+    assert sorted(filenames(db.search_analyses('posto padaria', match_any=True))) == ['padaria.pdf', 'posto.pdf']
+    db.close()
+
+def test_limit_offset_paging_is_stable():
+    db = DatabaseService(os.path.join(tempfile.mkdtemp(), 'expenses.db'))
+    # Mesmo texto em todos: o rank empata e a ordem é decidida pelo id
+    ids = db.save_analyses([result(f"nota{number}.pdf", 'Mercado Central') for number in range(7)])
+
+    seen = []
+    offset, limit = 0, 3
+    while True:
+        # Como em /api/search: um resultado a mais indica que há próxima página
+        page = db.search_analyses('mercado central', limit=limit + 1, offset=offset)
+        has_more = len(page) > limit
+        seen.extend(row['id'] for row in page[:limit])
+        if not has_more:
+            break
+        offset += limit
+    assert seen == sorted(ids, reverse=True)
+    assert len(page) == 1
+    db.close()
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
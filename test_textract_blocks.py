@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Testes da montagem de formulários e tabelas a partir de blocos do Textract
+"""
+
+import os
+import sys
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.textract_blocks import TextractBlockGraph, render_structured_data
+
+def word(block_id, text):
+    return {'Id': block_id, 'BlockType': 'WORD', 'Text': text}
+
+def children(*ids):
+    return [{'Type': 'CHILD', 'Ids': list(ids)}]
+
+def key(block_id, word_ids, value_id):
+    return {
+        'Id': block_id, 'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['KEY'],
+        'Relationships': children(*word_ids) + [{'Type': 'VALUE', 'Ids': [value_id]}]
+    }
+
+def value(block_id, *child_ids):
+    block = {'Id': block_id, 'BlockType': 'KEY_VALUE_SET', 'EntityTypes': ['VALUE']}
+    if child_ids:
+        block['Relationships'] = children(*child_ids)
+    return block
+
+def cell(block_id, row, column, *child_ids):
+    block = {'Id': block_id, 'BlockType': 'CELL', 'RowIndex': row, 'ColumnIndex': column}
+    if child_ids:
+        block['Relationships'] = children(*child_ids)
+    return block
+
+# Formulário: valor com duas palavras, valor sem filhos, caixas marcada e desmarcada.
+# A ordem dos blocos não importa: valores aparecem antes e depois das chaves.
+FORM_BLOCKS = [
+    value('v1', 'w3', 'w4'),
+    key('k1', ['w1', 'w2'], 'v1'),
+    word('w1', 'Valor'), word('w2', 'total'), word('w3', 'R$'), word('w4', '42,90'),
+    key('k2', ['w5'], 'v2'),
+    word('w5', 'Observações'),
+    value('v2'),  # Campo em branco: VALUE sem Relationships
+    key('k3', ['w6'], 'v3'),
+    word('w6', 'Pago'),
+    value('v3', 's1'),
+    {'Id': 's1', 'BlockType': 'SELECTION_ELEMENT', 'SelectionStatus': 'SELECTED'},
+    key('k4', ['w7'], 'v4'),
+    word('w7', 'Parcelado'),
+    value('v4', 's2'),
+    {'Id': 's2', 'BlockType': 'SELECTION_ELEMENT', 'SelectionStatus': 'NOT_SELECTED'},
+    key('k5', ['w8'], 'ausente'),  # VALUE que não veio na resposta
+    word('w8', 'Troco'),
+]
+
+# Tabela 3x3: cabeçalho com a célula "Valor" mesclada em duas colunas
+# (MERGED_CELL mais as duas CELLs que ela cobre), célula (2, 2) vazia e
+# célula (3, 3) ausente da resposta
+TABLE_BLOCKS = [
+    {
+        'Id': 't1', 'BlockType': 'TABLE',
+        'Relationships': children('c11', 'c12', 'c13', 'c21', 'c22', 'c23', 'c31', 'c32') + [
+            {'Type': 'MERGED_CELL', 'Ids': ['m1']}
+        ]
+    },
+    {'Id': 'm1', 'BlockType': 'MERGED_CELL', 'RowIndex': 1, 'ColumnIndex': 2,
+     'RowSpan': 1, 'ColumnSpan': 2, 'Relationships': children('c12', 'c13')},
+    cell('c11', 1, 1, 't1w1'), cell('c12', 1, 2, 't1w2'), cell('c13', 1, 3),
+    cell('c21', 2, 1, 't2w1'), cell('c22', 2, 2), cell('c23', 2, 3, 't2w3'),
+    cell('c31', 3, 1, 't3w1'), cell('c32', 3, 2, 't3w2'),
+    word('t1w1', 'Item'), word('t1w2', 'Valor'),
+    word('t2w1', 'Arroz'), word('t2w3', '24,90'),
+    word('t3w1', 'Feijão'), word('t3w2', '18,00'),
+]
+
+def test_key_values_skip_blank_and_missing_values():
+    key_values = TextractBlockGraph(FORM_BLOCKS).key_values()
+    assert key_values == {
+        'Valor total': 'R$ 42,90',
+        # Caixa marcada vira 'X'; a desmarcada deixa o valor vazio e o par é descartado
+        'Pago': 'X'
+    }
+
+def test_tables_pad_missing_cells_and_ignore_merged_cell_blocks():
+    tables = TextractBlockGraph(TABLE_BLOCKS).tables()
+    assert tables == [[
+        ['Item', 'Valor', ''],
+        ['Arroz', '', '24,90'],
+        ['Feijão', '18,00', ''],
+    ]]
+
+def test_table_without_cells_is_dropped():
+    blocks = [{'Id': 't1', 'BlockType': 'TABLE', 'Relationships': children('nada')}]
+    assert TextractBlockGraph(blocks).tables() == []
+
+def test_render_structured_data():
+    graph = TextractBlockGraph(FORM_BLOCKS + TABLE_BLOCKS)
+    text = render_structured_data({'key_values': graph.key_values(), 'tables': graph.tables()})
+    assert text == (
+        "CAMPOS:\nValor total: R$ 42,90\nPago: X\n\n"
+        "TABELA 1:\nItem | Valor | \nArroz |  | 24,90\nFeijão | 18,00 | "
+    )
+    assert render_structured_data({'key_values': {}, 'tables': []}) == ''
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
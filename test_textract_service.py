@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Testes da extração de texto de PDFs com várias páginas
+"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PyPDF2 import PdfWriter
+from services.cache_service import CacheService
+from services.textract_service import PageExtractionError, TextractService
+
+def make_pdf(pages):
+    """PDF com páginas em branco de larguras diferentes, para distinguir as páginas pelo tamanho"""
+    writer = PdfWriter()
+    for number in range(pages):
+        writer.add_blank_page(width=100 + number, height=100)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+class FakeTextract:
+    """Cliente que falha nas chamadas indicadas em `fail_calls` (contadas a partir de 1)"""
+
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def detect_document_text(self, Document):
+        # As páginas são enviadas em paralelo pelo pool do serviço
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call in self.fail_calls:
+            raise RuntimeError('InternalServerError')
+        return {'Blocks': [{'BlockType': 'LINE', 'Text': f"página com {len(Document['Bytes'])} bytes"}]}
+
+def make_service(client):
+    cache = CacheService(os.path.join(tempfile.mkdtemp(), 'cache.db'))
+    service = TextractService(client, cache_service=cache)
+    service.page_retries = 0
+    return service
+
+def test_single_page_pdf_is_sent_whole():
+    pdf = make_pdf(1)
+    client = FakeTextract()
+    text = make_service(client).extract_text(pdf)
+    assert text == f"página com {len(pdf)} bytes\n"
+    assert client.calls == 1
+
+def test_partially_failed_pdf_fails_and_retry_reuses_cached_pages():
+    pdf = make_pdf(3)
+    client = FakeTextract(fail_calls={2})
+    service = make_service(client)
+
+    # A falha chega ao chamador em vez de virar texto vazio analisado como documento
+    try:
+        service.extract_text(pdf)
+    except PageExtractionError as e:
+        # As páginas vão em paralelo: qualquer uma pode ser a segunda chamada
+        assert str(e).endswith('de 3')
+    else:
+        raise AssertionError('falha de página não foi propagada')
+    assert client.calls == 3
+
+    # Na nova tentativa só a página que falhou vai ao Textract
+    text = service.extract_text(pdf)
+    assert client.calls == 4
+    assert len(text.splitlines()) == 3
+
+def test_failed_page_is_retried_before_failing_the_file():
+    client = FakeTextract(fail_calls={1})
+    service = make_service(client)
+    service.page_retries = 1
+    service.page_retry_delay = 0
+
+    text = service.extract_text(make_pdf(2))
+    assert len(text.splitlines()) == 2
+    assert client.calls == 3
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Testes dos buffers de upload e da gravação em disco ao enfileirar jobs
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+# Adicionar o diretório raiz ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.database_service import DatabaseService
+from services.job_service import JobService
+from services.upload_buffer import UploadBuffer
+
+class UnseekableStream(io.RawIOBase):
+    """Stream sem tell/seek, como o corpo de uma requisição em streaming"""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seekable(self):
+        return False
+
+    def tell(self):
+        raise OSError('stream não posicionável')
+
+class FakeProcessor:
+    def process_multiple_files(self, files, on_result=None):
+        results = []
+        for index, (upload, filename) in enumerate(files):
+            result = {'filename': filename, 'success': False, 'error': f"{len(upload.data())} bytes"}
+            if on_result:
+                on_result(index, result)
+            results.append(result)
+        return results
+
+    def calculate_statistics(self, results):
+        return {'total_arquivos': len(results), 'arquivos_processados': 0, 'total_gasto': 0, 'categorias': {}}
+
+def test_small_upload_stays_in_memory_and_large_goes_to_disk():
+    spool_dir = tempfile.mkdtemp()
+    small = UploadBuffer.from_stream(io.BytesIO(b'a' * 10), 'a.png', spool_dir, max_memory_bytes=100)
+    large = UploadBuffer.from_stream(io.BytesIO(b'b' * 200), 'b.png', spool_dir, max_memory_bytes=100)
+    streamed = UploadBuffer.from_stream(UnseekableStream(b'c' * 200), 'c.png', spool_dir, max_memory_bytes=100)
+
+    assert small.in_memory and bytes(small.data()) == b'a' * 10
+    assert not large.in_memory and bytes(large.data()) == b'b' * 200
+    assert not streamed.in_memory and bytes(streamed.data()) == b'c' * 200
+
+    for upload in (small, large, streamed):
+        upload.close()
+    assert os.listdir(spool_dir) == []
+
+def test_empty_upload_on_disk_reads_as_empty():
+    spool_dir = tempfile.mkdtemp()
+    upload = UploadBuffer.from_stream(io.BytesIO(b''), 'vazio.pdf', spool_dir, max_memory_bytes=100)
+    upload.spool(spool_dir)
+    # mmap de um arquivo vazio lança ValueError; o buffer devolve vazio sem abrir o arquivo
+    assert bytes(upload.data()) == b''
+    assert upload._file is None
+    upload.close()
+    assert os.listdir(spool_dir) == []
+
+def run_job(spool_uploads):
+    spool_dir = tempfile.mkdtemp()
+    database = DatabaseService(os.path.join(tempfile.mkdtemp(), 'expenses.db'))
+    jobs = JobService(FakeProcessor(), database, max_workers=1, spool_dir=spool_dir, spool_uploads=spool_uploads)
+    uploads = [UploadBuffer.from_stream(io.BytesIO(b'x' * 10), 'a.png', spool_dir, max_memory_bytes=100)]
+
+    job_id = jobs.new_job_id()
+    jobs.submit(job_id, uploads)
+    jobs.executor.shutdown(wait=True)
+    job = database.get_job(job_id)
+    database.close()
+    return job
+
+def test_small_uploads_are_not_spooled_by_default():
+    job = run_job(spool_uploads=False)
+    assert job['files'] == [(None, 'a.png')]
+    assert job['status'] == 'completed'
+
+def test_spool_uploads_writes_every_file_when_enqueued():
+    job = run_job(spool_uploads=True)
+    [(path, filename)] = job['files']
+    assert path is not None and filename == 'a.png'
+    # O arquivo é removido quando o job termina
+    assert not os.path.exists(path)
+    assert job['status'] == 'completed'
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f"✓ {name}")